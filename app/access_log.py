@@ -0,0 +1,287 @@
+from collections import deque
+from datetime import datetime
+from decimal import Decimal
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from boto3.dynamodb.types import TypeSerializer
+from fastapi import HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+import pytz
+from .background import BackgroundWorker
+from . import const
+from . import aws
+from . import utils
+
+SECRET = '*****'
+SERIALIZER = TypeSerializer()
+REDACTED_FIELDS = frozenset(const.ACCESS_LOG['redacted_fields'])
+REDACTED_FIELD_VALUES = re.compile(
+    rb'("(?:' + rb'|'.join(re.escape(field.encode()) for field in REDACTED_FIELDS) + rb')"\s*:\s*)"(?:[^"\\]|\\.)*"'
+)
+ACCESS_TOKEN_VALUE = re.compile(rb'"access_token"\s*:\s*"((?:[^"\\]|\\.)*)"')
+REQUEST_HEADERS = frozenset(name.encode() for name in const.ACCESS_LOG['request_headers'])
+RESPONSE_HEADERS = frozenset(name.encode() for name in const.ACCESS_LOG['response_headers'])
+
+
+class AccessLogShipper(BackgroundWorker):
+    def __init__(
+        self,
+        table_name: str,
+        max_queue_size: int = 10000,
+        batch_size: int = 25,
+        flush_interval: float = 1.0,
+        overflow_policy: const.OverflowPolicy = const.OverflowPolicy.DROP_OLDEST,
+        block_timeout: float = 0.05,
+        max_attempts: int = 3
+    ):
+        super().__init__('access-log-shipper', flush_interval)
+        self.table_name = table_name
+        self.max_queue_size = max_queue_size
+        self.batch_size = min(batch_size, 25)
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self.max_attempts = max_attempts
+        self.dropped = 0
+        self.skipped = 0
+        self.flushed = 0
+        self.failed = 0
+        self._queue = deque()
+        self._not_full = threading.Condition(threading.Lock())
+
+    def put(self, entry: dict, block: bool = True) -> bool:
+        with self._not_full:
+            if len(self._queue) >= self.max_queue_size:
+                if self.overflow_policy == const.OverflowPolicy.BLOCK and not block:
+                    self.dropped += 1
+                    return False
+                elif self.overflow_policy == const.OverflowPolicy.BLOCK:
+                    has_room = self._not_full.wait_for(
+                        lambda: len(self._queue) < self.max_queue_size,
+                        timeout=self.block_timeout
+                    )
+                    if not has_room:
+                        self.dropped += 1
+                        return False
+                else:
+                    self._queue.popleft()
+                    self.dropped += 1
+            self._queue.append(entry)
+            queue_size = len(self._queue)
+        if queue_size >= self.batch_size:
+            self.wake()
+        return True
+
+    def put_nowait(self, entry: dict) -> bool:
+        # For the event loop: a BLOCK policy drops the new entry instead of
+        # waiting for room, which would stall every in-flight request.
+        return self.put(entry, block=False)
+
+    def skip(self):
+        # Sampled out before the record was built.
+        self.skipped += 1
+
+    def stats(self) -> dict:
+        return {
+            'queued': len(self._queue),
+            'dropped': self.dropped,
+            'skipped': self.skipped,
+            'flushed': self.flushed,
+            'failed': self.failed,
+        }
+
+    def run_once(self):
+        while True:
+            batch = self._take(self.batch_size)
+            if not batch:
+                return
+            self._write(self._build(batch))
+
+    def _take(self, size: int) -> list:
+        with self._not_full:
+            batch = []
+            while self._queue and len(batch) < size:
+                batch.append(self._queue.popleft())
+            if batch:
+                self._not_full.notify_all()
+            return batch
+
+    def _build(self, batch: list) -> list:
+        # Records are built here rather than on the event loop: verifying the
+        # access token, hashing and redaction are all CPU or network bound.
+        records = []
+        for entry in batch:
+            try:
+                records.append(build_record(entry))
+            except Exception as e:
+                print(f'access log: dropping record that cannot be built: {e}')
+                self.failed += 1
+        return records
+
+    def _serialize(self, batch: list) -> list:
+        # One record DynamoDB cannot represent is dropped on its own instead
+        # of failing every attempt of the whole batch.
+        items = []
+        for record in batch:
+            try:
+                items.append(SERIALIZER.serialize(record)['M'])
+            except (TypeError, ValueError) as e:
+                print(f'access log: dropping unserializable record {record.get("timestamp")}: {e}')
+                self.failed += 1
+        return items
+
+    def _write(self, batch: list):
+        dynamodb = aws.client('dynamodb')
+        put_requests = [{'PutRequest': {'Item': item}} for item in self._serialize(batch)]
+        if not put_requests:
+            return
+        for attempt in range(self.max_attempts):
+            try:
+                response = dynamodb.batch_write_item(RequestItems={self.table_name: put_requests})
+            except Exception as e:
+                print(e)
+            else:
+                unprocessed = response.get('UnprocessedItems', {}).get(self.table_name, [])
+                self.flushed += len(put_requests) - len(unprocessed)
+                put_requests = unprocessed
+                if not put_requests:
+                    return
+            time.sleep(0.1 * (2 ** attempt))
+        self.failed += len(put_requests)
+
+
+shipper = AccessLogShipper(
+    table_name=const.ACCESS_LOG['table_name'],
+    max_queue_size=const.ACCESS_LOG['max_queue_size'],
+    batch_size=const.ACCESS_LOG['batch_size'],
+    flush_interval=const.ACCESS_LOG['flush_interval'],
+    overflow_policy=const.ACCESS_LOG['overflow_policy'],
+    block_timeout=const.ACCESS_LOG['block_timeout']
+)
+
+
+def get_sample_rate(route: str, status: int, duration: float) -> float:
+    if status >= const.ACCESS_LOG['always_log_status'] or duration >= const.ACCESS_LOG['always_log_seconds']:
+        return 1.0
+    return const.ACCESS_LOG['route_sample_rates'].get(route, const.ACCESS_LOG['sample_rate'])
+
+
+def filter_headers(raw: list, allowed: frozenset) -> dict:
+    return {k.decode('utf-8'): v.decode('utf-8', 'replace') for (k, v) in raw if k in allowed}
+
+
+def truncate_body(record: dict, field: str, body: bytes) -> str:
+    # Only a prefix is decoded; the hash still tells identical large bodies apart.
+    max_body_bytes = const.ACCESS_LOG['max_body_bytes']
+    if len(body) <= max_body_bytes:
+        return body.decode('utf-8', 'replace')
+    record[f'{field}_bytes'] = len(body)
+    record[f'{field}_sha256'] = hashlib.sha256(body).hexdigest()
+    return body[:max_body_bytes].decode('utf-8', 'ignore')
+
+
+def hash_username(access_token) -> str:
+    try:
+        username = utils.get_username(access_token)
+    except Exception as e:
+        print(e)
+        return None
+    return hashlib.sha256(username.encode()).hexdigest()
+
+
+def add_request_body(record: dict, body: bytes):
+    record['request_body'] = {}
+    if not body:
+        return
+    if len(body) <= const.ACCESS_LOG['max_body_bytes']:
+        try:
+            # DynamoDB has no float type; numbers go in as Decimal.
+            parsed = json.loads(body, parse_float=Decimal, parse_constant=str)
+        except ValueError:
+            parsed = None
+        if isinstance(parsed, dict):
+            for key, value in parsed.items():
+                record['request_body'][key] = SECRET if key in REDACTED_FIELDS else value
+            access_token = parsed.get('access_token')
+            if access_token is not None:
+                record['username'] = hash_username(access_token) or record['username']
+            return
+    # Large or non-object bodies are redacted on the raw bytes, so the token is
+    # found without parsing the whole document and never reaches the prefix.
+    match = ACCESS_TOKEN_VALUE.search(body)
+    if match is not None:
+        record['username'] = hash_username(match.group(1).decode('utf-8', 'replace')) or record['username']
+    redacted = REDACTED_FIELD_VALUES.sub(rb'\1"' + SECRET.encode() + rb'"', body)
+    record['request_body_text'] = truncate_body(record, 'request_body', redacted)
+
+
+def build_record(entry: dict) -> dict:
+    record = {}
+    time_local = datetime.fromtimestamp(entry['started_at'])
+    time_local = pytz.timezone('Asia/Tokyo').localize(time_local)
+    record['created_at'] = time_local.strftime('%Y-%m-%d %H:%M:%S%Z')
+    record['timestamp'] = f'{datetime.timestamp(time_local)}-{uuid.uuid4()}'
+    record['username'] = 'cannot_identify'
+    add_request_body(record, entry['request_body'])
+    record['request_headers'] = filter_headers(entry['request_headers'], REQUEST_HEADERS)
+    record['remote_addr'] = entry['remote_addr']
+    record['request_uri'] = entry['request_uri']
+    record['request_method'] = entry['request_method']
+    record['request_time'] = str(round(entry['duration'], 4))
+    record['db_queries'] = entry['db_queries']
+    record['db_time'] = str(round(entry['db_time'], 4))
+    record['status'] = entry['status']
+    # Lets analysis weight sampled records back up to request counts.
+    record['sample_rate'] = str(entry['sample_rate'])
+    error = entry['error']
+    if entry['response_body'] is not None:
+        record['response_body'] = truncate_body(record, 'response_body', entry['response_body'])
+        record['response_headers'] = filter_headers(entry['response_headers'], RESPONSE_HEADERS)
+    elif isinstance(error, (HTTPException, RequestValidationError)):
+        # What the exception handlers send back.
+        detail = error.detail if isinstance(error, HTTPException) else error.errors()
+        record['response_body'] = json.dumps({'detail': detail}, ensure_ascii=False, default=str)
+        record['response_headers'] = {}
+    else:
+        record['response_body'] = ''
+        record['response_headers'] = {}
+        record['error'] = f'{type(error).__name__}: {error}'[:const.ACCESS_LOG['max_body_bytes']]
+    return record
+
+
+async def record_access(
+    request: Request,
+    route: str,
+    status: int,
+    started_at: float,
+    duration: float,
+    queries,
+    response: Response = None,
+    error: Exception = None
+):
+    sample_rate = get_sample_rate(route, status, duration)
+    if sample_rate < 1.0 and random.random() >= sample_rate:
+        shipper.skip()
+        return
+    # Only the raw parts are taken on the event loop; the shipper thread builds
+    # the record. Header lists are copied because compression edits them next.
+    shipper.put_nowait({
+        'started_at': started_at,
+        'duration': duration,
+        'status': status,
+        'sample_rate': sample_rate,
+        'request_body': await request.body(),
+        'request_headers': list(request.headers.raw),
+        'remote_addr': request.client.host,
+        'request_uri': request.url.path,
+        'request_method': request.method,
+        'db_queries': queries.count,
+        'db_time': queries.seconds,
+        'response_body': response.body if response is not None else None,
+        'response_headers': list(response.headers.raw) if response is not None else None,
+        'error': error,
+    })
@@ -0,0 +1,194 @@
+from collections import OrderedDict
+import hashlib
+import hmac
+import threading
+import time
+from typing import Union
+from botocore.exceptions import BotoCoreError, ClientError
+from fastapi import Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
+import jwt
+import requests
+from . import const
+from . import aws
+
+
+class AuthError(HTTPException):
+    def __init__(self, detail: str = '認証に失敗しました\n再度ログインしてください'):
+        super().__init__(status_code=401, detail=detail)
+
+
+class AuthUnavailableError(HTTPException):
+    def __init__(self, detail: str = '認証サーバーに接続できません\nしばらくしてから再度お試しください'):
+        super().__init__(status_code=503, detail=detail)
+
+
+class JWKSCache:
+    def __init__(self, url: str, ttl: float, min_refresh_interval: float):
+        self.url = url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self._keys = {}
+        self._fetched_at = 0.0
+        self._failed_at = 0.0
+        self._lock = threading.Lock()
+
+    def get_key(self, kid: str):
+        now = time.time()
+        key = self._keys.get(kid)
+        if key is not None and now - self._fetched_at < self.ttl:
+            return key
+        with self._lock:
+            key = self._keys.get(kid)
+            now = time.time()
+            expired = now - self._fetched_at >= self.ttl
+            # Unknown kid usually means the pool rotated its keys, but throttle
+            # refetches so forged kids can't turn every request into a download.
+            # Failed fetches are throttled the same way.
+            due = now - max(self._fetched_at, self._failed_at) >= self.min_refresh_interval
+            if (expired or key is None) and due:
+                self._refresh()
+                key = self._keys.get(kid)
+        if key is None:
+            if self._failed_at > self._fetched_at:
+                # The kid may be a rotated key we could not fetch; don't tell
+                # the client its token is bad.
+                raise AuthUnavailableError()
+            raise AuthError()
+        return key
+
+    def _refresh(self):
+        try:
+            response = requests.get(self.url, timeout=5)
+            response.raise_for_status()
+            keys = {
+                jwk['kid']: jwt.PyJWK(jwk).key for jwk in response.json()['keys']
+            }
+        except (requests.RequestException, ValueError, KeyError, TypeError, jwt.PyJWTError) as e:
+            # Keep serving the previous key set until a fetch succeeds.
+            print(f'jwks refresh failed: {e}')
+            self._failed_at = time.time()
+            return
+        self._keys = keys
+        self._fetched_at = time.time()
+
+
+class UsernameCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token_hash: str):
+        with self._lock:
+            entry = self._entries.get(token_hash)
+            if entry is None:
+                return None
+            username, expire_at = entry
+            if expire_at <= time.time():
+                del self._entries[token_hash]
+                return None
+            self._entries.move_to_end(token_hash)
+            return username
+
+    def set(self, token_hash: str, username: str, expire_at: float):
+        with self._lock:
+            self._entries[token_hash] = (username, expire_at)
+            self._entries.move_to_end(token_hash)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, token_hash: str):
+        with self._lock:
+            self._entries.pop(token_hash, None)
+
+
+USER_POOL_ID = const.COGNITO_INFO['user_pool_id']
+REGION = const.COGNITO_INFO.get('region', USER_POOL_ID.split('_')[0])
+ISSUER = f'https://cognito-idp.{REGION}.amazonaws.com/{USER_POOL_ID}'
+
+jwks = JWKSCache(
+    f'{ISSUER}/.well-known/jwks.json',
+    ttl=const.AUTH['jwks_ttl'],
+    min_refresh_interval=const.AUTH['jwks_min_refresh_interval']
+)
+usernames = UsernameCache(const.AUTH['username_cache_size'])
+
+
+def hash_token(access_token: str) -> str:
+    return hashlib.sha256(access_token.encode()).hexdigest()
+
+
+def verify_access_token(access_token: str) -> dict:
+    try:
+        header = jwt.get_unverified_header(access_token)
+        key = jwks.get_key(header.get('kid'))
+        claims = jwt.decode(
+            access_token,
+            key,
+            algorithms=['RS256'],
+            issuer=ISSUER,
+            options={'require': ['exp', 'iss', 'username'], 'verify_aud': False}
+        )
+    except jwt.PyJWTError:
+        raise AuthError()
+    if claims.get('token_use') != 'access':
+        raise AuthError()
+    client_id = const.COGNITO_INFO.get('client_id')
+    if client_id and claims.get('client_id') != client_id:
+        raise AuthError()
+    return claims
+
+
+def get_remote_username(access_token: str) -> str:
+    client = aws.client('cognito-idp')
+    try:
+        user = client.get_user(AccessToken=access_token)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NotAuthorizedException', 'UserNotFoundException'):
+            raise AuthError()
+        raise AuthUnavailableError()
+    except BotoCoreError:
+        raise AuthUnavailableError()
+    return user['Username']
+
+
+def get_username(access_token: str, strict: bool = False) -> str:
+    token_hash = hash_token(access_token)
+    if strict:
+        # Remote check also catches tokens revoked by global sign-out,
+        # which local verification cannot see before they expire.
+        claims = verify_access_token(access_token)
+        username = get_remote_username(access_token)
+        usernames.set(token_hash, username, claims['exp'])
+        return username
+    username = usernames.get(token_hash)
+    if username is not None:
+        return username
+    claims = verify_access_token(access_token)
+    username = claims['username']
+    usernames.set(token_hash, username, claims['exp'])
+    return username
+
+
+async def get_username_async(access_token: str, strict: bool = False) -> str:
+    # Verification may fetch the JWKS or call Cognito, so async handlers run it
+    # in the threadpool; cached tokens skip the hop.
+    if not strict:
+        username = usernames.get(hash_token(access_token))
+        if username is not None:
+            return username
+    return await run_in_threadpool(get_username, access_token, strict)
+
+
+def forget(access_token: str):
+    usernames.discard(hash_token(access_token))
+
+
+def require_ops_token(authorization: Union[str, None] = Header(default=None)):
+    ops_token = const.AUTH['ops_token']
+    if not ops_token:
+        raise HTTPException(status_code=404, detail='Not Found')
+    scheme, _, credentials = (authorization or '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(credentials.encode(), ops_token.encode()):
+        raise HTTPException(status_code=404, detail='Not Found')
@@ -0,0 +1,122 @@
+import threading
+import time
+import boto3
+from botocore.config import Config
+from . import const
+from . import metrics
+
+
+class ClientRegistry:
+    def __init__(self, config: Config):
+        self.config = config
+        self._session = boto3.session.Session()
+        self._clients = {}
+        self._resources = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def client(self, service_name: str):
+        client = self._clients.get(service_name)
+        if client is not None:
+            return client
+        with self._lock:
+            # Session objects are not thread-safe, so clients are only built under the lock.
+            client = self._clients.get(service_name)
+            if client is None:
+                client = self._session.client(service_name, config=self.config)
+                self._instrument(client, service_name)
+                self._clients[service_name] = client
+            return client
+
+    def resource(self, service_name: str):
+        resource = self._resources.get(service_name)
+        if resource is not None:
+            return resource
+        with self._lock:
+            resource = self._resources.get(service_name)
+            if resource is None:
+                resource = self._session.resource(service_name, config=self.config)
+                self._instrument(resource.meta.client, service_name)
+                self._resources[service_name] = resource
+            return resource
+
+    def override(self, service_name: str, client=None, resource=None):
+        # Lets the benchmark suite put local stand-ins in front of real AWS.
+        with self._lock:
+            if client is not None:
+                self._clients[service_name] = client
+            if resource is not None:
+                self._resources[service_name] = resource
+
+    def warm_up(self, service_names):
+        for service_name in service_names:
+            self.client(service_name)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                service_name: {
+                    'calls': stats['calls'],
+                    'errors': stats['errors'],
+                    'average_seconds': stats['total_seconds'] / stats['calls'] if stats['calls'] else 0.0,
+                    'max_seconds': stats['max_seconds'],
+                }
+                for service_name, stats in self._stats.items()
+            }
+
+    def _instrument(self, client, service_name: str):
+        self._stats.setdefault(service_name, {
+            'calls': 0,
+            'errors': 0,
+            'total_seconds': 0.0,
+            'max_seconds': 0.0,
+        })
+
+        def before_call(context, model, **kwargs):
+            context['registry_started_at'] = time.perf_counter()
+            context['registry_operation'] = model.name
+
+        def after_call(context, http_response, **kwargs):
+            self._record(service_name, context, error=http_response.status_code >= 300)
+
+        def after_call_error(context, **kwargs):
+            self._record(service_name, context, error=True)
+
+        events = client.meta.events
+        events.register('before-call', before_call)
+        events.register('after-call', after_call)
+        events.register('after-call-error', after_call_error)
+
+    def _record(self, service_name: str, context: dict, error: bool):
+        started_at = context.pop('registry_started_at', None)
+        if started_at is None:
+            return
+        elapsed = time.perf_counter() - started_at
+        operation = context.pop('registry_operation', '')
+        metrics.aws_call_duration.observe(elapsed, service_name, operation, 'error' if error else 'ok')
+        with self._lock:
+            stats = self._stats[service_name]
+            stats['calls'] += 1
+            stats['total_seconds'] += elapsed
+            stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+            if error:
+                stats['errors'] += 1
+
+
+registry = ClientRegistry(Config(
+    max_pool_connections=const.AWS['max_pool_connections'],
+    connect_timeout=const.AWS['connect_timeout'],
+    read_timeout=const.AWS['read_timeout'],
+    retries={
+        'mode': const.AWS['retry_mode'],
+        'max_attempts': const.AWS['max_attempts'],
+    }
+))
+
+
+def client(service_name: str):
+    return registry.client(service_name)
+
+
+def resource(service_name: str):
+    return registry.resource(service_name)
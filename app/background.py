@@ -0,0 +1,43 @@
+import threading
+
+
+class BackgroundWorker:
+    def __init__(self, name: str, interval: float):
+        self.name = name
+        self.interval = interval
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def wake(self):
+        self._wakeup.set()
+
+    def run_once(self):
+        raise NotImplementedError
+
+    def _safe_run_once(self):
+        try:
+            self.run_once()
+        except Exception as e:
+            print(f'{self.name}: {e}')
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self._safe_run_once()
+        self._safe_run_once()
@@ -0,0 +1,142 @@
+from collections import OrderedDict
+import threading
+import time
+from . import const
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float, invalidation_grace: float = 0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.invalidation_grace = invalidation_grace
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._keys_by_tag = {}
+        self._invalidated_at = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, not_before: float = None):
+        # not_before is a consistency token: invalidations only reach this
+        # process, so an entry read before a write another worker committed
+        # is skipped for requests that have seen that write.
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic() \
+                    or (not_before is not None and entry[3] < not_before):
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, tags=(), ttl: float = None, read_at: float = None):
+        if ttl is None:
+            ttl = self.ttl
+        if read_at is None:
+            read_at = time.time()
+        with self._lock:
+            now = time.monotonic()
+            for tag in tags:
+                # A read that started before the invalidating write (or that hit a
+                # lagging replica) must not put the old value straight back.
+                if now - self._invalidated_at.get(tag, -self.invalidation_grace) < self.invalidation_grace:
+                    return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, now + ttl, tuple(tags), read_at)
+            for tag in tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        with self._lock:
+            now = time.monotonic()
+            for tag in tags:
+                for key in list(self._keys_by_tag.get(tag, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+                self._invalidated_at[tag] = now
+            expired_tags = [
+                tag for tag, invalidated_at in self._invalidated_at.items()
+                if now - invalidated_at >= self.invalidation_grace
+            ]
+            for tag in expired_tags:
+                del self._invalidated_at[tag]
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._keys_by_tag.clear()
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+    def _remove(self, key):
+        _, _, tags, _ = self._entries.pop(key)
+        for tag in tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+
+response_cache = TTLCache(
+    maxsize=const.RESPONSE_CACHE['maxsize'],
+    ttl=const.RESPONSE_CACHE['ttl'],
+    invalidation_grace=const.RESPONSE_CACHE['invalidation_grace']
+)
+
+liked_cache = TTLCache(
+    maxsize=const.LIKED_CACHE['maxsize'],
+    ttl=const.LIKED_CACHE['ttl'],
+    invalidation_grace=const.LIKED_CACHE['invalidation_grace']
+)
+
+profile_cache = TTLCache(
+    maxsize=const.PROFILE_CACHE['maxsize'],
+    ttl=const.PROFILE_CACHE['ttl']
+)
+
+REPORT_REASONS_TAG = 'report_reasons'
+
+
+def make_key(endpoint: str, *parameters) -> tuple:
+    return (endpoint, *parameters)
+
+
+def theme_tag(theme_id: int) -> str:
+    return f'theme:{theme_id}'
+
+
+def thesis_tag(thesis_id: int) -> str:
+    return f'thesis:{thesis_id}'
+
+
+def comments_tag(thesis_id: int) -> str:
+    return f'comments:{thesis_id}'
+
+
+def liked_tag(username: str) -> str:
+    return f'liked:{username}'
+
+
+def profile_tag(username: str) -> str:
+    return f'profile:{username}'
+
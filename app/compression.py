@@ -0,0 +1,100 @@
+import gzip
+from time import perf_counter
+from typing import Optional
+import brotli
+from fastapi import Request, Response
+from . import const
+from . import etag
+from . import metrics
+
+
+class Payload:
+    # A cached body plus the encodings already built from it, so hot cache
+    # entries are compressed once rather than on every hit.
+    def __init__(self, body: bytes, etag: str = None):
+        self.body = body
+        self.etag = etag
+        self._encoded = {}
+
+    def encoded(self, encoding: str, level: int) -> bytes:
+        key = (encoding, level)
+        body = self._encoded.get(key)
+        if body is not None:
+            metrics.compressed_responses.inc(encoding, 'cache')
+            return body
+        # Two concurrent misses both compress; the results are identical.
+        body = self._encoded[key] = compress(self.body, encoding, level)
+        return body
+
+
+class PayloadResponse(Response):
+    media_type = 'application/json'
+
+    def __init__(self, payload: Payload, **kwargs):
+        super().__init__(content=payload.body, **kwargs)
+        self.payload = payload
+        if payload.etag is not None:
+            self.headers['etag'] = payload.etag
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    qualities = {}
+    for part in accept_encoding.split(','):
+        coding, _, parameters = part.strip().partition(';')
+        quality = 1.0
+        parameter = parameters.strip()
+        if parameter.startswith('q='):
+            try:
+                quality = float(parameter[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            qualities[coding.strip().lower()] = quality
+    wildcard = qualities.get('*', 0.0)
+    best = None
+    best_quality = 0.0
+    for encoding in const.COMPRESSION['levels']:
+        quality = qualities.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str, level: int) -> bytes:
+    started_at = perf_counter()
+    if encoding == 'br':
+        compressed = brotli.compress(body, quality=level)
+    else:
+        # A fixed mtime keeps the output stable for identical bodies.
+        compressed = gzip.compress(body, compresslevel=level, mtime=0)
+    metrics.compression_duration.observe(perf_counter() - started_at, encoding)
+    metrics.compressed_responses.inc(encoding, 'fresh')
+    metrics.compression_bytes.inc(encoding, 'in', amount=len(body))
+    metrics.compression_bytes.inc(encoding, 'out', amount=len(compressed))
+    return compressed
+
+
+def compress_response(request: Request, response: Response, route: str) -> Response:
+    if 'content-encoding' in response.headers:
+        return response
+    media_type = response.headers.get('content-type', '').split(';')[0].strip()
+    if media_type not in const.COMPRESSION['media_types']:
+        return response
+    response.headers.add_vary_header('Accept-Encoding')
+    if len(response.body) < const.COMPRESSION['minimum_size']:
+        return response
+    encoding = negotiate(request.headers.get('accept-encoding', ''))
+    if encoding is None:
+        return response
+    level = const.COMPRESSION['route_levels'].get(route, {}).get(encoding, const.COMPRESSION['levels'][encoding])
+    payload = getattr(response, 'payload', None)
+    if payload is not None:
+        body = payload.encoded(encoding, level)
+    else:
+        body = compress(response.body, encoding, level)
+    response.body = body
+    response.headers['content-encoding'] = encoding
+    if 'etag' in response.headers:
+        response.headers['etag'] = etag.encoded(response.headers['etag'], encoding)
+    response.headers['content-length'] = str(len(body))
+    return response
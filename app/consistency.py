@@ -0,0 +1,53 @@
+from contextvars import ContextVar
+import time
+from fastapi import Request
+from sqlalchemy import event
+from .sql.database import SessionLocal
+from . import const
+
+
+class RequestCommits:
+    def __init__(self):
+        self.last_at = None
+
+
+current = ContextVar('request_commits', default=None)
+
+
+def begin() -> RequestCommits:
+    # Sync handlers commit in worker threads with a copy of this context, so
+    # the object is mutated in place rather than replaced.
+    commits = RequestCommits()
+    current.set(commits)
+    return commits
+
+
+@event.listens_for(SessionLocal, 'after_commit')
+def record_commit(session):
+    commits = current.get()
+    if commits is not None:
+        commits.last_at = time.time()
+
+
+def encode_token(committed_at: float) -> str:
+    return f'{committed_at:.3f}'
+
+
+def decode_token(token: str):
+    try:
+        committed_at = float(token)
+    except ValueError:
+        return None
+    if committed_at != committed_at:
+        return None
+    # A token from the future would pin every read to the master until then.
+    # The margin covers the clock skew between the host that stamped the token
+    # and this one.
+    return min(committed_at, time.time()) + const.DB_REPLICAS['clock_skew_margin']
+
+
+def get_not_before(request: Request):
+    token = request.headers.get(const.CONSISTENCY_TOKEN_HEADER)
+    if not token:
+        return None
+    return decode_token(token)
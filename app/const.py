@@ -10,6 +10,7 @@ STR_DEFAULT_MAX_LENGTH = 50000
 THEME = {
     'title_max_length': 100,
     'description_max_length': STR_DEFAULT_MAX_LENGTH,
+    'summary_top_theses_max': 10,
 }
 
 THESIS = {
@@ -19,11 +20,174 @@ THESIS = {
 
 REPORT_DETAIL_MAX_LENGTH = 10000
 
+FAVORITE = {
+    'read_batch_max_size': 100,
+}
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+CONSISTENCY_TOKEN_HEADER = 'X-Consistency-Token'
+
+RESPONSE_CACHE = {
+    'maxsize': int(os.environ.get('RESPONSE_CACHE_MAXSIZE', 2048)),
+    # Each task keeps its own cache, so other tasks may serve a response this
+    # old after a write.
+    'ttl': float(os.environ.get('RESPONSE_CACHE_TTL', 30)),
+    # Roughly the replica lag: reads finishing this soon after an invalidation
+    # are not cached.
+    'invalidation_grace': float(os.environ.get('RESPONSE_CACHE_INVALIDATION_GRACE', 2)),
+}
+
+LIKED_CACHE = {
+    'maxsize': int(os.environ.get('LIKED_CACHE_MAXSIZE', 10000)),
+    'ttl': float(os.environ.get('LIKED_CACHE_TTL', 60)),
+    'invalidation_grace': float(os.environ.get('LIKED_CACHE_INVALIDATION_GRACE', 2)),
+    # Users with more favorites than this are answered by an IN query instead.
+    'max_set_size': int(os.environ.get('LIKED_CACHE_MAX_SET_SIZE', 1000)),
+}
+
+PROFILE_CACHE = {
+    'maxsize': int(os.environ.get('PROFILE_CACHE_MAXSIZE', 10000)),
+    # Profiles are edited in Cognito directly, so nothing here can invalidate them.
+    'ttl': float(os.environ.get('PROFILE_CACHE_TTL', 5 * 60)),
+    'not_found_ttl': float(os.environ.get('PROFILE_CACHE_NOT_FOUND_TTL', 60)),
+}
+
+PROFILE = {
+    'read_batch_max_size': 100,
+    'max_concurrency': int(os.environ.get('PROFILE_MAX_CONCURRENCY', 8)),
+}
+
+SEARCH = {
+    # 'fulltext' needs the ngram FULLTEXT indexes; 'like' keeps substring scans.
+    'backend': os.environ.get('SEARCH_BACKEND', 'fulltext'),
+    'ngram_token_size': int(os.environ.get('SEARCH_NGRAM_TOKEN_SIZE', 2)),
+}
+
 COGNITO_INFO = json.loads(os.environ['COGNITO_INFO'])
 SNS_TOPIC_ARN = os.environ['SNS_TOPIC_ARN']
 
+AWS = {
+    'max_pool_connections': int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', 50)),
+    'connect_timeout': float(os.environ.get('AWS_CONNECT_TIMEOUT', 2)),
+    'read_timeout': float(os.environ.get('AWS_READ_TIMEOUT', 5)),
+    'retry_mode': os.environ.get('AWS_RETRY_MODE', 'standard'),
+    'max_attempts': int(os.environ.get('AWS_MAX_ATTEMPTS', 3)),
+    'warm_up': ('cognito-idp', 'sqs', 'sns', 'dynamodb'),
+}
+
+METRICS = {
+    'latency_buckets': (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+}
+
+COMPRESSION = {
+    'minimum_size': int(os.environ.get('COMPRESSION_MINIMUM_SIZE', 1024)),
+    'media_types': ('application/json',),
+    # Preferred first when the client accepts both equally.
+    'levels': {'br': 4, 'gzip': 6},
+    # Cached bodies are compressed once per entry, so they can afford the
+    # slowest levels; everything else keeps the cheap defaults.
+    'route_levels': {
+        '/theme/{theme_id}': {'br': 11, 'gzip': 9},
+        '/thesis/{thesis_id}': {'br': 11, 'gzip': 9},
+        '/comments/{thesis_id}/{page}': {'br': 11, 'gzip': 9},
+        '/report/reasons': {'br': 11, 'gzip': 9},
+    },
+}
+
+QUERY_LOG = {
+    'slow_query_seconds': float(os.environ.get('SLOW_QUERY_SECONDS', 0.5)),
+    # More runs of one statement per request than this are reported as N+1.
+    'n_plus_one_threshold': int(os.environ.get('N_PLUS_ONE_THRESHOLD', 10)),
+    'max_statement_length': 1000,
+    'debug_headers': os.environ.get('QUERY_LOG_DEBUG_HEADERS', '0') == '1',
+}
+DB_QUERIES_HEADER = 'X-DB-Queries'
+DB_TIME_HEADER = 'X-DB-Time'
+
+REPORT_ALERT = {
+    'window': float(os.environ.get('REPORT_ALERT_WINDOW', 60)),
+    'max_report_ids': 100,
+}
+
+AUTH = {
+    'jwks_ttl': float(os.environ.get('AUTH_JWKS_TTL', 6 * 60 * 60)),
+    'jwks_min_refresh_interval': float(os.environ.get('AUTH_JWKS_MIN_REFRESH_INTERVAL', 60)),
+    'username_cache_size': int(os.environ.get('AUTH_USERNAME_CACHE_SIZE', 10000)),
+    # Bearer token for the operational endpoints; they answer 404 while unset.
+    'ops_token': os.environ.get('OPS_TOKEN'),
+}
+
+DB_REPLICAS = {
+    'health_check_interval': float(os.environ.get('DB_REPLICA_HEALTH_CHECK_INTERVAL', 5)),
+    'max_replication_lag': float(os.environ.get('DB_REPLICA_MAX_LAG', 30)),
+    'connect_timeout': int(os.environ.get('DB_REPLICA_CONNECT_TIMEOUT', 2)),
+    # Consistency tokens are stamped with the committing host's clock and compared
+    # with replica progress measured on the reading host's clock; NTP keeps hosts
+    # well within this, and a read waits for the replica to be this much further.
+    'clock_skew_margin': float(os.environ.get('DB_REPLICA_CLOCK_SKEW_MARGIN', 1)),
+}
+
 SES_TEMPLATE_DIRECTORY = '/code/app/ses-template'
 
+WITHDRAWAL = {
+    'chunk_size': int(os.environ.get('WITHDRAWAL_CHUNK_SIZE', 500)),
+    'in_background': os.environ.get('WITHDRAWAL_IN_BACKGROUND', '1') == '1',
+    'poll_interval': float(os.environ.get('WITHDRAWAL_POLL_INTERVAL', 60)),
+    # How long a worker owns a job for one chunk before others may take it.
+    'claim_seconds': float(os.environ.get('WITHDRAWAL_CLAIM_SECONDS', 300)),
+}
+
+OUTBOX = {
+    'poll_interval': float(os.environ.get('OUTBOX_POLL_INTERVAL', 5)),
+    'max_attempts': int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 8)),
+    'retry_base_seconds': float(os.environ.get('OUTBOX_RETRY_BASE_SECONDS', 30)),
+    # How long a dispatcher owns a claimed batch before others may retry it.
+    'claim_seconds': float(os.environ.get('OUTBOX_CLAIM_SECONDS', 300)),
+}
+
+
+class OverflowPolicy(Enum):
+    DROP_OLDEST = 'drop_oldest'
+    BLOCK = 'block'
+
+
+ACCESS_LOG = {
+    'table_name': 'wareomofu_api_access_logs',
+    'max_queue_size': int(os.environ.get('ACCESS_LOG_MAX_QUEUE_SIZE', 10000)),
+    'batch_size': 25,
+    'flush_interval': float(os.environ.get('ACCESS_LOG_FLUSH_INTERVAL', 1.0)),
+    'overflow_policy': OverflowPolicy(os.environ.get('ACCESS_LOG_OVERFLOW_POLICY', 'drop_oldest')),
+    'block_timeout': float(os.environ.get('ACCESS_LOG_BLOCK_TIMEOUT', 0.05)),
+    # Share of requests recorded, overridable per route template, e.g.
+    # ACCESS_LOG_ROUTE_SAMPLE_RATES='{"/themes/{page}": 0.1}'.
+    'sample_rate': float(os.environ.get('ACCESS_LOG_SAMPLE_RATE', 1.0)),
+    'route_sample_rates': json.loads(os.environ.get('ACCESS_LOG_ROUTE_SAMPLE_RATES', '{}')),
+    # Errors and slow requests are recorded whatever the sample rate.
+    'always_log_status': 400,
+    'always_log_seconds': float(os.environ.get('ACCESS_LOG_ALWAYS_LOG_SECONDS', 1.0)),
+    # DynamoDB items are capped at 400 KB; longer bodies keep a prefix and a hash.
+    'max_body_bytes': int(os.environ.get('ACCESS_LOG_MAX_BODY_BYTES', 8192)),
+    'request_headers': (
+        'user-agent',
+        'referer',
+        'origin',
+        'content-type',
+        'content-length',
+        'accept-encoding',
+        'if-none-match',
+        'x-forwarded-for',
+        CONSISTENCY_TOKEN_HEADER.lower(),
+    ),
+    'response_headers': (
+        'content-type',
+        'content-length',
+        'etag',
+        NEXT_CURSOR_HEADER.lower(),
+        CONSISTENCY_TOKEN_HEADER.lower(),
+    ),
+    'redacted_fields': ('access_token',),
+}
+
 class ContentType(Enum):
     USER = auto()
     THEME = auto()
@@ -40,6 +204,7 @@ class ThemeSortType(IntEnum):
     START_LATER = 4
     EXPIRE_EARLIER = 5
     EXPIRE_LATER = 6
+    RELEVANCE = 7
 
 
 @unique
@@ -47,3 +212,10 @@ class ThesisSortType(IntEnum):
     NEWER = 0
     OLDER = 1
     NUM_OF_FAVORITES = 2
+    RELEVANCE = 3
+
+
+@unique
+class ThemeView(Enum):
+    FULL = 'full'
+    SUMMARY = 'summary'
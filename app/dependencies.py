@@ -1,15 +1,30 @@
-from .sql.database import SessionLocal, SessionLocal_slave
+from time import perf_counter
+from fastapi import Request
+from .sql.database import SessionLocal, replica_router
+from . import consistency
+from . import metrics
 
 def get_db():
     db = SessionLocal()
     try:
+        # Check out eagerly so pool waits show up as their own metric
+        # instead of hiding inside the first query.
+        started_at = perf_counter()
+        db.connection()
+        metrics.db_checkout_wait.observe(perf_counter() - started_at, replica_router.primary.name, 'sync')
         yield db
     finally:
         db.close()
 
-def get_slave_db():
-    db = SessionLocal_slave()
+async def get_async_slave_db(request: Request):
+    # Clients echo the X-Consistency-Token of their last write so they never
+    # read from a replica that has not applied it yet.
+    replica = replica_router.acquire(not_before=consistency.get_not_before(request))
     try:
-        yield db
+        async with replica.AsyncSessionLocal() as db:
+            started_at = perf_counter()
+            await db.connection()
+            metrics.db_checkout_wait.observe(perf_counter() - started_at, replica.name, 'async')
+            yield db
     finally:
-        db.close()
+        replica_router.release(replica)
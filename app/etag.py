@@ -0,0 +1,45 @@
+import hashlib
+from typing import Optional
+from fastapi import Response
+from . import const
+
+
+def make(model, *parts) -> str:
+    # The schema's fields are part of the tag so a deploy that changes the
+    # payload shape never answers an old tag with 304.
+    source = repr((model.__name__, tuple(model.__fields__), parts))
+    return f'"{hashlib.sha1(source.encode()).hexdigest()[:20]}"'
+
+
+def encoded(tag: str, encoding: str) -> str:
+    # Each content-coding is its own representation, so strong tags differ
+    # per encoding; matches() strips the suffix again.
+    return f'{tag[:-1]}-{encoding}"'
+
+
+def decoded(tag: str) -> str:
+    for encoding in const.COMPRESSION['levels']:
+        suffix = f'-{encoding}"'
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)] + '"'
+    return tag
+
+
+def match(if_none_match: Optional[str], tag: Optional[str]) -> Optional[str]:
+    # Returns the tag the client holds, suffix included, for the 304 to echo.
+    if not if_none_match or tag is None:
+        return None
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return tag
+        # If-None-Match uses the weak comparison.
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if decoded(candidate) == tag:
+            return candidate
+    return None
+
+
+def not_modified(tag: str) -> Response:
+    return Response(status_code=304, headers={'etag': tag, 'vary': 'Accept-Encoding'})
@@ -1,4 +1,5 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Response
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import os
 from .routers import \
@@ -8,12 +9,18 @@ from .routers import \
     report,\
     favorite,\
     comment
-from .sql import models
-from .sql.database import engine
+from . import const
+from .sql.database import replica_router, replica_checker
+from .access_log import shipper
+from . import notification
+from .report_alert import aggregator
+from . import withdrawal
+from . import cache
+from . import aws
+from . import metrics
+from .auth import require_ops_token
 
-models.Base.metadata.create_all(bind=engine)
-
-app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None, default_response_class=ORJSONResponse)
 
 origins = []
 postfix = 1
@@ -28,7 +35,75 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        const.NEXT_CURSOR_HEADER,
+        const.CONSISTENCY_TOKEN_HEADER,
+        const.DB_QUERIES_HEADER,
+        const.DB_TIME_HEADER,
+        'ETag',
+    ],
+)
+
+@app.on_event('startup')
+def start_background_workers():
+    aws.registry.warm_up(const.AWS['warm_up'])
+    notification.load_templates()
+    shipper.start()
+    notification.dispatcher.start()
+    aggregator.start()
+    replica_checker.start()
+    replica_checker.wake()
+    withdrawal.worker.start()
+    withdrawal.worker.wake()
+
+
+@app.on_event('shutdown')
+def stop_background_workers():
+    withdrawal.worker.stop()
+    replica_checker.stop()
+    aggregator.stop()
+    notification.dispatcher.stop()
+    shipper.stop()
+
+
+def get_db_pools():
+    for replica in [replica_router.primary] + replica_router.replicas:
+        yield replica, 'sync', replica.engine.pool
+        yield replica, 'async', replica.async_engine.sync_engine.pool
+
+
+for name in ('response_cache', 'liked_cache', 'profile_cache'):
+    metrics.registry.register_stats(
+        name,
+        getattr(cache, name).stats,
+        counters=('hits', 'misses', 'evictions', 'invalidations'),
+        gauges=('size',)
+    )
+metrics.registry.register_stats(
+    'access_log', shipper.stats, counters=('dropped', 'skipped', 'flushed', 'failed'), gauges=('queued',)
+)
+metrics.registry.register_stats(
+    'report_alert', aggregator.stats, counters=('received', 'published', 'failed'), gauges=('pending_groups',)
 )
+metrics.registry.register_stats('email_outbox', notification.dispatcher.stats, counters=('sent', 'failed'))
+metrics.registry.register_stats('withdrawal', withdrawal.worker.stats, counters=('chunks', 'finished'))
+metrics.registry.gauge('db_pool_checked_out', 'Connections currently checked out', ('pool', 'driver'), lambda: [
+    ((replica.name, driver), pool.checkedout()) for replica, driver, pool in get_db_pools()
+])
+metrics.registry.gauge('db_replica_healthy', 'Whether the replica receives reads', ('pool',), lambda: [
+    ((replica.name,), int(replica.healthy)) for replica in replica_router.replicas
+])
+metrics.registry.gauge('db_replica_lag_seconds', 'Last probed replication lag', ('pool',), lambda: [
+    ((replica.name,), replica.lag) for replica in replica_router.replicas
+])
+metrics.registry.gauge('db_replica_outstanding', 'Sessions currently leased', ('pool',), lambda: [
+    ((replica.name,), replica.outstanding) for replica in [replica_router.primary] + replica_router.replicas
+])
+metrics.registry.counter('db_replica_fallbacks', 'Reads sent to the primary', ('reason',), lambda: [
+    (('unavailable',), replica_router.fallbacks),
+    (('consistency',), replica_router.consistency_fallbacks),
+])
+
 
 app.include_router(theme.router)
 app.include_router(thesis.router)
@@ -40,3 +115,23 @@ app.include_router(comment.router)
 @app.get('/')
 async def health_check():
     return True
+
+
+@app.get('/cache/stats', dependencies=[Depends(require_ops_token)])
+async def cache_stats():
+    return cache.response_cache.stats()
+
+
+@app.get('/aws/stats', dependencies=[Depends(require_ops_token)])
+async def aws_stats():
+    return aws.registry.stats()
+
+
+@app.get('/db/stats', dependencies=[Depends(require_ops_token)])
+async def db_stats():
+    return replica_router.stats()
+
+
+@app.get('/metrics', dependencies=[Depends(require_ops_token)])
+async def read_metrics():
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
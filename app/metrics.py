@@ -0,0 +1,187 @@
+from bisect import bisect_left
+import math
+import threading
+from . import const
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labelnames, labelvalues) -> str:
+    if not labelnames:
+        return ''
+    pairs = ','.join(f'{name}="{escape(value)}"' for name, value in zip(labelnames, labelvalues))
+    return f'{{{pairs}}}'
+
+
+def format_value(value) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=const.METRICS['latency_buckets']):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        # One bucket increment per observation; cumulative counts are only
+        # built at scrape time.
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def collect(self) -> list:
+        with self._lock:
+            snapshot = [(labelvalues, list(counts), total) for labelvalues, (counts, total) in self._series.items()]
+        lines = []
+        bucket_labelnames = self.labelnames + ('le',)
+        for labelvalues, counts, total in sorted(snapshot):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = format_labels(bucket_labelnames, labelvalues + (format_value(bound),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = format_labels(self.labelnames, labelvalues)
+            lines.append(f'{self.name}_sum{labels} {format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def collect(self) -> list:
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        return [
+            f'{self.name}{format_labels(self.labelnames, labelvalues)} {format_value(value)}'
+            for labelvalues, value in snapshot
+        ]
+
+
+class Callback:
+    # Reads a value other components already keep (cache hits, queue sizes)
+    # at scrape time instead of double-counting it on the hot path.
+    def __init__(self, name: str, documentation: str, type: str, labelnames, function):
+        self.name = name
+        self.documentation = documentation
+        self.type = type
+        self.labelnames = tuple(labelnames)
+        self.function = function
+
+    def collect(self) -> list:
+        return [
+            f'{self.name}{format_labels(self.labelnames, labelvalues)} {format_value(value)}'
+            for labelvalues, value in self.function()
+            if value is not None
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'metric {metric.name} is already registered')
+            self._metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames=(), **kwargs) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, **kwargs))
+
+    def gauge(self, name: str, documentation: str, labelnames, function) -> Callback:
+        return self.register(Callback(name, documentation, 'gauge', labelnames, function))
+
+    def counter(self, name: str, documentation: str, labelnames=(), function=None):
+        if function is None:
+            return self.register(Counter(f'{name}_total', documentation, labelnames))
+        return self.register(Callback(f'{name}_total', documentation, 'counter', labelnames, function))
+
+    def register_stats(self, prefix: str, stats, counters=(), gauges=()):
+        # Flattens a component's stats() dict, e.g. response_cache_hits_total.
+        for key in counters:
+            self.counter(f'{prefix}_{key}', f'{prefix} {key}', (), lambda key=key: [((), stats()[key])])
+        for key in gauges:
+            self.gauge(f'{prefix}_{key}', f'{prefix} {key}', (), lambda key=key: [((), stats()[key])])
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {escape(metric.documentation)}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            try:
+                lines += metric.collect()
+            except Exception as e:
+                print(f'metrics: {metric.name}: {e}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    'http_request_duration_seconds',
+    'Request latency by route template',
+    ('method', 'route', 'status')
+)
+db_checkout_wait = registry.histogram(
+    'db_checkout_wait_seconds',
+    'Time a request waited for a pooled database connection',
+    ('pool', 'driver')
+)
+db_query_duration = registry.histogram(
+    'db_query_duration_seconds',
+    'Database statement execution time',
+    ('pool', 'driver')
+)
+aws_call_duration = registry.histogram(
+    'aws_call_duration_seconds',
+    'AWS API call latency including retries',
+    ('service', 'operation', 'outcome')
+)
+compression_duration = registry.histogram(
+    'compression_duration_seconds',
+    'CPU time spent compressing response bodies',
+    ('encoding',)
+)
+compressed_responses = registry.counter(
+    'compressed_responses',
+    'Compressed responses by whether the body was reused from the response cache',
+    ('encoding', 'source')
+)
+compression_bytes = registry.counter(
+    'compression_bytes',
+    'Response bytes before and after compression',
+    ('encoding', 'stage')
+)
+
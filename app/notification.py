@@ -0,0 +1,167 @@
+from datetime import datetime, timedelta
+import json
+import os
+import uuid
+from sqlalchemy import select, update
+from .background import BackgroundWorker
+from .sql import models
+from .sql.database import SessionLocal
+from . import const
+from . import aws
+
+templates = {}
+
+
+def load_templates():
+    for filename in os.listdir(const.SES_TEMPLATE_DIRECTORY):
+        name, extension = os.path.splitext(filename)
+        if extension != '.txt':
+            continue
+        with open(os.path.join(const.SES_TEMPLATE_DIRECTORY, filename), 'r') as f:
+            templates[name] = f.read()
+
+
+def get_template(name: str) -> str:
+    if not templates:
+        load_templates()
+    return templates[name]
+
+
+def compose(username: str, subject: str, template_name: str, *args) -> dict:
+    header = get_template('header').format(username)
+    main = get_template(template_name).format(*args)
+    footer = get_template('footer')
+    message = f'{header}\n\n{main}\n\n{footer}'
+    return {
+        'username': username,
+        'subject': subject,
+        'message': message,
+    }
+
+
+def summarize(content: str) -> str:
+    summary_len_limit = 97
+    if len(content) > summary_len_limit:
+        return f'{content[:summary_len_limit]}...'
+    return content
+
+
+def encode_body(email: models.EmailOutbox) -> str:
+    encode = lambda value : value.encode('utf-8').hex()
+    body = {
+        'username': encode(email.username),
+        'subject': encode(email.subject),
+        'message': encode(email.message),
+    }
+    return json.dumps(body)
+
+
+class OutboxDispatcher(BackgroundWorker):
+    def __init__(
+        self,
+        queue_name: str,
+        poll_interval: float = 5,
+        batch_size: int = 10,
+        max_attempts: int = 8,
+        retry_base_seconds: float = 30,
+        claim_seconds: float = 300
+    ):
+        super().__init__('email-outbox-dispatcher', poll_interval)
+        self.queue_name = queue_name
+        self.batch_size = min(batch_size, 10)
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.claim_seconds = claim_seconds
+        self.sent = 0
+        self.failed = 0
+        self._queue_url = None
+
+    def stats(self) -> dict:
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+        }
+
+    def run_once(self):
+        while self._dispatch_batch() == self.batch_size:
+            pass
+
+    def _dispatch_batch(self) -> int:
+        db = SessionLocal()
+        try:
+            now = datetime.now()
+            emails = self._claim(db, now)
+            if not emails:
+                return 0
+            failed_ids = self._send(emails)
+            for email in emails:
+                if str(email.id) in failed_ids:
+                    email.attempts = email.attempts + 1
+                    delay = min(self.retry_base_seconds * (2 ** email.attempts), 60 * 60)
+                    email.next_attempt_at = now + timedelta(seconds=delay)
+                    self.failed += 1
+                else:
+                    email.sent_at = now
+                    self.sent += 1
+            db.commit()
+            return len(emails)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _claim(self, db, now: datetime) -> list:
+        # A conditional UPDATE pushes claimed rows past a lease, so concurrent
+        # dispatchers skip them without holding row locks across the SQS call
+        # (SKIP LOCKED needs MySQL 8). Rows of a dispatcher that dies
+        # mid-batch are sent again once the lease runs out.
+        due = (
+            models.EmailOutbox.sent_at.is_(None),
+            models.EmailOutbox.next_attempt_at <= now,
+            models.EmailOutbox.attempts < self.max_attempts,
+        )
+        ids = db.execute(
+            select(models.EmailOutbox.id).where(*due).order_by(models.EmailOutbox.id).limit(self.batch_size)
+        ).scalars().all()
+        if not ids:
+            db.commit()
+            return []
+        token = str(uuid.uuid4())
+        db.execute(
+            update(models.EmailOutbox)
+            .where(models.EmailOutbox.id.in_(ids), *due)
+            .values(claimed_by=token, next_attempt_at=now + timedelta(seconds=self.claim_seconds))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return db.execute(
+            select(models.EmailOutbox)
+            .where(models.EmailOutbox.id.in_(ids), models.EmailOutbox.claimed_by == token)
+            .order_by(models.EmailOutbox.id)
+        ).scalars().all()
+
+    def _send(self, emails: list) -> set:
+        entries = [
+            {'Id': str(email.id), 'MessageBody': encode_body(email)} for email in emails
+        ]
+        try:
+            sqs = aws.client('sqs')
+            if self._queue_url is None:
+                self._queue_url = sqs.get_queue_url(QueueName=self.queue_name)['QueueUrl']
+            response = sqs.send_message_batch(QueueUrl=self._queue_url, Entries=entries)
+        except Exception as e:
+            print(e)
+            return {entry['Id'] for entry in entries}
+        for failure in response.get('Failed', []):
+            print(f'failed to send email {failure["Id"]}: {failure.get("Message")}')
+        return {failure['Id'] for failure in response.get('Failed', [])}
+
+
+dispatcher = OutboxDispatcher(
+    queue_name=os.environ['EMAIL_TO_USER_QUEUE'],
+    poll_interval=const.OUTBOX['poll_interval'],
+    max_attempts=const.OUTBOX['max_attempts'],
+    retry_base_seconds=const.OUTBOX['retry_base_seconds'],
+    claim_seconds=const.OUTBOX['claim_seconds']
+)
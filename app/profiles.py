@@ -0,0 +1,66 @@
+import asyncio
+from typing import Dict, List, Optional
+from botocore.exceptions import ClientError
+from fastapi.concurrency import run_in_threadpool
+from . import const
+from . import cache
+from . import aws
+
+
+class ProfileNotFound(Exception):
+    pass
+
+
+NOT_FOUND = object()
+
+
+def fetch_profile(username: str) -> str:
+    client = aws.client('cognito-idp')
+    try:
+        user = client.admin_get_user(
+            UserPoolId=const.COGNITO_INFO['user_pool_id'],
+            Username=username
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'UserNotFoundException':
+            raise ProfileNotFound(username)
+        raise
+    for attribute in user['UserAttributes']:
+        if attribute['Name'] == 'profile':
+            return attribute['Value']
+    return ''
+
+
+async def get_profile(username: str) -> str:
+    profile = cache.profile_cache.get(username)
+    if profile is NOT_FOUND:
+        raise ProfileNotFound(username)
+    if profile is not None:
+        return profile
+    tags = [cache.profile_tag(username)]
+    try:
+        profile = await run_in_threadpool(fetch_profile, username)
+    except ProfileNotFound:
+        # Remember misses too, or a deleted author would hit Cognito on every page view.
+        cache.profile_cache.set(username, NOT_FOUND, tags=tags, ttl=const.PROFILE_CACHE['not_found_ttl'])
+        raise
+    cache.profile_cache.set(username, profile, tags=tags)
+    return profile
+
+
+async def get_profiles(usernames: List[str]) -> Dict[str, Optional[str]]:
+    semaphore = asyncio.Semaphore(const.PROFILE['max_concurrency'])
+
+    async def get_or_none(username: str) -> Optional[str]:
+        async with semaphore:
+            try:
+                return await get_profile(username)
+            except ProfileNotFound:
+                return None
+            except Exception as e:
+                print(e)
+                return None
+
+    usernames = list(dict.fromkeys(usernames))
+    profiles = await asyncio.gather(*[get_or_none(username) for username in usernames])
+    return dict(zip(usernames, profiles))
@@ -0,0 +1,126 @@
+from contextvars import ContextVar
+from functools import lru_cache
+import hashlib
+import logging
+import re
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+from . import const
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+IN_LIST = re.compile(r'\(\s*(%s|\?)(\s*,\s*(%s|\?))+\s*\)')
+WHITESPACE = re.compile(r'\s+')
+
+
+class RequestQueries:
+    def __init__(self, method: str, route: str):
+        self.method = method
+        self.route = route
+        self.count = 0
+        self.seconds = 0.0
+        # fingerprint -> [count, relationship, statement]
+        self.statements = {}
+
+    def record(self, fingerprint: str, statement: str, elapsed: float, relationship):
+        self.count += 1
+        self.seconds += elapsed
+        entry = self.statements.get(fingerprint)
+        if entry is None:
+            self.statements[fingerprint] = [1, relationship, statement]
+        else:
+            entry[0] += 1
+            if entry[1] is None:
+                entry[1] = relationship
+
+    def repeated(self, threshold: int) -> list:
+        return [
+            (fingerprint, count, relationship, statement)
+            for fingerprint, (count, relationship, statement) in self.statements.items()
+            if count > threshold
+        ]
+
+
+current = ContextVar('request_queries', default=None)
+
+
+def get_parameter_shape(parameters, executemany: bool) -> tuple:
+    # Count and types of the bound values, so IN lists of different lengths
+    # and differently typed calls of one statement are told apart.
+    if executemany:
+        return ('many',) + get_parameter_shape(parameters[0] if parameters else (), False)
+    values = parameters.values() if isinstance(parameters, dict) else parameters or ()
+    return tuple(type(value).__name__ for value in values)
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(statement: str, shape: tuple) -> tuple:
+    # Values are bound parameters, so the text only varies with the length of
+    # expanded IN lists; it is folded for the log, and the shape keeps the
+    # lengths apart in the hash.
+    normalized = WHITESPACE.sub(' ', IN_LIST.sub('(?...)', statement)).strip()
+    source = f'{normalized} {",".join(shape)}'
+    return hashlib.sha1(source.encode()).hexdigest()[:12], normalized
+
+
+def begin(method: str, route: str) -> RequestQueries:
+    # Sync dependencies run in worker threads with a copy of this context, so
+    # the object is mutated in place rather than replaced.
+    queries = RequestQueries(method, route)
+    current.set(queries)
+    return queries
+
+
+def finish(queries: RequestQueries):
+    for fingerprint, count, relationship, statement in queries.repeated(const.QUERY_LOG['n_plus_one_threshold']):
+        logger.warning(
+            'n+1 query: %s %s ran %s %d times via %s: %s',
+            queries.method, queries.route, fingerprint, count, relationship or 'an explicit query',
+            statement[:const.QUERY_LOG['max_statement_length']]
+        )
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def tag_relationship_load(orm_execute_state):
+    # Compound selects (union_all) carry no ORM compile options and make
+    # is_relationship_load raise on SQLAlchemy 1.4.32; they are never
+    # relationship loads anyway.
+    if current.get() is None or not isinstance(orm_execute_state.statement, Select):
+        return
+    if orm_execute_state.is_relationship_load:
+        path = orm_execute_state.loader_strategy_path
+        relationship = path[-1] if path is not None and len(path) else None
+        if relationship is not None:
+            orm_execute_state.update_execution_options(querylog_relationship=str(relationship))
+
+
+def instrument_engine(engine, pool: str, driver: str):
+    # The one timing hook per engine: it feeds the latency histogram, the
+    # per-request counts and the slow-query log.
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        context._querylog_started_at = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        started_at = getattr(context, '_querylog_started_at', None)
+        if started_at is None:
+            return
+        elapsed = time.perf_counter() - started_at
+        metrics.db_query_duration.observe(elapsed, pool, driver)
+        queries = current.get()
+        if queries is None and elapsed < const.QUERY_LOG['slow_query_seconds']:
+            return
+        statement_fingerprint, normalized = fingerprint(statement, get_parameter_shape(parameters, executemany))
+        relationship = context.execution_options.get('querylog_relationship')
+        if queries is not None:
+            queries.record(statement_fingerprint, normalized, elapsed, relationship)
+        if elapsed >= const.QUERY_LOG['slow_query_seconds']:
+            route = f'{queries.method} {queries.route}' if queries is not None else 'background'
+            logger.warning(
+                'slow query: %.3fs %s %s %s: %s',
+                elapsed, pool, route, statement_fingerprint, normalized[:const.QUERY_LOG['max_statement_length']]
+            )
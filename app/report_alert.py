@@ -0,0 +1,107 @@
+import json
+import threading
+from .background import BackgroundWorker
+from . import const
+from . import aws
+
+CONTENT_TYPE_NAMES = {
+    const.ContentType.USER: 'ユーザー',
+    const.ContentType.THEME: 'テーマ',
+    const.ContentType.THESIS: '小論文',
+    const.ContentType.COMMENT: 'コメント',
+}
+
+TARGET_KEYS = {
+    const.ContentType.USER: 'target_username',
+    const.ContentType.THEME: 'theme_id',
+    const.ContentType.THESIS: 'thesis_id',
+    const.ContentType.COMMENT: 'comment_id',
+}
+
+
+class ReportAlertAggregator(BackgroundWorker):
+    def __init__(self, topic_arn: str, window: float = 60, max_report_ids: int = 100):
+        super().__init__('report-alert-aggregator', window)
+        self.topic_arn = topic_arn
+        self.max_report_ids = max_report_ids
+        self.received = 0
+        self.published = 0
+        self.failed = 0
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def put(self, type: const.ContentType, target, report):
+        created_at = str(report.created_at)
+        with self._lock:
+            self.received += 1
+            group = self._groups.get((type, target))
+            if group is None:
+                group = {
+                    'count': 0,
+                    'report_ids': [],
+                    'first_created_at': created_at,
+                }
+                self._groups[(type, target)] = group
+            self._add(group, 1, [report.id], created_at)
+
+    def stats(self) -> dict:
+        return {
+            'pending_groups': len(self._groups),
+            'received': self.received,
+            'published': self.published,
+            'failed': self.failed,
+        }
+
+    def run_once(self):
+        with self._lock:
+            groups = self._groups
+            self._groups = {}
+        for (type, target), group in groups.items():
+            if not self._publish(type, target, group):
+                self._requeue(type, target, group)
+
+    def _add(self, group: dict, count: int, report_ids: list, last_created_at: str):
+        group['count'] += count
+        # Keep the digest well under the SNS message size limit during a flood;
+        # the count still covers every report.
+        room = self.max_report_ids - len(group['report_ids'])
+        group['report_ids'].extend(report_ids[:max(room, 0)])
+        group['last_created_at'] = last_created_at
+
+    def _requeue(self, type: const.ContentType, target, group: dict):
+        with self._lock:
+            pending = self._groups.get((type, target))
+            if pending is not None:
+                # Reports that arrived while publishing come after the failed ones.
+                self._add(group, pending['count'], pending['report_ids'], pending['last_created_at'])
+            self._groups[(type, target)] = group
+
+    def _publish(self, type: const.ContentType, target, group: dict) -> bool:
+        subject = f'{CONTENT_TYPE_NAMES[type]}に対する通報連絡（{group["count"]}件）'
+        digest = {
+            TARGET_KEYS[type]: target,
+            'count': group['count'],
+            'report_ids': group['report_ids'],
+            'first_created_at': group['first_created_at'],
+            'last_created_at': group['last_created_at'],
+        }
+        message = f'{subject}\n{json.dumps(digest)}'
+        try:
+            aws.client('sns').publish(
+                TopicArn=self.topic_arn,
+                Message=message,
+                Subject=subject
+            )
+        except Exception as e:
+            print(e)
+            self.failed += 1
+            return False
+        self.published += 1
+        return True
+
+
+aggregator = ReportAlertAggregator(
+    topic_arn=const.SNS_TOPIC_ARN,
+    window=const.REPORT_ALERT['window'],
+    max_report_ids=const.REPORT_ALERT['max_report_ids']
+)
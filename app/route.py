@@ -1,14 +1,14 @@
 from time import time
-from datetime import datetime
-import pytz
-import json
 from typing import Callable
-from fastapi import Request, Response
+from fastapi import HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
 from fastapi.routing import APIRoute
-import hashlib
-import uuid
-import boto3
-from . import utils
+from . import const
+from . import consistency
+from . import metrics
+from . import querylog
+from . import compression
+from . import access_log
 
 
 class LoggingContextRoute(APIRoute):
@@ -20,52 +20,40 @@ class LoggingContextRoute(APIRoute):
                 '/'
             ]
             response = {}
+            commits = consistency.begin()
             if request.url.path not in ignore_paths:
+                queries = querylog.begin(request.method, self.path)
                 before = time()
-                response: Response = await original_route_handler(request)
-                duration = round(time() - before, 4)
-
-                record = {}
-                time_local = datetime.fromtimestamp(before)
-                time_local = pytz.timezone('Asia/Tokyo').localize(time_local)
-                record['created_at'] = time_local.strftime('%Y-%m-%d %H:%M:%S%Z')
-                timestamp = f'{datetime.timestamp(time_local)}-{uuid.uuid4()}'
-                record['timestamp'] = timestamp
-                record['username'] = 'cannot_identify'
-                record['request_body'] = {}
-                secret = '*****'
-                if await request.body():
-                    request_body = json.loads((await request.body()).decode('utf-8'))
-                    for key, value in request_body.items():
-                        if key == 'access_token':
-                            try:
-                                username = utils.get_username(value)
-                                hashed_username = hashlib.sha256(username.encode()).hexdigest()
-                                record['username'] = hashed_username
-                            except Exception as e:
-                                print(e)
-                            record['request_body'][key] = secret
-                        else:
-                            record['request_body'][key] = value
-                record['request_headers'] = {
-                    k.decode('utf-8'): v.decode('utf-8') for (k, v) in request.headers.raw
-                }
-                record['remote_addr'] = request.client.host
-                record['request_uri'] = request.url.path
-                record['request_method'] = request.method
-                record['request_time'] = str(duration)
-                record['status'] = response.status_code
-                record['response_body'] = response.body.decode('utf-8')
-                record['response_headers'] = {
-                    k.decode('utf-8'): v.decode('utf-8') for (k, v) in response.headers.raw
-                }
                 try:
-                    table_name = 'wareomofu_api_access_logs'
-                    dynamodb = boto3.resource('dynamodb')
-                    dynamodb_table = dynamodb.Table(table_name)
-                    dynamodb_table.put_item(Item=record)
+                    response: Response = await original_route_handler(request)
                 except Exception as e:
-                    print(e)
+                    # Errors turned into responses further out still count, under their final status.
+                    if isinstance(e, HTTPException):
+                        status = e.status_code
+                    elif isinstance(e, RequestValidationError):
+                        status = 422
+                    else:
+                        status = 500
+                    elapsed = time() - before
+                    metrics.request_duration.observe(elapsed, request.method, self.path, status)
+                    querylog.finish(queries)
+                    await access_log.record_access(request, self.path, status, before, elapsed, queries, error=e)
+                    raise
+                elapsed = time() - before
+                metrics.request_duration.observe(elapsed, request.method, self.path, response.status_code)
+                querylog.finish(queries)
+                if const.QUERY_LOG['debug_headers']:
+                    response.headers[const.DB_QUERIES_HEADER] = str(queries.count)
+                    response.headers[const.DB_TIME_HEADER] = str(round(queries.seconds, 4))
+                committed_at = commits.last_at
+                if committed_at is not None and response.status_code < 400:
+                    token = consistency.encode_token(committed_at)
+                    response.headers[const.CONSISTENCY_TOKEN_HEADER] = token
+
+                await access_log.record_access(
+                    request, self.path, response.status_code, before, elapsed, queries, response=response
+                )
+                compression.compress_response(request, response, self.path)
             return response
 
         return custom_route_handler
\ No newline at end of file
@@ -1,13 +1,19 @@
-from typing import List
+from typing import List, Union
 
-from fastapi import APIRouter, Path, Depends
+from fastapi import APIRouter, Path, Depends, Header
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..sql import crud
-from ..dependencies import get_db, get_slave_db
+from ..sql import crud, async_crud
+from ..dependencies import get_db, get_async_slave_db
 from .. import schemas
 from .. import utils
 from .. import const
+from .. import cache
+from .. import serializers
+from .. import compression
+from .. import etag
+from .. import notification
 from ..route import LoggingContextRoute
 
 router = APIRouter()
@@ -17,10 +23,10 @@ router.route_class = LoggingContextRoute
 @router.get('/pages/comments/{thesis_id}', tags=['comment', 'pages'], response_model=schemas.CountAndPages)
 async def read_comment_pages(
     thesis_id: int = Path(ge=1),
-    db: Session = Depends(get_slave_db)
+    db: AsyncSession = Depends(get_async_slave_db)
 ):
     limit = 100
-    count = crud.get_comments_count(db, thesis_id=thesis_id)
+    count = await async_crud.get_comments_count(db, thesis_id=thesis_id)
     max_page = (count // limit) + int((count % limit) > 0)
     if max_page == 0:
         max_page = 1
@@ -35,40 +41,59 @@ async def read_comment_pages(
 async def read_comments(
     thesis_id: int = Path(ge=1),
     page: int = Path(ge=1),
-    db: Session = Depends(get_slave_db)
+    if_none_match: Union[str, None] = Header(default=None),
+    db: AsyncSession = Depends(get_async_slave_db)
 ):
     limit = 100
     skip = utils.get_skip(limit, page)
-    comments = crud.get_comments(db, thesis_id=thesis_id, skip=skip, limit=limit)
-    return comments
+    key = cache.make_key('comments', thesis_id, page)
+    payload = cache.response_cache.get(key)
+    matched = None
+    if payload is not None:
+        matched = etag.match(if_none_match, payload.etag)
+    elif if_none_match:
+        # The validator query only pays off when there is a tag to check.
+        version = await async_crud.get_comments_version(db, thesis_id=thesis_id, skip=skip, limit=limit)
+        matched = etag.match(if_none_match, etag.make(schemas.Comment, page, version))
+    if matched is not None:
+        return etag.not_modified(matched)
+    if payload is None:
+        comments = await async_crud.get_comments(db, thesis_id=thesis_id, skip=skip, limit=limit)
+        tag = etag.make(schemas.Comment, page, crud.to_comments_version(comments))
+        payload = compression.Payload(serializers.dumps(schemas.Comment, comments), etag=tag)
+        cache.response_cache.set(key, payload, tags=[cache.comments_tag(thesis_id)])
+    return compression.PayloadResponse(payload)
 
 
 @router.post('/comment/create', tags=['comment'], response_model=bool)
-async def create_comment(
+def create_comment(
     comment: schemas.CommentCreate,
     db: Session = Depends(get_db)
 ):
     username = utils.get_username(comment.access_token)
-    crud.create_comment(db, thesis_id=comment.thesis_id, username=username, content=comment.content)
     thesis = crud.get_thesis(db, thesis_id=comment.thesis_id)
-    if thesis.username != username:
+    email_notification = None
+    if thesis is not None and thesis.username is not None and thesis.username != username:
         email_notification_setting = crud.create_or_read_email_notification_setting(
             db,
             username=thesis.username
         )
         if email_notification_setting.comment:
-            subject = '小論文にコメントが投稿されました'
-            with open(f'{const.SES_TEMPLATE_DIRECTORY}/comment.txt', 'r') as f:
-                main_template = f.read()
-            summary_len_limit = 97
-            if len(comment.content) > summary_len_limit:
-                summary = f'{comment.content[:summary_len_limit]}...'
-            else:
-                summary = comment.content
-            main = main_template.format(
+            email_notification = lambda db_comment : notification.compose(
+                thesis.username,
+                '小論文にコメントが投稿されました',
+                'comment',
                 username,
                 comment.thesis_id,
-                summary
+                notification.summarize(comment.content)
             )
-            utils.send_email_notification(thesis.username, subject, main)
+    crud.create_comment(
+        db,
+        thesis_id=comment.thesis_id,
+        username=username,
+        content=comment.content,
+        notification=email_notification
+    )
+    if email_notification is not None:
+        notification.dispatcher.wake()
     return True
@@ -1,13 +1,20 @@
 from typing import List, Union
+import time
 
-from fastapi import APIRouter, Depends, HTTPException, Path
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Request
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..sql import crud
-from ..dependencies import get_db, get_slave_db
+from ..sql import crud, async_crud
+from ..dependencies import get_db, get_async_slave_db
 from .. import schemas
 from .. import utils
 from .. import const
+from .. import cache
+from .. import consistency
+from .. import serializers
+from .. import etag
+from .. import notification
 from ..route import LoggingContextRoute
 
 router = APIRouter()
@@ -18,21 +25,30 @@ router.route_class = LoggingContextRoute
 async def read_user_favorites(
     username: str,
     page: int = Path(ge=1),
-    db: Session = Depends(get_slave_db)
+    if_none_match: Union[str, None] = Header(default=None),
+    db: AsyncSession = Depends(get_async_slave_db)
 ):
     limit = 100
     skip = utils.get_skip(limit, page)
-    favorites = crud.get_user_favorites(db, username=username, skip=skip, limit=limit)
-    return favorites
+    if if_none_match:
+        version = await async_crud.get_user_favorites_version(db, username=username, skip=skip, limit=limit)
+        tag = etag.make(schemas.Thesis, version)
+        matched = etag.match(if_none_match, tag)
+        if matched is not None:
+            return etag.not_modified(matched)
+    favorites = await async_crud.get_user_favorites(db, username=username, skip=skip, limit=limit)
+    response = serializers.render(schemas.Thesis, favorites)
+    response.headers['etag'] = etag.make(schemas.Thesis, crud.to_theses_version(favorites))
+    return response
 
 
 @router.get('/pages/favorites', tags=['favorite', 'pages'], response_model=schemas.CountAndPages)
 async def read_user_favorite_pages(
     username: str,
-    db: Session = Depends(get_slave_db)
+    db: AsyncSession = Depends(get_async_slave_db)
 ):
     limit = 100
-    count = crud.get_user_favorites_count(db, username=username)
+    count = await async_crud.get_user_favorites_count(db, username=username)
     max_page = (count // limit) + int((count % limit) > 0)
     if max_page == 0:
         max_page = 1
@@ -45,9 +61,9 @@ async def read_user_favorite_pages(
 
 
 @router.post('/favorite/read', tags=['favorite'], response_model=bool)
-async def read_favorites(favorite: schemas.FavoriteThesisRead, db: Session = Depends(get_slave_db)):
-    username = utils.get_username(favorite.access_token)
-    favorite_thesis = crud.get_favorite_thesis(
+async def read_favorites(favorite: schemas.FavoriteThesisRead, db: AsyncSession = Depends(get_async_slave_db)):
+    username = await utils.get_username_async(favorite.access_token)
+    favorite_thesis = await async_crud.get_favorite_thesis(
         db,
         thesis_id=favorite.thesis_id,
         username=username
@@ -58,34 +74,68 @@ async def read_favorites(favorite: schemas.FavoriteThesisRead, db: Session = Dep
         return False
 
 
-@router.post('/favorite/like', tags=['favorite'], response_model=bool)
-async def like(favorite: schemas.FavoriteThesisCreate, db: Session = Depends(get_db)):
-    username = utils.get_username(favorite.access_token)
-    crud.create_favorite_thesis(
+@router.post('/favorite/read/batch', tags=['favorite'], response_model=List[int])
+async def read_favorites_batch(
+    favorite: schemas.FavoriteThesisBatchRead,
+    request: Request,
+    db: AsyncSession = Depends(get_async_slave_db)
+):
+    username = await utils.get_username_async(favorite.access_token)
+    liked_thesis_ids = cache.liked_cache.get(username, not_before=consistency.get_not_before(request))
+    if liked_thesis_ids is None:
+        read_at = time.time()
+        max_set_size = const.LIKED_CACHE['max_set_size']
+        thesis_ids = await async_crud.get_user_favorite_thesis_ids(
+            db,
+            username=username,
+            limit=max_set_size + 1
+        )
+        if len(thesis_ids) <= max_set_size:
+            liked_thesis_ids = frozenset(thesis_ids)
+            cache.liked_cache.set(username, liked_thesis_ids, tags=[cache.liked_tag(username)], read_at=read_at)
+    if liked_thesis_ids is not None:
+        return [thesis_id for thesis_id in favorite.thesis_ids if thesis_id in liked_thesis_ids]
+    if not favorite.thesis_ids:
+        return []
+    thesis_ids = set(await async_crud.get_favorite_thesis_ids(
         db,
-        thesis_id=favorite.thesis_id,
+        thesis_ids=favorite.thesis_ids,
         username=username
-    )
+    ))
+    return [thesis_id for thesis_id in favorite.thesis_ids if thesis_id in thesis_ids]
+
+
+@router.post('/favorite/like', tags=['favorite'], response_model=bool)
+def like(favorite: schemas.FavoriteThesisCreate, db: Session = Depends(get_db)):
+    username = utils.get_username(favorite.access_token)
     thesis = crud.get_thesis(db, thesis_id=favorite.thesis_id)
-    if thesis.username != username:
+    email_notification = None
+    if thesis is not None and thesis.username is not None and thesis.username != username:
         email_notification_setting = crud.create_or_read_email_notification_setting(
             db,
             username=thesis.username
         )
         if email_notification_setting.favorite:
-            subject = '小論文がお気に入り登録されました'
-            with open(f'{const.SES_TEMPLATE_DIRECTORY}/favorite.txt', 'r') as f:
-                main_template = f.read()
-            main = main_template.format(
+            email_notification = lambda db_favorite_thesis : notification.compose(
+                thesis.username,
+                '小論文がお気に入り登録されました',
+                'favorite',
                 username,
                 favorite.thesis_id
             )
-            utils.send_email_notification(thesis.username, subject, main)
+    crud.create_favorite_thesis(
+        db,
+        thesis_id=favorite.thesis_id,
+        username=username,
+        notification=email_notification
+    )
+    if email_notification is not None:
+        notification.dispatcher.wake()
     return True
 
 
 @router.delete('/favorite/dislike', tags=['favorite'], response_model=bool)
-async def dislike(favorite: schemas.FavoriteThesisDelete, db: Session = Depends(get_db)):
+def dislike(favorite: schemas.FavoriteThesisDelete, db: Session = Depends(get_db)):
     username = utils.get_username(favorite.access_token)
     crud.delete_favorite_thesis(
         db,
@@ -2,14 +2,17 @@ from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-import boto3
-import json
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..sql import crud, models
-from ..dependencies import get_db, get_slave_db
+from ..sql import crud, async_crud
+from ..dependencies import get_db, get_async_slave_db
 from .. import schemas
 from .. import utils
 from .. import const
+from .. import cache
+from .. import serializers
+from .. import compression
+from ..report_alert import aggregator
 from ..route import LoggingContextRoute
 
 router = APIRouter()
@@ -25,60 +28,19 @@ def check(reporter_username: str, target_username: str, detail: str):
         raise HTTPException(status_code=403, detail=detail)
 
 
-def publish_sns_alert(report, type: const.ContentType):
-    dict_report = {'result': 'error'}
-    if isinstance(report, models.UserReport):
-        dict_report = {
-            'id': report.id,
-            'created_at': str(report.created_at),
-        }
-    elif isinstance(report, models.ThemeReport):
-        dict_report = {
-            'id': report.id,
-            'theme_id': report.theme_id,
-            'created_at': str(report.created_at),
-        }
-    elif isinstance(report, models.ThesisReport):
-        dict_report = {
-            'id': report.id,
-            'thesis_id': report.thesis_id,
-            'created_at': str(report.created_at),
-        }
-    elif isinstance(report, models.CommentReport):
-        dict_report = {
-            'id': report.id,
-            'comment_id': report.comment_id,
-            'created_at': str(report.created_at),
-        }
-    jsoned_report = json.dumps(dict_report)
-    type_str = ''
-    if type == const.ContentType.USER:
-        type_str = 'ユーザー'
-    elif type == const.ContentType.THEME:
-        type_str = 'テーマ'
-    elif type == const.ContentType.THESIS:
-        type_str = '小論文'
-    elif type == const.ContentType.COMMENT:
-        type_str = 'コメント'
-    subject = f'{type_str}に対する通報連絡'
-    message = f'{subject}\n{jsoned_report}'
-    client = boto3.client('sns')
-    response = client.publish(
-        TopicArn=const.SNS_TOPIC_ARN,
-        Message=message,
-        Subject=subject
-    )
-    print(response)
-
-
 @router.get('/report/reasons', tags=['report'], response_model=List[schemas.ReportReason])
-async def read_report_reasons(db: Session = Depends(get_slave_db)):
-    reasons = crud.get_report_reasons(db)
-    return reasons
+async def read_report_reasons(db: AsyncSession = Depends(get_async_slave_db)):
+    key = cache.make_key('report_reasons')
+    payload = cache.response_cache.get(key)
+    if payload is None:
+        reasons = await async_crud.get_report_reasons(db)
+        payload = compression.Payload(serializers.dumps(schemas.ReportReason, reasons))
+        cache.response_cache.set(key, payload, tags=[cache.REPORT_REASONS_TAG])
+    return compression.PayloadResponse(payload)
 
 
 @router.post('/report/user', tags=['user', 'report'],  response_model=bool)
-async def report_user(report: schemas.UserReport, db: Session = Depends(get_db)):
+def report_user(report: schemas.UserReport, db: Session = Depends(get_db)):
     reporter_username = utils.get_username(report.access_token)
     check(reporter_username, report.target_username, report.detail)
     user_report = crud.report_user(
@@ -88,12 +50,12 @@ async def report_user(report: schemas.UserReport, db: Session = Depends(get_db))
         report_reason_id=report.report_reason_id,
         detail=report.detail
     )
-    publish_sns_alert(user_report, const.ContentType.USER)
+    aggregator.put(const.ContentType.USER, report.target_username, user_report)
     return True
 
 
 @router.post('/report/theme', tags=['theme', 'report'],  response_model=bool)
-async def report_theme(report: schemas.ThemeReport, db: Session = Depends(get_db)):
+def report_theme(report: schemas.ThemeReport, db: Session = Depends(get_db)):
     reporter_username = utils.get_username(report.access_token)
     theme = crud.get_theme(db, theme_id=report.theme_id)
     if not theme:
@@ -108,12 +70,12 @@ async def report_theme(report: schemas.ThemeReport, db: Session = Depends(get_db
         report_reason_id=report.report_reason_id,
         detail=report.detail
     )
-    publish_sns_alert(theme_report, const.ContentType.THEME)
+    aggregator.put(const.ContentType.THEME, report.theme_id, theme_report)
     return True
 
 
 @router.post('/report/thesis', tags=['thesis', 'report'],  response_model=bool)
-async def report_thesis(report: schemas.ThesisReport, db: Session = Depends(get_db)):
+def report_thesis(report: schemas.ThesisReport, db: Session = Depends(get_db)):
     reporter_username = utils.get_username(report.access_token)
     thesis = crud.get_thesis(db, thesis_id=report.thesis_id)
     if not thesis:
@@ -128,12 +90,12 @@ async def report_thesis(report: schemas.ThesisReport, db: Session = Depends(get_
         report_reason_id=report.report_reason_id,
         detail=report.detail
     )
-    publish_sns_alert(thesis_report, const.ContentType.THESIS)
+    aggregator.put(const.ContentType.THESIS, report.thesis_id, thesis_report)
     return True
 
 
 @router.post('/report/comment', tags=['comment', 'report'], response_model=bool)
-async def report_comment(report: schemas.CommentReport, db: Session = Depends(get_db)):
+def report_comment(report: schemas.CommentReport, db: Session = Depends(get_db)):
     reporter_username = utils.get_username(report.access_token)
     comment = crud.get_comment(db, comment_id=report.comment_id)
     if not comment:
@@ -148,5 +110,5 @@ async def report_comment(report: schemas.CommentReport, db: Session = Depends(ge
         report_reason_id=report.report_reason_id,
         detail=report.detail
     )
-    publish_sns_alert(comment_report, const.ContentType.COMMENT)
+    aggregator.put(const.ContentType.COMMENT, report.comment_id, comment_report)
     return True
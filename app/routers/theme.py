@@ -1,16 +1,21 @@
 from typing import List, Union
 
-from fastapi import APIRouter, Path, Depends, HTTPException, Query
+from fastapi import APIRouter, Path, Depends, Header, HTTPException, Query
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from datetime import datetime
 import pytz
 
-from ..sql import crud
-from ..dependencies import get_db, get_slave_db
+from ..sql import crud, async_crud
+from ..dependencies import get_db, get_async_slave_db
 from .. import schemas
 from .. import utils
 from .. import const
+from .. import cache
+from .. import serializers
+from .. import compression
+from .. import etag
 from ..route import LoggingContextRoute
 
 router = APIRouter()
@@ -46,7 +51,11 @@ def get_themes_parameters(
     }
     return result
 
-@router.get('/themes/{page}', tags=['theme'], response_model=List[schemas.Theme])
+@router.get(
+    '/themes/{page}',
+    tags=['theme'],
+    response_model=Union[List[schemas.Theme], List[schemas.ThemeSummary]]
+)
 async def read_themes(
     page: int = Path(ge=1),
     username: Union[str, None] = None,
@@ -57,7 +66,11 @@ async def read_themes(
     free_words: Union[List[str], None] = Query(default=None),
     sort_type: Union[const.ThemeSortType, None] = None,
     datetime_null_is_earlier: Union[int, None] = None,
-    db: Session = Depends(get_slave_db)
+    cursor: Union[str, None] = None,
+    view: const.ThemeView = const.ThemeView.FULL,
+    top_theses: int = Query(default=0, ge=0, le=const.THEME['summary_top_theses_max']),
+    if_none_match: Union[str, None] = Header(default=None),
+    db: AsyncSession = Depends(get_async_slave_db)
 ):
     limit = 100
     skip = utils.get_skip(limit, page)
@@ -68,8 +81,20 @@ async def read_themes(
         sort_type,
         datetime_null_is_earlier
     )
-    themes = crud.get_themes(
-        db,
+    cursor_values = None
+    if cursor:
+        if parameters['sort_type'] == const.ThemeSortType.RELEVANCE:
+            raise HTTPException(status_code=400, detail='関連度順ではカーソルを指定できません')
+        payload = utils.decode_cursor(cursor)
+        if payload.get('sort_type') != parameters['sort_type'] \
+                or payload.get('datetime_null_is_earlier') != parameters['datetime_null_is_earlier']:
+            raise HTTPException(status_code=400, detail='カーソルと並び順の指定が一致しません')
+        skip = 0
+        cursor_values = utils.check_cursor_values(
+            payload['values'],
+            crud.get_theme_sort_value_types(parameters['sort_type'])
+        )
+    filters = dict(
         skip=skip,
         limit=limit,
         username=username,
@@ -79,9 +104,37 @@ async def read_themes(
         exclude_expired=parameters['exclude_expired'],
         free_words=free_words,
         sort_type=parameters['sort_type'],
-        datetime_null_is_earlier=parameters['datetime_null_is_earlier']
+        datetime_null_is_earlier=parameters['datetime_null_is_earlier'],
+        cursor_values=cursor_values
     )
-    return themes
+    if view == const.ThemeView.SUMMARY:
+        # List pages only need titles and counts; full theses stay on /theme/{theme_id}.
+        themes = await async_crud.get_theme_summaries(db, top_theses=top_theses, **filters)
+        tag = etag.make(schemas.ThemeSummary, top_theses, crud.to_theme_summaries_version(themes))
+        matched = etag.match(if_none_match, tag)
+        if matched is not None:
+            return etag.not_modified(matched)
+        response = serializers.render(schemas.ThemeSummary, themes)
+    else:
+        # The validator query only pays off when there is a tag to check.
+        if if_none_match:
+            tag = etag.make(schemas.Theme, await async_crud.get_themes_version(db, **filters))
+            matched = etag.match(if_none_match, tag)
+            if matched is not None:
+                return etag.not_modified(matched)
+        themes = await async_crud.get_themes(db, **filters)
+        tag = etag.make(schemas.Theme, crud.to_themes_version(themes))
+        response = serializers.render(schemas.Theme, themes)
+    response.headers['etag'] = tag
+    sort_values = crud.get_theme_sort_values(themes[-1], parameters['sort_type']) if themes else None
+    if len(themes) == limit and sort_values is not None:
+        next_cursor = utils.encode_cursor({
+            'sort_type': parameters['sort_type'],
+            'datetime_null_is_earlier': parameters['datetime_null_is_earlier'],
+            'values': sort_values,
+        })
+        response.headers[const.NEXT_CURSOR_HEADER] = next_cursor
+    return response
 
 
 @router.get('/pages/themes', tags=['theme', 'pages'], response_model=schemas.CountAndPages)
@@ -93,7 +146,7 @@ async def read_theme_pages(
     free_words: Union[List[str], None] = Query(default=None),
     sort_type: Union[const.ThemeSortType, None] = None,
     datetime_null_is_earlier: Union[int, None] = None,
-    db: Session = Depends(get_slave_db)
+    db: AsyncSession = Depends(get_async_slave_db)
 ):
     limit = 100
     parameters = get_themes_parameters(
@@ -103,7 +156,7 @@ async def read_theme_pages(
         sort_type,
         datetime_null_is_earlier
     )
-    count = crud.get_themes_count(
+    count = await async_crud.get_themes_count(
         db,
         username=username,
         exclude_not_yet=parameters['exclude_not_yet'],
@@ -125,17 +178,39 @@ async def read_theme_pages(
 
 
 @router.get('/theme/{theme_id}', tags=['theme'], response_model=schemas.Theme)
-async def read_theme(theme_id: int = Path(ge=1), db: Session = Depends(get_slave_db)):
-    theme = crud.get_theme(db, theme_id=theme_id)
-    if theme:
-        return theme
+async def read_theme(
+    theme_id: int = Path(ge=1),
+    if_none_match: Union[str, None] = Header(default=None),
+    db: AsyncSession = Depends(get_async_slave_db)
+):
+    key = cache.make_key('theme', theme_id)
+    payload = cache.response_cache.get(key)
+    if payload is not None:
+        tag = payload.etag
     else:
-        detail = utils.get_not_found_message('テーマ')
-        raise HTTPException(status_code=404, detail=detail)
+        # The validator is read before the body, so a write in between only
+        # leaves the tag older than the body: a later 200, never a stale 304.
+        version = await async_crud.get_theme_version(db, theme_id=theme_id)
+        if version is None:
+            detail = utils.get_not_found_message('テーマ')
+            raise HTTPException(status_code=404, detail=detail)
+        tag = etag.make(schemas.Theme, version)
+    matched = etag.match(if_none_match, tag)
+    if matched is not None:
+        return etag.not_modified(matched)
+    if payload is None:
+        theme = await async_crud.get_theme(db, theme_id=theme_id)
+        if not theme:
+            detail = utils.get_not_found_message('テーマ')
+            raise HTTPException(status_code=404, detail=detail)
+        payload = compression.Payload(serializers.dumps(schemas.Theme, theme), etag=tag)
+        tags = [cache.theme_tag(theme_id)] + [cache.thesis_tag(thesis.id) for thesis in theme.theses]
+        cache.response_cache.set(key, payload, tags=tags)
+    return compression.PayloadResponse(payload)
 
 
 @router.post('/theme/create', tags=['theme'], response_model=schemas.Theme)
-async def create_theme(theme: schemas.ThemeCreate, db: Session = Depends(get_db)):
+def create_theme(theme: schemas.ThemeCreate, db: Session = Depends(get_db)):
     empty_fail_format = '{}を入力してください'
     if not theme.title:
         detail = empty_fail_format.format('タイトル')
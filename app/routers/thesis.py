@@ -1,16 +1,22 @@
 from typing import List, Union
 
-from fastapi import APIRouter, Path, Depends, HTTPException, Query
+from fastapi import APIRouter, Path, Depends, Header, HTTPException, Query
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from datetime import datetime
 import pytz
 
-from ..sql import crud
-from ..dependencies import get_db, get_slave_db
+from ..sql import crud, async_crud
+from ..dependencies import get_db, get_async_slave_db
 from .. import schemas
 from .. import utils
 from .. import const
+from .. import cache
+from .. import serializers
+from .. import compression
+from .. import etag
+from .. import notification
 from ..route import LoggingContextRoute
 
 router = APIRouter()
@@ -29,20 +35,46 @@ async def read_theses(
     theme_id: Union[int, None] = None,
     sort_type: Union[const.ThesisSortType, None] = None,
     free_words: Union[List[str], None] = Query(default=None),
-    db: Session = Depends(get_slave_db)
+    cursor: Union[str, None] = None,
+    if_none_match: Union[str, None] = Header(default=None),
+    db: AsyncSession = Depends(get_async_slave_db)
 ):
     limit = 100
     skip = utils.get_skip(limit, page)
-    theses = crud.get_theses(
-        db,
+    cursor_values = None
+    if cursor:
+        if sort_type == const.ThesisSortType.RELEVANCE:
+            raise HTTPException(status_code=400, detail='関連度順ではカーソルを指定できません')
+        payload = utils.decode_cursor(cursor)
+        if payload.get('sort_type') != sort_type:
+            raise HTTPException(status_code=400, detail='カーソルと並び順の指定が一致しません')
+        skip = 0
+        cursor_values = utils.check_cursor_values(payload['values'], crud.get_thesis_sort_value_types(sort_type))
+    filters = dict(
         skip=skip,
         limit=limit,
         username=username,
         theme_id=theme_id,
         sort_type=sort_type,
-        free_words=free_words
+        free_words=free_words,
+        cursor_values=cursor_values
     )
-    return theses
+    if if_none_match:
+        tag = etag.make(schemas.Thesis, await async_crud.get_theses_version(db, **filters))
+        matched = etag.match(if_none_match, tag)
+        if matched is not None:
+            return etag.not_modified(matched)
+    theses = await async_crud.get_theses(db, **filters)
+    response = serializers.render(schemas.Thesis, theses)
+    response.headers['etag'] = etag.make(schemas.Thesis, crud.to_theses_version(theses))
+    sort_values = crud.get_thesis_sort_values(theses[-1], sort_type) if theses else None
+    if len(theses) == limit and sort_values is not None:
+        next_cursor = utils.encode_cursor({
+            'sort_type': sort_type,
+            'values': sort_values,
+        })
+        response.headers[const.NEXT_CURSOR_HEADER] = next_cursor
+    return response
 
 
 @router.get('/pages/theses', tags=['thesis', 'pages'], response_model=schemas.CountAndPages)
@@ -51,10 +83,10 @@ async def read_thesis_pages(
     theme_id: Union[int, None] = None,
     sort_type: Union[const.ThesisSortType, None] = None,
     free_words: Union[List[str], None] = Query(default=None),
-    db: Session = Depends(get_slave_db)
+    db: AsyncSession = Depends(get_async_slave_db)
 ):
     limit = 100
-    count = crud.get_theses_count(
+    count = await async_crud.get_theses_count(
         db,
         username=username,
         theme_id=theme_id,
@@ -73,17 +105,37 @@ async def read_thesis_pages(
 
 
 @router.get('/thesis/{thesis_id}', tags=['thesis'], response_model=schemas.Thesis)
-async def read_thesis(thesis_id: int = Path(ge=1), db: Session = Depends(get_slave_db)):
-    thesis = crud.get_thesis(db, thesis_id=thesis_id)
-    if thesis:
-        return thesis
+async def read_thesis(
+    thesis_id: int = Path(ge=1),
+    if_none_match: Union[str, None] = Header(default=None),
+    db: AsyncSession = Depends(get_async_slave_db)
+):
+    key = cache.make_key('thesis', thesis_id)
+    payload = cache.response_cache.get(key)
+    if payload is not None:
+        tag = payload.etag
     else:
-        detail = utils.get_not_found_message('小論文')
-        raise HTTPException(status_code=404, detail=detail)
+        version = await async_crud.get_thesis_version(db, thesis_id=thesis_id)
+        if version is None:
+            detail = utils.get_not_found_message('小論文')
+            raise HTTPException(status_code=404, detail=detail)
+        tag = etag.make(schemas.Thesis, version)
+    matched = etag.match(if_none_match, tag)
+    if matched is not None:
+        return etag.not_modified(matched)
+    if payload is None:
+        thesis = await async_crud.get_thesis(db, thesis_id=thesis_id)
+        if not thesis:
+            detail = utils.get_not_found_message('小論文')
+            raise HTTPException(status_code=404, detail=detail)
+        payload = compression.Payload(serializers.dumps(schemas.Thesis, thesis), etag=tag)
+        tags = [cache.theme_tag(thesis.theme_id), cache.thesis_tag(thesis_id)]
+        cache.response_cache.set(key, payload, tags=tags)
+    return compression.PayloadResponse(payload)
 
 
 @router.post('/thesis/create', tags=['thesis'], response_model=schemas.Thesis)
-async def create_thesis(thesis: schemas.ThesisCreate, db: Session = Depends(get_db)):
+def create_thesis(thesis: schemas.ThesisCreate, db: Session = Depends(get_db)):
     theme = crud.get_theme(db, theme_id=thesis.theme_id)
     content_len = len(thesis.content)
     if theme:
@@ -105,26 +157,30 @@ async def create_thesis(thesis: schemas.ThesisCreate, db: Session = Depends(get_
         detail = utils.get_not_found_message('テーマ')
         raise HTTPException(status_code=404, detail=detail)
     username = utils.get_username(thesis.access_token)
-    db_thesis = crud.create_thesis(db, thesis=thesis, username=username)
-    if theme.username != username:
+    email_notification = None
+    # Withdrawn owners are anonymized to None; there is nobody to notify, and
+    # their setting and outbox rows would fail inside this transaction.
+    if theme.username is not None and theme.username != username:
         email_notification_setting = crud.create_or_read_email_notification_setting(
             db,
             username=theme.username
         )
         if email_notification_setting.thesis:
-            subject = 'テーマに小論文が投稿されました'
-            with open(f'{const.SES_TEMPLATE_DIRECTORY}/thesis.txt', 'r') as f:
-                main_template = f.read()
-            summary_len_limit = 97
-            if content_len > summary_len_limit:
-                summary = f'{thesis.content[:summary_len_limit]}...'
-            else:
-                summary = thesis.content
-            main = main_template.format(
+            email_notification = lambda db_thesis : notification.compose(
+                theme.username,
+                'テーマに小論文が投稿されました',
+                'thesis',
                 username,
                 thesis.theme_id,
                 db_thesis.id,
-                summary
+                notification.summarize(thesis.content)
             )
-            utils.send_email_notification(theme.username, subject, main)
+    db_thesis = crud.create_thesis(
+        db,
+        thesis=thesis,
+        username=username,
+        notification=email_notification
+    )
+    if email_notification is not None:
+        notification.dispatcher.wake()
     return db_thesis
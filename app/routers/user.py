@@ -1,11 +1,17 @@
+from typing import Dict, Optional
+
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-import boto3
 from ..sql import crud
 from ..dependencies import get_db
 from .. import schemas
 from .. import utils
+from .. import auth
+from .. import cache
+from .. import aws
+from .. import profiles
 from .. import const
+from .. import withdrawal
 from ..route import LoggingContextRoute
 
 router = APIRouter()
@@ -15,35 +21,42 @@ router.route_class = LoggingContextRoute
 @router.get('/users/{username}', tags=['user'], response_model=str)
 async def get_user_profile(username: str):
     try:
-        client = boto3.client('cognito-idp')
-        user = client.admin_get_user(
-            UserPoolId=const.COGNITO_INFO['user_pool_id'],
-            Username=username
-        )
-        profile = ''
-        for attribute in user['UserAttributes']:
-            if attribute['Name'] == 'profile':
-                profile = attribute['Value']
-                break
-        return profile
+        return await profiles.get_profile(username)
     except Exception as e:
         print(e)
         detail = 'ユーザー情報取得に失敗しました\nユーザーが存在しない可能性がございます'
         raise HTTPException(status_code=404, detail=detail)
 
 
+@router.post('/users/profiles', tags=['user'], response_model=Dict[str, Optional[str]])
+async def get_user_profiles(form: schemas.UserProfilesRead):
+    return await profiles.get_profiles(form.usernames)
+
+
 @router.delete('/user/withdraw', tags=['user'], response_model=bool)
-async def withdraw(form: schemas.Withdraw, db: Session = Depends(get_db)):
-    username = utils.get_username(form.access_token)
-    crud.withdraw(db, username=username)
-    client = boto3.client('cognito-idp')
+def withdraw(form: schemas.Withdraw, db: Session = Depends(get_db)):
+    # A plain def: the Cognito calls and an inline job block, so FastAPI runs
+    # this in its threadpool.
+    username = utils.get_username(form.access_token, strict=True)
+    # The job only commits once Cognito has deleted the user, and from then on
+    # it is resumed until every row is anonymized.
+    job = crud.create_withdrawal_job(db, username=username)
+    client = aws.client('cognito-idp')
     client.delete_user(AccessToken=form.access_token)
     db.commit()
+    auth.forget(form.access_token)
+    cache.profile_cache.invalidate(cache.profile_tag(username))
+    if const.WITHDRAWAL['in_background']:
+        # The worker invalidates the caches once the job finishes.
+        withdrawal.worker.wake()
+    else:
+        crud.run_withdrawal_job(db, job.id, const.WITHDRAWAL['chunk_size'])
+        withdrawal.invalidate(username)
     return True
 
 
 @router.post('/user/email_notification_setting', tags=['user'], response_model=schemas.EmailNotificationSetting)
-async def read_email_notification_setting(
+def read_email_notification_setting(
         form: schemas.EmailNotificationSettingCreate,
         db: Session = Depends(get_db)
 ):
@@ -53,7 +66,7 @@ async def read_email_notification_setting(
 
 
 @router.put('/user/email_notification_setting', tags=['user'], response_model=schemas.EmailNotificationSetting)
-async def update_email_notification_setting(
+def update_email_notification_setting(
         form: schemas.EmailNotificationSettingUpdate,
         db: Session = Depends(get_db)
 ):
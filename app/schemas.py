@@ -1,7 +1,8 @@
 from typing import List, Union
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, conlist
 from pydantic.schema import datetime
+from . import const
 
 
 class CountAndPages(BaseModel):
@@ -17,6 +18,10 @@ class Withdraw(AuthBase):
     pass
 
 
+class UserProfilesRead(BaseModel):
+    usernames: conlist(str, max_items=const.PROFILE['read_batch_max_size'])
+
+
 class FavoriteThesisBase(BaseModel):
     thesis_id: int
 
@@ -25,6 +30,10 @@ class FavoriteThesisRead(FavoriteThesisBase, AuthBase):
     pass
 
 
+class FavoriteThesisBatchRead(AuthBase):
+    thesis_ids: conlist(int, max_items=const.FAVORITE['read_batch_max_size'])
+
+
 class FavoriteThesisCreate(FavoriteThesisBase, AuthBase):
     pass
 
@@ -89,6 +98,22 @@ class Theme(ThemeBase):
         orm_mode = True
 
 
+class ThemeSummary(BaseModel):
+    id: int
+    username: Union[str, None] = None
+    title: str
+    start_datetime: datetime = Field(default=None)
+    expire_datetime: datetime = Field(default=None)
+    min_length: int
+    max_length: int
+    theses_count: int
+    top_thesis_ids: List[int]
+    created_at: datetime
+
+    class Config:
+        orm_mode = True
+
+
 class ReportReason(BaseModel):
     id: int
     reason: str
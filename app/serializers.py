@@ -0,0 +1,42 @@
+from functools import lru_cache
+from fastapi import Response
+from pydantic import BaseModel
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON
+import orjson
+
+MEDIA_TYPE = 'application/json'
+
+
+@lru_cache(maxsize=None)
+def get_fields(model) -> tuple:
+    # (name, default, nested schema, is list) in the model's field order.
+    fields = []
+    for name, field in model.__fields__.items():
+        nested = field.type_ if isinstance(field.type_, type) and issubclass(field.type_, BaseModel) else None
+        if nested is not None and field.shape not in (SHAPE_LIST, SHAPE_SINGLETON):
+            raise TypeError(f'{model.__name__}.{name}: unsupported field shape {field.shape}')
+        fields.append((name, field.default, nested, field.shape == SHAPE_LIST))
+    return tuple(fields)
+
+
+def to_dict(model, obj) -> dict:
+    # Reads ORM rows the way from_orm does, minus the pydantic copy-and-validate
+    # pass. orjson writes naive datetimes the same way isoformat() does, which
+    # is what jsonable_encoder produced.
+    result = {}
+    for name, default, nested, is_list in get_fields(model):
+        value = getattr(obj, name, default)
+        if nested is not None and value is not None:
+            value = [to_dict(nested, item) for item in value] if is_list else to_dict(nested, value)
+        result[name] = value
+    return result
+
+
+def dumps(model, content) -> bytes:
+    if isinstance(content, (list, tuple)):
+        return orjson.dumps([to_dict(model, item) for item in content])
+    return orjson.dumps(to_dict(model, content))
+
+
+def render(model, content) -> Response:
+    return Response(content=dumps(model, content), media_type=MEDIA_TYPE)
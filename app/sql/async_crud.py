@@ -0,0 +1,233 @@
+from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import crud
+from .crud import THEME_LOAD_OPTIONS, THESIS_LOAD_OPTIONS
+from .. import const
+
+
+async def get_themes(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    username: str = None,
+    free_words: List[str] = None,
+    theme_ids: List[int] = None,
+    exclude_not_yet: bool = False,
+    exclude_accepting: bool = False,
+    exclude_expired: bool = False,
+    sort_type: const.ThemeSortType = None,
+    datetime_null_is_earlier: bool = True,
+    cursor_values: list = None
+):
+    result = crud.get_themes_common(
+        username=username,
+        exclude_not_yet=exclude_not_yet,
+        exclude_accepting=exclude_accepting,
+        exclude_expired=exclude_expired,
+        free_words=free_words,
+        skip=skip,
+        limit=limit,
+        theme_ids=theme_ids,
+        sort_type=sort_type,
+        datetime_null_is_earlier=datetime_null_is_earlier,
+        cursor_values=cursor_values
+    ).options(*THEME_LOAD_OPTIONS)
+    result = (await db.execute(result)).scalars().all()
+    return result
+
+
+async def get_theme_summaries(db: AsyncSession, top_theses: int = 0, **kwargs) -> list:
+    rows = (await db.execute(crud.get_themes_common(columns=crud.THEME_SUMMARY_COLUMNS, **kwargs))).all()
+    top_thesis_rows = []
+    if top_theses > 0 and rows:
+        statement = crud.get_top_thesis_ids_common([row.id for row in rows], top_theses)
+        top_thesis_rows = (await db.execute(statement)).all()
+    return crud.to_theme_summaries(rows, top_thesis_rows)
+
+
+async def get_themes_count(
+    db: AsyncSession,
+    username: str = None,
+    free_words: List[str] = None,
+    exclude_not_yet: bool = False,
+    exclude_accepting: bool = False,
+    exclude_expired: bool = False,
+    sort_type: const.ThemeSortType = None,
+    datetime_null_is_earlier: bool = True
+):
+    result = crud.get_themes_common(
+        username=username,
+        exclude_not_yet=exclude_not_yet,
+        exclude_accepting=exclude_accepting,
+        exclude_expired=exclude_expired,
+        free_words=free_words,
+        sort_type=sort_type,
+        datetime_null_is_earlier=datetime_null_is_earlier
+    )
+    count = (await db.execute(crud.count_statement(result))).scalar()
+    return count
+
+
+async def get_theme(db: AsyncSession, theme_id: int, username: str = None):
+    result = crud.get_theme_common(theme_id=theme_id, username=username).options(*THEME_LOAD_OPTIONS)
+    result = (await db.execute(result)).scalars().first()
+    return result
+
+
+async def get_theses(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    username: str = None,
+    theme_id: int = None,
+    free_words: List[str] = None,
+    sort_type: const.ThesisSortType = None,
+    cursor_values: list = None
+):
+    result = crud.get_theses_common(
+        username=username,
+        theme_id=theme_id,
+        skip=skip,
+        limit=limit,
+        sort_type=sort_type,
+        free_words=free_words,
+        cursor_values=cursor_values
+    ).options(*THESIS_LOAD_OPTIONS)
+    result = (await db.execute(result)).scalars().all()
+    return result
+
+
+async def get_theses_count(
+    db: AsyncSession,
+    username: str = None,
+    theme_id: int = None,
+    sort_type: const.ThesisSortType = None,
+    free_words: List[str] = None
+):
+    result = crud.get_theses_common(
+        username=username,
+        theme_id=theme_id,
+        sort_type=sort_type,
+        free_words=free_words
+    )
+    count = (await db.execute(crud.count_statement(result))).scalar()
+    return count
+
+
+async def get_thesis(db: AsyncSession, thesis_id: int, username: str = None):
+    result = crud.get_thesis_common(thesis_id=thesis_id, username=username).options(*THESIS_LOAD_OPTIONS)
+    result = (await db.execute(result)).scalars().first()
+    return result
+
+
+async def get_favorite_thesis(
+    db: AsyncSession,
+    thesis_id: int,
+    username: str
+):
+    result = crud.get_favorite_thesis_common(thesis_id=thesis_id, username=username)
+    favorite_thesis = (await db.execute(result)).scalars().first()
+    return favorite_thesis
+
+
+async def get_favorite_thesis_ids(
+    db: AsyncSession,
+    thesis_ids: List[int],
+    username: str
+):
+    result = crud.get_favorite_thesis_ids_common(thesis_ids=thesis_ids, username=username)
+    thesis_ids = (await db.execute(result)).scalars().all()
+    return thesis_ids
+
+
+async def get_user_favorite_thesis_ids(db: AsyncSession, username: str, limit: int):
+    result = crud.get_user_favorite_thesis_ids_common(username=username, limit=limit)
+    thesis_ids = (await db.execute(result)).scalars().all()
+    return thesis_ids
+
+
+async def get_user_favorites(
+    db: AsyncSession,
+    username: str,
+    skip: int = 0,
+    limit: int = 100
+):
+    result = crud.get_user_favorites_common(
+        username=username,
+        skip=skip,
+        limit=limit
+    ).options(*THESIS_LOAD_OPTIONS)
+    result = (await db.execute(result)).scalars().all()
+    return result
+
+
+async def get_user_favorites_count(db: AsyncSession, username: str):
+    result = crud.get_user_favorites_common(username=username)
+    count = (await db.execute(crud.count_statement(result))).scalar()
+    return count
+
+
+async def get_comments(
+    db: AsyncSession,
+    thesis_id: int,
+    skip: int = 0,
+    limit: int = 100
+):
+    result = crud.get_comments_common(
+        thesis_id=thesis_id,
+        skip=skip,
+        limit=limit
+    )
+    result = (await db.execute(result)).scalars().all()
+    return result
+
+
+async def get_comments_count(db: AsyncSession, thesis_id: int):
+    result = crud.get_comments_common(thesis_id=thesis_id)
+    count = (await db.execute(crud.count_statement(result))).scalar()
+    return count
+
+
+async def get_report_reasons(db: AsyncSession):
+    reasons = (await db.execute(crud.get_report_reasons_common())).scalars().all()
+    return reasons
+
+
+async def get_theme_version(db: AsyncSession, theme_id: int):
+    rows = (await db.execute(crud.get_theme_version_common(theme_id))).all()
+    return crud.to_version(rows, required='theme')
+
+
+async def get_thesis_version(db: AsyncSession, thesis_id: int):
+    rows = (await db.execute(crud.get_thesis_version_common(thesis_id))).all()
+    return crud.to_version(rows, required='thesis')
+
+
+async def get_comments_version(db: AsyncSession, thesis_id: int, skip: int = 0, limit: int = 100) -> list:
+    statement = crud.get_comments_common(thesis_id, skip=skip, limit=limit, columns=crud.COMMENT_VERSION_COLUMNS)
+    return [tuple(row) for row in (await db.execute(statement)).all()]
+
+
+async def get_themes_version(db: AsyncSession, **kwargs) -> list:
+    rows = (await db.execute(crud.get_themes_common(columns=crud.THEME_VERSION_COLUMNS, **kwargs))).all()
+    version = []
+    if rows:
+        version = (await db.execute(crud.get_themes_theses_version_common([row.id for row in rows]))).all()
+    return [tuple(row) for row in rows] + crud.to_version(version)
+
+
+async def get_theses_version(db: AsyncSession, **kwargs) -> list:
+    rows = (await db.execute(crud.get_theses_common(columns=crud.THESIS_VERSION_COLUMNS, **kwargs))).all()
+    version = []
+    if rows:
+        version = (await db.execute(crud.get_favorites_version_common([row.id for row in rows]))).all()
+    return [tuple(row) for row in rows] + crud.to_version(version)
+
+
+async def get_user_favorites_version(db: AsyncSession, **kwargs) -> list:
+    statement = crud.get_user_favorites_common(columns=crud.THESIS_VERSION_COLUMNS, **kwargs)
+    rows = (await db.execute(statement)).all()
+    version = []
+    if rows:
+        version = (await db.execute(crud.get_favorites_version_common([row.id for row in rows]))).all()
+    return [tuple(row) for row in rows] + crud.to_version(version)
@@ -1,14 +1,361 @@
-from typing import List
-from sqlalchemy.orm import Session
+from typing import List, Callable
+from functools import partial
+from types import SimpleNamespace
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 from datetime import datetime
-from sqlalchemy.sql.expression import false, and_, or_, func
+from sqlalchemy.sql.expression import false, and_, or_, func, literal, select, update, delete, union_all
+from sqlalchemy.dialects.mysql import match
 from . import models
 from .. import schemas
 from .. import const
+from .. import cache
+
+
+# Loader options matching the response models: schemas.Theme walks
+# theses -> favorites and schemas.Thesis walks favorites. selectinload keeps a
+# page at one query per level instead of one per row, and works on AsyncSession
+# where lazy loading is unavailable.
+THEME_LOAD_OPTIONS = (
+    selectinload(models.Theme.theses).selectinload(models.Thesis.favorites),
+)
+THESIS_LOAD_OPTIONS = (
+    selectinload(models.Thesis.favorites),
+)
+# Everything schemas.ThemeSummary and the cursor sort values read, without
+# the text-heavy description or any thesis rows.
+THEME_SUMMARY_COLUMNS = (
+    models.Theme.id,
+    models.Theme.username,
+    models.Theme.title,
+    models.Theme.start_datetime,
+    models.Theme.expire_datetime,
+    models.Theme.min_length,
+    models.Theme.max_length,
+    models.Theme.theses_count,
+    models.Theme.created_at,
+)
+# Page rows for list validators: the summary columns cover every cursor sort
+# value, and updated_at covers edits and suspensions.
+THEME_VERSION_COLUMNS = THEME_SUMMARY_COLUMNS + (models.Theme.updated_at,)
+THESIS_VERSION_COLUMNS = (
+    models.Thesis.id,
+    models.Thesis.favorites_count,
+    models.Thesis.created_at,
+    models.Thesis.updated_at,
+)
+COMMENT_VERSION_COLUMNS = (
+    models.Comment.id,
+    models.Comment.created_at,
+    models.Comment.updated_at,
+)
+
+
+def count_statement(statement):
+    result = select(func.count()).select_from(statement.order_by(None).subquery())
+    return result
+
+
+# Counters are bookkeeping, so updated_at is pinned to its current value
+# instead of letting onupdate treat every like or comment as an edit.
+def increment_counter(db: Session, model, counter, *ids: int):
+    statement = update(model)\
+        .where(model.id.in_(ids))\
+        .values({counter: counter + 1, model.updated_at: model.updated_at})\
+        .execution_options(synchronize_session=False)
+    db.execute(statement)
+
+
+def decrement_counter(db: Session, model, counter, *ids: int):
+    # GREATEST keeps a drifted counter from underflowing the unsigned column.
+    statement = update(model)\
+        .where(model.id.in_(ids))\
+        .values({counter: func.greatest(counter, 1) - 1, model.updated_at: model.updated_at})\
+        .execution_options(synchronize_session=False)
+    db.execute(statement)
+
+
+# Validators for conditional GETs. Counters pin updated_at, but every other
+# change to a row moves it, and ids only grow, so count, max(id) and
+# max(updated_at) over a row set change whenever a row is added, removed or
+# edited.
+def get_version_common(part: str, model, *conditions):
+    result = select(
+        literal(part).label('part'),
+        func.count(model.id).label('count'),
+        func.max(model.id).label('max_id'),
+        func.max(func.coalesce(model.updated_at, model.created_at)).label('updated_at'),
+    ).where(*conditions)
+    return result
+
+
+def get_version_part(part: str, rows: list) -> tuple:
+    # In-memory twin of get_version_common over rows that are already loaded,
+    # so a 200 can carry the same tag the validator query would produce.
+    return (
+        part,
+        len(rows),
+        max((row.id for row in rows), default=None),
+        max((row.updated_at or row.created_at for row in rows), default=None),
+    )
+
+
+def to_version(rows: list, required: str = None):
+    # A required part with no rows means the object itself is missing.
+    version = sorted((part, int(count), max_id, updated_at) for part, count, max_id, updated_at in rows)
+    if required is not None and not any(part == required and count for part, count, *_ in version):
+        return None
+    return version
+
+
+def get_theme_version_common(theme_id: int):
+    thesis_ids = select(models.Thesis.id).where(models.Thesis.theme_id == theme_id)
+    return union_all(
+        get_version_common(
+            'theme', models.Theme,
+            models.Theme.id == theme_id, models.Theme.is_suspended == false()
+        ),
+        get_version_common('theses', models.Thesis, models.Thesis.theme_id == theme_id),
+        get_version_common('favorites', models.FavoriteThesis, models.FavoriteThesis.thesis_id.in_(thesis_ids)),
+    )
+
+
+def get_thesis_version_common(thesis_id: int):
+    theme_visible = select(models.Theme.id)\
+        .where(models.Theme.id == models.Thesis.theme_id, models.Theme.is_suspended == false())\
+        .exists()
+    return union_all(
+        get_version_common(
+            'thesis', models.Thesis,
+            models.Thesis.id == thesis_id, models.Thesis.is_suspended == false(), theme_visible
+        ),
+        get_version_common('favorites', models.FavoriteThesis, models.FavoriteThesis.thesis_id == thesis_id),
+    )
+
+
+def get_themes_theses_version_common(theme_ids: List[int]):
+    thesis_ids = select(models.Thesis.id).where(models.Thesis.theme_id.in_(theme_ids))
+    return union_all(
+        get_version_common('theses', models.Thesis, models.Thesis.theme_id.in_(theme_ids)),
+        get_version_common('favorites', models.FavoriteThesis, models.FavoriteThesis.thesis_id.in_(thesis_ids)),
+    )
+
+
+def get_favorites_version_common(thesis_ids: List[int]):
+    return get_version_common('favorites', models.FavoriteThesis, models.FavoriteThesis.thesis_id.in_(thesis_ids))
+
+
+def to_themes_version(themes: list) -> list:
+    # Same shape as async_crud.get_themes_version, built from a loaded page.
+    version = [tuple(getattr(theme, column.key) for column in THEME_VERSION_COLUMNS) for theme in themes]
+    if themes:
+        theses = [thesis for theme in themes for thesis in theme.theses]
+        favorites = [favorite for thesis in theses for favorite in thesis.favorites]
+        version += to_version([get_version_part('theses', theses), get_version_part('favorites', favorites)])
+    return version
+
+
+def to_theses_version(theses: list) -> list:
+    version = [tuple(getattr(thesis, column.key) for column in THESIS_VERSION_COLUMNS) for thesis in theses]
+    if theses:
+        favorites = [favorite for thesis in theses for favorite in thesis.favorites]
+        version += to_version([get_version_part('favorites', favorites)])
+    return version
+
+
+def to_comments_version(comments: list) -> list:
+    # Same shape as async_crud.get_comments_version, built from a loaded page.
+    return [tuple(getattr(comment, column.key) for column in COMMENT_VERSION_COLUMNS) for comment in comments]
+
+
+def to_theme_summaries_version(summaries: list) -> list:
+    # Summaries are already the cheap read, so their own fields are the validator.
+    return [tuple(getattr(summary, name) for name in schemas.ThemeSummary.__fields__) for summary in summaries]
+
+
+def add_email_notification(db: Session, row, notification: Callable = None):
+    # The outbox row commits or rolls back together with the row it announces;
+    # notification.dispatcher ships it to SQS afterwards.
+    if notification is None:
+        return
+    db.flush()
+    email = notification(row)
+    if email is not None:
+        db.add(models.EmailOutbox(**email))
+
+
+def order_by_sort_keys(statement, sort_keys: list):
+    for key, descending in sort_keys:
+        statement = statement.order_by(key.desc() if descending else key.asc())
+    return statement
+
+
+def keyset_condition(sort_keys: list, values: list):
+    # zip() would silently drop unmatched keys; routers check cursors against
+    # the sort's value types, so a mismatch here is a bug.
+    if len(values) != len(sort_keys):
+        raise ValueError(f'{len(values)} cursor values for {len(sort_keys)} sort keys')
+    conditions = []
+    equals = []
+    for (key, descending), value in zip(sort_keys, values):
+        if value is None:
+            # NULLs are grouped by the preceding IS NULL key, so within the
+            # group only the later keys can move the cursor forward.
+            equals.append(key.is_(None))
+            continue
+        conditions.append(and_(*equals, key < value if descending else key > value))
+        equals.append(key == value)
+    return or_(*conditions)
+
+
+def get_nullable_datetime_sort_keys(column, later: bool, datetime_null_is_earlier: bool):
+    null_first = datetime_null_is_earlier != later
+    result = [
+        (column.is_(None), null_first),
+        (column, later),
+        (models.Theme.id, later),
+    ]
+    return result
+
+
+THEME_SEARCH_COLUMNS = (models.Theme.username, models.Theme.title, models.Theme.description)
+THESIS_SEARCH_COLUMNS = (models.Thesis.username, models.Thesis.content, models.Thesis.works_cited)
+
+
+def split_free_words(free_words: List[str]):
+    indexed_words = []
+    short_words = []
+    for free_word in free_words or []:
+        # Double quotes would end the boolean-mode phrase early.
+        free_word = free_word.replace('"', ' ').strip()
+        if not free_word:
+            continue
+        if const.SEARCH['backend'] == 'fulltext' and len(free_word) >= const.SEARCH['ngram_token_size']:
+            indexed_words.append(free_word)
+        else:
+            short_words.append(free_word)
+    return indexed_words, short_words
+
+
+def get_fulltext_match(columns: tuple, indexed_words: List[str]):
+    against = ' '.join(f'+"{word}"' for word in indexed_words)
+    return match(*columns, against=against).in_boolean_mode()
+
+
+def get_free_words_conditions(columns: tuple, free_words: List[str]) -> list:
+    indexed_words, short_words = split_free_words(free_words)
+    conditions = []
+    if indexed_words:
+        conditions.append(get_fulltext_match(columns, indexed_words))
+    # Words shorter than the ngram token size never reach the index,
+    # so they keep the old substring semantics.
+    for short_word in short_words:
+        like = f'%{short_word}%'
+        conditions.append(or_(*[column.like(like) for column in columns]))
+    return conditions
+
+
+def get_free_words_relevance(columns: tuple, free_words: List[str]):
+    indexed_words, _ = split_free_words(free_words)
+    if not indexed_words:
+        return None
+    return get_fulltext_match(columns, indexed_words)
+
+
+def get_theme_sort_keys(
+    sort_type: const.ThemeSortType,
+    datetime_null_is_earlier: bool = True,
+    free_words: List[str] = None
+):
+    if sort_type == const.ThemeSortType.RELEVANCE:
+        relevance = get_free_words_relevance(THEME_SEARCH_COLUMNS, free_words)
+        if relevance is None:
+            sort_type = const.ThemeSortType.NEWER
+        else:
+            return [(relevance, True), (models.Theme.id, True)]
+    if sort_type == const.ThemeSortType.NEWER:
+        return [(models.Theme.created_at, True), (models.Theme.id, True)]
+    elif sort_type == const.ThemeSortType.OLDER:
+        return [(models.Theme.created_at, False), (models.Theme.id, False)]
+    elif sort_type == const.ThemeSortType.NUM_OF_THESES:
+        return [(models.Theme.theses_count, True), (models.Theme.id, True)]
+    elif sort_type == const.ThemeSortType.START_EARLIER:
+        return get_nullable_datetime_sort_keys(models.Theme.start_datetime, False, datetime_null_is_earlier)
+    elif sort_type == const.ThemeSortType.START_LATER:
+        return get_nullable_datetime_sort_keys(models.Theme.start_datetime, True, datetime_null_is_earlier)
+    elif sort_type == const.ThemeSortType.EXPIRE_EARLIER:
+        return get_nullable_datetime_sort_keys(models.Theme.expire_datetime, False, datetime_null_is_earlier)
+    elif sort_type == const.ThemeSortType.EXPIRE_LATER:
+        return get_nullable_datetime_sort_keys(models.Theme.expire_datetime, True, datetime_null_is_earlier)
+    return [(models.Theme.id, False)]
+
+
+def get_theme_sort_values(theme: models.Theme, sort_type: const.ThemeSortType) -> list:
+    if sort_type == const.ThemeSortType.RELEVANCE:
+        return None
+    elif sort_type in (const.ThemeSortType.NEWER, const.ThemeSortType.OLDER):
+        return [theme.created_at, theme.id]
+    elif sort_type == const.ThemeSortType.NUM_OF_THESES:
+        return [theme.theses_count, theme.id]
+    elif sort_type in (const.ThemeSortType.START_EARLIER, const.ThemeSortType.START_LATER):
+        return [int(theme.start_datetime is None), theme.start_datetime, theme.id]
+    elif sort_type in (const.ThemeSortType.EXPIRE_EARLIER, const.ThemeSortType.EXPIRE_LATER):
+        return [int(theme.expire_datetime is None), theme.expire_datetime, theme.id]
+    return [theme.id]
+
+
+def get_theme_sort_value_types(sort_type: const.ThemeSortType) -> tuple:
+    # What get_theme_sort_values returns, for checking cursors sent back by clients.
+    if sort_type in (const.ThemeSortType.NEWER, const.ThemeSortType.OLDER):
+        return (datetime, int)
+    elif sort_type == const.ThemeSortType.NUM_OF_THESES:
+        return (int, int)
+    elif sort_type in (
+        const.ThemeSortType.START_EARLIER,
+        const.ThemeSortType.START_LATER,
+        const.ThemeSortType.EXPIRE_EARLIER,
+        const.ThemeSortType.EXPIRE_LATER,
+    ):
+        return (int, (datetime, type(None)), int)
+    return (int,)
+
+
+def get_thesis_sort_keys(sort_type: const.ThesisSortType, free_words: List[str] = None):
+    if sort_type == const.ThesisSortType.RELEVANCE:
+        relevance = get_free_words_relevance(THESIS_SEARCH_COLUMNS, free_words)
+        if relevance is None:
+            sort_type = const.ThesisSortType.NEWER
+        else:
+            return [(relevance, True), (models.Thesis.id, True)]
+    if sort_type == const.ThesisSortType.NEWER:
+        return [(models.Thesis.created_at, True), (models.Thesis.id, True)]
+    elif sort_type == const.ThesisSortType.OLDER:
+        return [(models.Thesis.created_at, False), (models.Thesis.id, False)]
+    elif sort_type == const.ThesisSortType.NUM_OF_FAVORITES:
+        return [(models.Thesis.favorites_count, True), (models.Thesis.id, True)]
+    return [(models.Thesis.id, False)]
+
+
+def get_thesis_sort_values(thesis: models.Thesis, sort_type: const.ThesisSortType) -> list:
+    if sort_type == const.ThesisSortType.RELEVANCE:
+        return None
+    elif sort_type in (const.ThesisSortType.NEWER, const.ThesisSortType.OLDER):
+        return [thesis.created_at, thesis.id]
+    elif sort_type == const.ThesisSortType.NUM_OF_FAVORITES:
+        return [thesis.favorites_count, thesis.id]
+    return [thesis.id]
+
+
+def get_thesis_sort_value_types(sort_type: const.ThesisSortType) -> tuple:
+    # What get_thesis_sort_values returns, for checking cursors sent back by clients.
+    if sort_type in (const.ThesisSortType.NEWER, const.ThesisSortType.OLDER):
+        return (datetime, int)
+    elif sort_type == const.ThesisSortType.NUM_OF_FAVORITES:
+        return (int, int)
+    return (int,)
 
 
 def get_themes_common(
-    db: Session,
     username: str,
     exclude_not_yet: bool,
     exclude_accepting: bool,
@@ -18,18 +365,11 @@ def get_themes_common(
     skip: int = 0,
     limit: int = 0,
     theme_ids: List[int] = None,
-    datetime_null_is_earlier: bool = True
+    datetime_null_is_earlier: bool = True,
+    cursor_values: list = None,
+    columns: tuple = None
 ):
-    result = db\
-        .query(models.Theme)\
-        .join(
-            models.Thesis,
-            and_(
-                models.Thesis.theme_id == models.Theme.id,
-                models.Thesis.is_suspended == false()
-            ),
-            isouter = True
-        )
+    result = select(*columns) if columns else select(models.Theme)
     conditions = [
         models.Theme.is_suspended == false(),
     ]
@@ -60,45 +400,12 @@ def get_themes_common(
             models.Theme.expire_datetime > now
         ))
     if free_words:
-        for free_word in free_words:
-            like = f'%{free_word}%'
-            conditions.append(or_(
-                models.Theme.username.like(like),
-                models.Theme.title.like(like),
-                models.Theme.description.like(like)
-            ))
-    result = result.filter(*conditions).group_by(models.Theme.id)
-    if sort_type is not None:
-        if sort_type == const.ThemeSortType.NEWER:
-            result = result.order_by(models.Theme.created_at.desc())
-        elif sort_type == const.ThemeSortType.OLDER:
-            result = result.order_by(models.Theme.created_at.asc())
-        elif sort_type == const.ThemeSortType.NUM_OF_THESES:
-            result = result.order_by(func.count(models.Thesis.id).desc())
-        elif sort_type == const.ThemeSortType.START_EARLIER:
-            if datetime_null_is_earlier:
-                result = result.order_by(models.Theme.start_datetime.is_(None).desc())
-            else:
-                result = result.order_by(models.Theme.start_datetime.is_(None).asc())
-            result = result.order_by(models.Theme.start_datetime.asc())
-        elif sort_type == const.ThemeSortType.START_LATER:
-            if datetime_null_is_earlier:
-                result = result.order_by(models.Theme.start_datetime.is_(None).asc())
-            else:
-                result = result.order_by(models.Theme.start_datetime.is_(None).desc())
-            result = result.order_by(models.Theme.start_datetime.desc())
-        elif sort_type == const.ThemeSortType.EXPIRE_EARLIER:
-            if datetime_null_is_earlier:
-                result = result.order_by(models.Theme.expire_datetime.is_(None).desc())
-            else:
-                result = result.order_by(models.Theme.expire_datetime.is_(None).asc())
-            result = result.order_by(models.Theme.expire_datetime.asc())
-        elif sort_type == const.ThemeSortType.EXPIRE_LATER:
-            if datetime_null_is_earlier:
-                result = result.order_by(models.Theme.expire_datetime.is_(None).asc())
-            else:
-                result = result.order_by(models.Theme.expire_datetime.is_(None).desc())
-            result = result.order_by(models.Theme.expire_datetime.desc())
+        conditions.extend(get_free_words_conditions(THEME_SEARCH_COLUMNS, free_words))
+    result = result.where(*conditions)
+    sort_keys = get_theme_sort_keys(sort_type, datetime_null_is_earlier, free_words)
+    if cursor_values is not None:
+        result = result.where(keyset_condition(sort_keys, cursor_values))
+    result = order_by_sort_keys(result, sort_keys)
     result = result.offset(skip)
     if limit > 0:
         result = result.limit(limit)
@@ -116,10 +423,10 @@ def get_themes(
     exclude_accepting: bool = False,
     exclude_expired: bool = False,
     sort_type: const.ThemeSortType = None,
-    datetime_null_is_earlier: bool = True
+    datetime_null_is_earlier: bool = True,
+    cursor_values: list = None
 ):
     result = get_themes_common(
-        db,
         username=username,
         exclude_not_yet=exclude_not_yet,
         exclude_accepting=exclude_accepting,
@@ -129,12 +436,43 @@ def get_themes(
         limit=limit,
         theme_ids=theme_ids,
         sort_type=sort_type,
-        datetime_null_is_earlier=datetime_null_is_earlier
-    )
-    result = result.all()
+        datetime_null_is_earlier=datetime_null_is_earlier,
+        cursor_values=cursor_values
+    ).options(*THEME_LOAD_OPTIONS)
+    result = db.execute(result).scalars().all()
     return result
 
 
+def get_top_thesis_ids_common(theme_ids: List[int], limit: int):
+    # One index-ordered LIMIT per theme over ix_theses_theme_favorites instead
+    # of ranking every thesis of every theme on the page.
+    return union_all(*[
+        select(models.Thesis.theme_id, models.Thesis.id)
+        .where(models.Thesis.theme_id == theme_id, models.Thesis.is_suspended == false())
+        .order_by(models.Thesis.favorites_count.desc(), models.Thesis.id.desc())
+        .limit(limit)
+        for theme_id in theme_ids
+    ])
+
+
+def to_theme_summaries(rows: list, top_thesis_rows: list) -> list:
+    top_thesis_ids = {}
+    for theme_id, thesis_id in top_thesis_rows:
+        top_thesis_ids.setdefault(theme_id, []).append(thesis_id)
+    return [
+        SimpleNamespace(**row._mapping, top_thesis_ids=top_thesis_ids.get(row.id, []))
+        for row in rows
+    ]
+
+
+def get_theme_summaries(db: Session, top_theses: int = 0, **kwargs) -> list:
+    rows = db.execute(get_themes_common(columns=THEME_SUMMARY_COLUMNS, **kwargs)).all()
+    top_thesis_rows = []
+    if top_theses > 0 and rows:
+        top_thesis_rows = db.execute(get_top_thesis_ids_common([row.id for row in rows], top_theses)).all()
+    return to_theme_summaries(rows, top_thesis_rows)
+
+
 def get_themes_count(
     db: Session,
     username: str = None,
@@ -146,7 +484,6 @@ def get_themes_count(
     datetime_null_is_earlier: bool = True
 ):
     result = get_themes_common(
-        db,
         username=username,
         exclude_not_yet=exclude_not_yet,
         exclude_accepting=exclude_accepting,
@@ -155,19 +492,25 @@ def get_themes_count(
         sort_type=sort_type,
         datetime_null_is_earlier=datetime_null_is_earlier
     )
-    count = result.count()
+    count = db.execute(count_statement(result)).scalar()
     return count
 
 
-def get_theme(db: Session, theme_id: int, username: str = None):
-    result = db.query(models.Theme)
+def get_theme_common(theme_id: int, username: str = None):
+    result = select(models.Theme)
     conditions = [
         models.Theme.id == theme_id,
         models.Theme.is_suspended == false(),
     ]
     if username:
         conditions.append(models.Theme.username == username)
-    result = result.filter(*conditions).first()
+    result = result.where(*conditions).limit(1)
+    return result
+
+
+def get_theme(db: Session, theme_id: int, username: str = None):
+    result = get_theme_common(theme_id=theme_id, username=username)
+    result = db.execute(result).scalars().first()
     return result
 
 
@@ -184,31 +527,28 @@ def create_theme(db: Session, theme: schemas.ThemeCreate, username: str):
     db.add(db_theme)
     db.commit()
     db.refresh(db_theme)
+    # A new theme has no theses yet; don't spend a lazy load proving it.
+    set_committed_value(db_theme, 'theses', [])
     return db_theme
 
 
 def get_theses_common(
-    db: Session,
     username: str,
     theme_id: int,
     free_words: List[str],
     sort_type: const.ThesisSortType,
     skip: int = 0,
-    limit: int = 0
+    limit: int = 0,
+    cursor_values: list = None,
+    columns: tuple = None
 ):
-    result = db\
-        .query(models.Thesis)\
+    result = (select(*columns) if columns else select(models.Thesis))\
         .join(
             models.Theme,
             and_(
                 models.Theme.id == models.Thesis.theme_id,
                 models.Theme.is_suspended == false()
             )
-        )\
-        .join(
-            models.FavoriteThesis,
-            models.FavoriteThesis.thesis_id == models.Thesis.id,
-            isouter = True
         )
     conditions = [
         models.Thesis.is_suspended == false(),
@@ -218,21 +558,12 @@ def get_theses_common(
     if theme_id:
         conditions.append(models.Thesis.theme_id == theme_id)
     if free_words:
-        for free_word in free_words:
-            like = f'%{free_word}%'
-            conditions.append(or_(
-                models.Thesis.username.like(like),
-                models.Thesis.content.like(like),
-                models.Thesis.works_cited.like(like)
-            ))
-    result = result.filter(*conditions).group_by(models.Thesis.id)
-    if sort_type is not None:
-        if sort_type == const.ThesisSortType.NEWER:
-            result = result.order_by(models.Thesis.created_at.desc())
-        elif sort_type == const.ThesisSortType.OLDER:
-            result = result.order_by(models.Thesis.created_at.asc())
-        elif sort_type == const.ThesisSortType.NUM_OF_FAVORITES:
-            result = result.order_by(func.count(models.FavoriteThesis.id).desc())
+        conditions.extend(get_free_words_conditions(THESIS_SEARCH_COLUMNS, free_words))
+    result = result.where(*conditions)
+    sort_keys = get_thesis_sort_keys(sort_type, free_words)
+    if cursor_values is not None:
+        result = result.where(keyset_condition(sort_keys, cursor_values))
+    result = order_by_sort_keys(result, sort_keys)
     result = result.offset(skip)
     if limit > 0:
         result = result.limit(limit)
@@ -246,18 +577,19 @@ def get_theses(
     username: str = None,
     theme_id: int = None,
     free_words: List[str] = None,
-    sort_type: const.ThesisSortType = None
+    sort_type: const.ThesisSortType = None,
+    cursor_values: list = None
 ):
     result = get_theses_common(
-        db,
         username=username,
         theme_id=theme_id,
         skip=skip,
         limit=limit,
         sort_type=sort_type,
-        free_words=free_words
-    )
-    result = result.all()
+        free_words=free_words,
+        cursor_values=cursor_values
+    ).options(*THESIS_LOAD_OPTIONS)
+    result = db.execute(result).scalars().all()
     return result
 
 
@@ -269,19 +601,17 @@ def get_theses_count(
     free_words: List[str] = None
 ):
     result = get_theses_common(
-        db,
         username=username,
         theme_id=theme_id,
         sort_type=sort_type,
         free_words=free_words
     )
-    count = result.count()
+    count = db.execute(count_statement(result)).scalar()
     return count
 
 
-def get_thesis(db: Session, thesis_id: int, username: str = None):
-    result = db\
-        .query(models.Thesis)\
+def get_thesis_common(thesis_id: int, username: str = None):
+    result = select(models.Thesis)\
         .join(
             models.Theme,
             and_(
@@ -295,11 +625,22 @@ def get_thesis(db: Session, thesis_id: int, username: str = None):
     ]
     if username:
         conditions.append(models.Thesis.username == username)
-    result = result.filter(*conditions).first()
+    result = result.where(*conditions).limit(1)
+    return result
+
+
+def get_thesis(db: Session, thesis_id: int, username: str = None):
+    result = get_thesis_common(thesis_id=thesis_id, username=username)
+    result = db.execute(result).scalars().first()
     return result
 
 
-def create_thesis(db: Session, thesis: schemas.ThesisCreate, username: str):
+def create_thesis(
+    db: Session,
+    thesis: schemas.ThesisCreate,
+    username: str,
+    notification: Callable[[models.Thesis], dict] = None
+):
     db_thesis = models.Thesis(
         username=username,
         content=thesis.content,
@@ -307,35 +648,66 @@ def create_thesis(db: Session, thesis: schemas.ThesisCreate, username: str):
         works_cited=thesis.works_cited
     )
     db.add(db_thesis)
+    increment_counter(db, models.Theme, models.Theme.theses_count, thesis.theme_id)
+    add_email_notification(db, db_thesis, notification)
     db.commit()
+    cache.response_cache.invalidate(cache.theme_tag(thesis.theme_id))
     db.refresh(db_thesis)
+    set_committed_value(db_thesis, 'favorites', [])
     return db_thesis
 
 
+def get_favorite_thesis_common(thesis_id: int, username: str):
+    conditions = [
+        models.FavoriteThesis.thesis_id == thesis_id,
+        models.FavoriteThesis.username == username
+    ]
+    result = select(models.FavoriteThesis).where(*conditions).limit(1)
+    return result
+
+
 def get_favorite_thesis(
     db: Session,
     thesis_id: int,
     username: str
 ):
+    result = get_favorite_thesis_common(thesis_id=thesis_id, username=username)
+    favorite_thesis = db.execute(result).scalars().first()
+    return favorite_thesis
+
+
+def get_favorite_thesis_ids_common(thesis_ids: List[int], username: str):
     conditions = [
-        models.FavoriteThesis.thesis_id == thesis_id,
-        models.FavoriteThesis.username == username
+        models.FavoriteThesis.username == username,
+        models.FavoriteThesis.thesis_id.in_(thesis_ids)
     ]
-    favorite_thesis = db.query(models.FavoriteThesis).filter(*conditions).first()
-    return favorite_thesis
+    result = select(models.FavoriteThesis.thesis_id).where(*conditions)
+    return result
+
+
+def get_user_favorite_thesis_ids_common(username: str, limit: int):
+    result = select(models.FavoriteThesis.thesis_id)\
+        .where(models.FavoriteThesis.username == username)\
+        .limit(limit)
+    return result
 
 
 def create_favorite_thesis(
     db: Session,
     thesis_id: int,
-    username: str
+    username: str,
+    notification: Callable[[models.FavoriteThesis], dict] = None
 ):
     db_favorite_thesis = models.FavoriteThesis(
         thesis_id=thesis_id,
         username=username
     )
     db.add(db_favorite_thesis)
+    increment_counter(db, models.Thesis, models.Thesis.favorites_count, thesis_id)
+    add_email_notification(db, db_favorite_thesis, notification)
     db.commit()
+    cache.response_cache.invalidate(cache.thesis_tag(thesis_id))
+    cache.liked_cache.invalidate(cache.liked_tag(username))
     db.refresh(db_favorite_thesis)
     return db_favorite_thesis
 
@@ -351,17 +723,19 @@ def delete_favorite_thesis(
         username=username
     )
     db.delete(favorite_thesis)
+    decrement_counter(db, models.Thesis, models.Thesis.favorites_count, thesis_id)
     db.commit()
+    cache.response_cache.invalidate(cache.thesis_tag(thesis_id))
+    cache.liked_cache.invalidate(cache.liked_tag(username))
 
 
 def get_user_favorites_common(
-    db: Session,
     username: str,
     skip: int = 0,
-    limit: int = 0
+    limit: int = 0,
+    columns: tuple = None
 ):
-    result = db \
-        .query(models.Thesis) \
+    result = (select(*columns) if columns else select(models.Thesis)) \
         .join(
             models.FavoriteThesis,
             and_(
@@ -376,7 +750,7 @@ def get_user_favorites_common(
                 models.Theme.is_suspended == false()
             )
         ) \
-        .filter(models.Thesis.is_suspended == false())\
+        .where(models.Thesis.is_suspended == false())\
         .order_by(models.FavoriteThesis.created_at.desc()) \
         .offset(skip)
     if limit > 0:
@@ -391,36 +765,32 @@ def get_user_favorites(
     limit: int = 100
 ):
     result = get_user_favorites_common(
-        db,
         username=username,
         skip=skip,
         limit=limit
-    )
-    result = result.all()
+    ).options(*THESIS_LOAD_OPTIONS)
+    result = db.execute(result).scalars().all()
     return result
 
 
 def get_user_favorites_count(db: Session, username: str):
-    result = get_user_favorites_common(
-        db,
-        username=username
-    )
-    count = result.count()
+    result = get_user_favorites_common(username=username)
+    count = db.execute(count_statement(result)).scalar()
     return count
 
 
 def get_comments_common(
-    db: Session,
     thesis_id: int,
     skip: int = 0,
-    limit: int = 0
+    limit: int = 0,
+    columns: tuple = None
 ):
-    result = db.query(models.Comment)
+    result = select(*columns) if columns else select(models.Comment)
     conditions = [
         models.Comment.is_suspended == false(),
         models.Comment.thesis_id == thesis_id,
     ]
-    result = result.filter(*conditions).offset(skip)
+    result = result.where(*conditions).order_by(models.Comment.id).offset(skip)
     if limit > 0:
         result = result.limit(limit)
     return result
@@ -433,21 +803,17 @@ def get_comments(
     limit: int = 100
 ):
     result = get_comments_common(
-        db,
         thesis_id=thesis_id,
         skip=skip,
         limit=limit
     )
-    result = result.all()
+    result = db.execute(result).scalars().all()
     return result
 
 
 def get_comments_count(db: Session, thesis_id: int):
-    result = get_comments_common(
-        db,
-        thesis_id=thesis_id
-    )
-    count = result.count()
+    result = get_comments_common(thesis_id=thesis_id)
+    count = db.execute(count_statement(result)).scalar()
     return count
 
 
@@ -456,33 +822,109 @@ def get_comment(db: Session, comment_id: int):
     return result
 
 
-def create_comment(db: Session, thesis_id: int, username: str, content: str):
+def create_comment(
+    db: Session,
+    thesis_id: int,
+    username: str,
+    content: str,
+    notification: Callable[[models.Comment], dict] = None
+):
     comment = models.Comment(thesis_id=thesis_id, username=username, content=content)
     db.add(comment)
+    increment_counter(db, models.Thesis, models.Thesis.comments_count, thesis_id)
+    add_email_notification(db, comment, notification)
     db.commit()
+    cache.response_cache.invalidate(cache.comments_tag(thesis_id))
     db.refresh(comment)
     return comment
 
 
-def withdraw(db: Session, username: str):
-    theses = db.query(models.Thesis).filter(models.Thesis.username == username).all()
-    for thesis in theses:
-        thesis.username = None
-    themes = db.query(models.Theme).filter(models.Theme.username == username).all()
-    for theme in themes:
-        theme.username = None
-    favorite_theses = db.query(models.FavoriteThesis).filter(models.FavoriteThesis.username == username).all()
-    for favorite_thesis in favorite_theses:
-        db.delete(favorite_thesis)
-    comments = db.query(models.Comment).filter(models.Comment.username == username).all()
-    for comment in comments:
-        comment.username = None
+def anonymize_chunk(db: Session, username: str, last_id: int, chunk_size: int, model) -> List[int]:
+    ids = db.execute(
+        select(model.id)
+        .where(model.username == username, model.id > last_id)
+        .order_by(model.id)
+        .limit(chunk_size)
+    ).scalars().all()
+    if ids:
+        statement = update(model)\
+            .where(model.id.between(ids[0], ids[-1]), model.username == username)\
+            .values(username=None)\
+            .execution_options(synchronize_session=False)
+        db.execute(statement)
+    return ids
+
+
+def delete_favorite_theses_chunk(db: Session, username: str, last_id: int, chunk_size: int) -> List[int]:
+    rows = db.execute(
+        select(models.FavoriteThesis.id, models.FavoriteThesis.thesis_id)
+        .where(models.FavoriteThesis.username == username, models.FavoriteThesis.id > last_id)
+        .order_by(models.FavoriteThesis.id)
+        .limit(chunk_size)
+    ).all()
+    if rows:
+        statement = delete(models.FavoriteThesis)\
+            .where(
+                models.FavoriteThesis.id.between(rows[0].id, rows[-1].id),
+                models.FavoriteThesis.username == username
+            )\
+            .execution_options(synchronize_session=False)
+        db.execute(statement)
+        thesis_ids = [row.thesis_id for row in rows]
+        decrement_counter(db, models.Thesis, models.Thesis.favorites_count, *thesis_ids)
+    return [row.id for row in rows]
+
+
+WITHDRAWAL_STEPS = (
+    partial(anonymize_chunk, model=models.Thesis),
+    partial(anonymize_chunk, model=models.Theme),
+    delete_favorite_theses_chunk,
+    partial(anonymize_chunk, model=models.Comment),
+)
+
+
+def create_withdrawal_job(db: Session, username: str) -> models.WithdrawalJob:
+    job = models.WithdrawalJob(username=username, step=0, last_id=0, processed=0)
+    db.add(job)
+    db.flush()
+    return job
+
+
+def run_withdrawal_chunk(db: Session, job_id: int, chunk_size: int) -> bool:
+    # The job row is locked for the chunk and its progress commits with it,
+    # so a crashed or concurrent run resumes exactly where this one stopped.
+    job = db.execute(
+        select(models.WithdrawalJob).where(models.WithdrawalJob.id == job_id).with_for_update()
+    ).scalars().one()
+    if job.finished_at is None:
+        ids = WITHDRAWAL_STEPS[job.step](db, job.username, job.last_id, chunk_size)
+        job.processed = job.processed + len(ids)
+        if len(ids) < chunk_size:
+            job.step = job.step + 1
+            job.last_id = 0
+        else:
+            job.last_id = ids[-1]
+        if job.step >= len(WITHDRAWAL_STEPS):
+            job.finished_at = datetime.now()
+    finished = job.finished_at is not None
+    db.commit()
+    return finished
+
+
+def run_withdrawal_job(db: Session, job_id: int, chunk_size: int):
+    while not run_withdrawal_chunk(db, job_id, chunk_size):
+        pass
+
+
+def get_report_reasons_common():
+    result = select(models.ReportReason)
+    return result
 
 
 def get_report_reasons(
         db: Session
 ):
-    reasons = db.query(models.ReportReason).all()
+    reasons = db.execute(get_report_reasons_common()).scalars().all()
     return reasons
 
 
@@ -1,11 +1,15 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine
 import os
 import json
+from .replicas import Replica, ReplicaRouter, ReplicaHealthChecker
+from .. import const
 
 DB_INFO = json.loads(os.environ['DB_INFO'])
 DATEBASE_URL_FORMAT = 'mysql://{}:{}@{}:{}/{}?charset=utf8mb4'
+ASYNC_DATEBASE_URL_FORMAT = 'mysql+aiomysql://{}:{}@{}:{}/{}?charset=utf8mb4'
 MASTER_DATABASE_URL = DATEBASE_URL_FORMAT.format(
     DB_INFO['username'],
     DB_INFO['password'],
@@ -14,17 +18,59 @@ MASTER_DATABASE_URL = DATEBASE_URL_FORMAT.format(
     DB_INFO['database']
 )
 
-SLAVE_DATABASE_URL = DATEBASE_URL_FORMAT.format(
+ASYNC_MASTER_DATABASE_URL = ASYNC_DATEBASE_URL_FORMAT.format(
     DB_INFO['username'],
     DB_INFO['password'],
-    DB_INFO['slave_host'],
+    DB_INFO['host'],
     int(DB_INFO['port']),
     DB_INFO['database']
 )
 
 engine = create_engine(MASTER_DATABASE_URL)
-slave_engine = create_engine(SLAVE_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-SessionLocal_slave = sessionmaker(autocommit=False, autoflush=False, bind=slave_engine)
+
+async_engine = create_async_engine(ASYNC_MASTER_DATABASE_URL, pool_recycle=3600)
+
+
+def get_replica_infos() -> list:
+    # DB_INFO['slave_hosts'] lists replicas as host strings or
+    # {"host", "port", "weight"} objects; a single slave_host still works.
+    if 'slave_hosts' in DB_INFO:
+        replica_infos = DB_INFO['slave_hosts']
+    else:
+        replica_infos = [DB_INFO['slave_host']]
+    return [
+        replica_info if isinstance(replica_info, dict) else {'host': replica_info}
+        for replica_info in replica_infos
+    ]
+
+
+def create_replica(index: int, replica_info: dict) -> Replica:
+    host = replica_info['host']
+    port = int(replica_info.get('port', DB_INFO['port']))
+    url_parameters = (DB_INFO['username'], DB_INFO['password'], host, port, DB_INFO['database'])
+    connect_args = {'connect_timeout': const.DB_REPLICAS['connect_timeout']}
+    # Positional names keep hosts out of stats and metric labels.
+    return Replica(
+        f'replica{index}',
+        create_engine(DATEBASE_URL_FORMAT.format(*url_parameters), connect_args=connect_args),
+        create_async_engine(
+            ASYNC_DATEBASE_URL_FORMAT.format(*url_parameters),
+            pool_recycle=3600,
+            connect_args=connect_args
+        ),
+        weight=float(replica_info.get('weight', 1))
+    )
+
+
+replica_router = ReplicaRouter(
+    Replica('master', engine, async_engine),
+    [create_replica(index, replica_info) for (index, replica_info) in enumerate(get_replica_infos(), 1)]
+)
+replica_checker = ReplicaHealthChecker(
+    replica_router,
+    interval=const.DB_REPLICAS['health_check_interval'],
+    max_lag=const.DB_REPLICAS['max_replication_lag']
+)
 
 Base = declarative_base()
@@ -0,0 +1,285 @@
+import argparse
+from datetime import datetime, timedelta
+import random
+import sys
+from sqlalchemy import insert, select, func
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from . import crud, models
+from .. import const
+
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain)
+def visit_explain(element, compiler, **kw):
+    return f'EXPLAIN {compiler.process(element.statement, **kw)}'
+
+
+def seed(
+    connection: Connection,
+    themes: int = 2000,
+    theses_per_theme: int = 25,
+    favorites_per_thesis: int = 3,
+    comments_per_thesis: int = 2,
+    users: int = 500
+):
+    # Enough rows that the optimizer prefers indexes to scanning small tables.
+    random.seed(0)
+    usernames = [f'explain-user-{i}' for i in range(users)]
+    now = datetime.now()
+    with connection.begin():
+        first_theme_id = connection.execute(select(func.coalesce(func.max(models.Theme.id), 0) + 1)).scalar()
+        connection.execute(insert(models.Theme), [
+            {
+                'username': random.choice(usernames),
+                'title': f'テーマ{i}',
+                'description': f'説明{i}',
+                'start_datetime': now - timedelta(days=random.randint(0, 60)) if i % 3 else None,
+                'expire_datetime': now + timedelta(days=random.randint(-30, 30)) if i % 4 else None,
+                'min_length': 1,
+                'max_length': 10000,
+                'is_suspended': i % 50 == 0,
+                'theses_count': theses_per_theme,
+                'created_at': now - timedelta(minutes=i),
+            }
+            for i in range(themes)
+        ])
+        theme_ids = connection.execute(
+            select(models.Theme.id).where(models.Theme.id >= first_theme_id).order_by(models.Theme.id)
+        ).scalars().all()
+        theses = []
+        for theme_id in theme_ids:
+            for username in random.sample(usernames, theses_per_theme):
+                theses.append({
+                    'username': username,
+                    'content': f'小論文{theme_id}',
+                    'works_cited': '',
+                    'theme_id': theme_id,
+                    'is_suspended': random.random() < 0.02,
+                    'favorites_count': favorites_per_thesis,
+                    'comments_count': comments_per_thesis,
+                    'created_at': now - timedelta(seconds=random.randint(0, 60 * 60 * 24 * 60)),
+                })
+        first_thesis_id = connection.execute(select(func.coalesce(func.max(models.Thesis.id), 0) + 1)).scalar()
+        connection.execute(insert(models.Thesis), theses)
+        thesis_ids = connection.execute(
+            select(models.Thesis.id).where(models.Thesis.id >= first_thesis_id).order_by(models.Thesis.id)
+        ).scalars().all()
+        connection.execute(insert(models.FavoriteThesis), [
+            {'thesis_id': thesis_id, 'username': username, 'created_at': now - timedelta(seconds=thesis_id)}
+            for thesis_id in thesis_ids
+            for username in random.sample(usernames, favorites_per_thesis)
+        ])
+        connection.execute(insert(models.Comment), [
+            {'thesis_id': thesis_id, 'username': random.choice(usernames), 'content': 'コメント'}
+            for thesis_id in thesis_ids
+            for _ in range(comments_per_thesis)
+        ])
+    for table in ('themes', 'theses', 'favorite_theses', 'comments'):
+        connection.exec_driver_sql(f'ANALYZE TABLE {table}')
+
+
+def get_samples(connection: Connection) -> dict:
+    return {
+        'username': connection.execute(
+            select(models.Thesis.username).where(models.Thesis.username.is_not(None)).limit(1)
+        ).scalar(),
+        'theme_id': connection.execute(select(models.Theme.id).limit(1)).scalar(),
+        'theme_ids': connection.execute(select(models.Theme.id).limit(20)).scalars().all(),
+        'thesis_id': connection.execute(select(models.Thesis.id).limit(1)).scalar(),
+    }
+
+
+def get_query_shapes(samples: dict) -> list:
+    # (name, statement, allow_filesort). Filesorts are accepted only where no
+    # index can give the order: full-text matches, IS NULL-first datetime
+    # sorts, and lists bounded to one author or a few ids.
+    shapes = []
+    nullable_sorts = (
+        const.ThemeSortType.START_EARLIER,
+        const.ThemeSortType.START_LATER,
+        const.ThemeSortType.EXPIRE_EARLIER,
+        const.ThemeSortType.EXPIRE_LATER,
+    )
+    for sort_type in const.ThemeSortType:
+        relevance = sort_type == const.ThemeSortType.RELEVANCE
+        for username in (None, samples['username']):
+            statement = crud.get_themes_common(
+                username=username,
+                exclude_not_yet=False,
+                exclude_accepting=False,
+                exclude_expired=False,
+                free_words=['テーマ'] if relevance else None,
+                sort_type=sort_type,
+                limit=100
+            )
+            allow_filesort = relevance or sort_type in nullable_sorts or username is not None
+            shapes.append((f'themes sort={sort_type.name} username={bool(username)}', statement, allow_filesort))
+    for exclude in ('exclude_not_yet', 'exclude_accepting', 'exclude_expired'):
+        filters = {
+            'exclude_not_yet': False,
+            'exclude_accepting': False,
+            'exclude_expired': False,
+        }
+        filters[exclude] = True
+        shapes.append((f'themes sort=NEWER {exclude}', crud.get_themes_common(
+            username=None,
+            free_words=None,
+            sort_type=const.ThemeSortType.NEWER,
+            limit=100,
+            **filters
+        ), False))
+    shapes.append(('themes sort=NEWER theme_ids', crud.get_themes_common(
+        username=None,
+        exclude_not_yet=False,
+        exclude_accepting=False,
+        exclude_expired=False,
+        free_words=None,
+        sort_type=const.ThemeSortType.NEWER,
+        limit=100,
+        theme_ids=samples['theme_ids']
+    ), True))
+    shapes.append(('themes sort=NEWER free_words', crud.get_themes_common(
+        username=None,
+        exclude_not_yet=False,
+        exclude_accepting=False,
+        exclude_expired=False,
+        free_words=['テーマ'],
+        sort_type=const.ThemeSortType.NEWER,
+        limit=100
+    ), True))
+    shapes.append(('themes sort=NEWER cursor', crud.get_themes_common(
+        username=None,
+        exclude_not_yet=False,
+        exclude_accepting=False,
+        exclude_expired=False,
+        free_words=None,
+        sort_type=const.ThemeSortType.NEWER,
+        limit=100,
+        cursor_values=[datetime.now(), 1]
+    ), False))
+    shapes.append(('theme summaries sort=NEWER', crud.get_themes_common(
+        username=None,
+        exclude_not_yet=False,
+        exclude_accepting=False,
+        exclude_expired=False,
+        free_words=None,
+        sort_type=const.ThemeSortType.NEWER,
+        limit=100,
+        columns=crud.THEME_SUMMARY_COLUMNS
+    ), False))
+    shapes.append(('theme summaries top theses', crud.get_top_thesis_ids_common(
+        [samples['theme_id']],
+        const.THEME['summary_top_theses_max']
+    ), False))
+    shapes.append(('themes count', crud.count_statement(crud.get_themes_common(
+        username=None,
+        exclude_not_yet=False,
+        exclude_accepting=False,
+        exclude_expired=False,
+        free_words=None,
+        sort_type=const.ThemeSortType.NEWER
+    )), False))
+    for sort_type in const.ThesisSortType:
+        relevance = sort_type == const.ThesisSortType.RELEVANCE
+        for username, theme_id in ((None, None), (samples['username'], None), (None, samples['theme_id'])):
+            statement = crud.get_theses_common(
+                username=username,
+                theme_id=theme_id,
+                free_words=['小論文'] if relevance else None,
+                sort_type=sort_type,
+                limit=100
+            )
+            allow_filesort = relevance or username is not None
+            name = f'theses sort={sort_type.name} username={bool(username)} theme_id={bool(theme_id)}'
+            shapes.append((name, statement, allow_filesort))
+    shapes.append(('theses sort=NEWER free_words', crud.get_theses_common(
+        username=None,
+        theme_id=None,
+        free_words=['小論文'],
+        sort_type=const.ThesisSortType.NEWER,
+        limit=100
+    ), True))
+    shapes.append(('theses sort=NEWER cursor', crud.get_theses_common(
+        username=None,
+        theme_id=None,
+        free_words=None,
+        sort_type=const.ThesisSortType.NEWER,
+        limit=100,
+        cursor_values=[datetime.now(), 1]
+    ), False))
+    shapes.append(('comments', crud.get_comments_common(thesis_id=samples['thesis_id'], limit=100), False))
+    shapes.append(('comments count', crud.count_statement(
+        crud.get_comments_common(thesis_id=samples['thesis_id'])
+    ), False))
+    shapes.append(('user favorites', crud.get_user_favorites_common(username=samples['username'], limit=100), False))
+    shapes.append(('user favorites count', crud.count_statement(
+        crud.get_user_favorites_common(username=samples['username'])
+    ), False))
+    shapes.append(('theme version', crud.get_theme_version_common(samples['theme_id']), False))
+    shapes.append(('thesis version', crud.get_thesis_version_common(samples['thesis_id']), False))
+    shapes.append(('comments version', crud.get_comments_common(
+        thesis_id=samples['thesis_id'],
+        limit=100,
+        columns=crud.COMMENT_VERSION_COLUMNS
+    ), False))
+    shapes.append(('themes theses version', crud.get_themes_theses_version_common([samples['theme_id']]), False))
+    shapes.append(('favorites version', crud.get_favorites_version_common([samples['thesis_id']]), False))
+    return shapes
+
+
+def get_plan_problems(plan: list, allow_filesort: bool) -> list:
+    problems = []
+    for row in plan:
+        table = row['table'] or ''
+        # Derived tables from count_statement are materialized subqueries, not scans of real tables.
+        if table.startswith('<'):
+            continue
+        if row['type'] == 'ALL':
+            problems.append(f'full scan of {table}')
+        if not allow_filesort and 'Using filesort' in (row['Extra'] or ''):
+            problems.append(f'filesort on {table}')
+    return problems
+
+
+def check_plans(connection: Connection, verbose: bool = False) -> list:
+    regressions = []
+    for name, statement, allow_filesort in get_query_shapes(get_samples(connection)):
+        plan = connection.execute(Explain(statement)).mappings().all()
+        problems = get_plan_problems(plan, allow_filesort)
+        if problems:
+            regressions.append((name, problems))
+        if verbose or problems:
+            print(f'{"NG" if problems else "OK"} {name}: {", ".join(problems)}')
+            for row in plan:
+                print(f'    {row["table"]} type={row["type"]} key={row["key"]} rows={row["rows"]} extra={row["Extra"]}')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fail when a hot query plan regresses to a full scan or filesort.')
+    parser.add_argument(
+        '--seed',
+        metavar='HOST/DATABASE',
+        help='insert synthetic rows before explaining; must name the database DB_INFO points at'
+    )
+    parser.add_argument('--verbose', action='store_true', help='print every plan')
+    args = parser.parse_args()
+    from .database import engine
+    if args.seed is not None and args.seed != f'{engine.url.host}/{engine.url.database}':
+        # Seeding writes thousands of rows, so the target is spelled out
+        # rather than taken from whatever DB_INFO is set in the shell.
+        parser.error(f'--seed {args.seed} does not match DB_INFO ({engine.url.host}/{engine.url.database})')
+    with engine.connect() as connection:
+        if args.seed is not None:
+            seed(connection)
+        regressions = check_plans(connection, verbose=args.verbose)
+    print(f'{len(regressions)} plan regression(s)')
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,130 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+from .database import engine
+from . import models
+from . import reconcile
+
+LOCK_NAME = 'wareomofu_migrations'
+
+
+def has_column(connection: Connection, table_name: str, column_name: str) -> bool:
+    columns = inspect(connection).get_columns(table_name)
+    return any(column['name'] == column_name for column in columns)
+
+
+def has_index(connection: Connection, table_name: str, index_name: str) -> bool:
+    indexes = inspect(connection).get_indexes(table_name)
+    return any(index['name'] == index_name for index in indexes)
+
+
+def add_column(connection: Connection, table_name: str, column_name: str, definition: str) -> bool:
+    if has_column(connection, table_name, column_name):
+        return False
+    connection.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {definition}'))
+    return True
+
+
+def add_index(connection: Connection, table_name: str, index_name: str, definition: str) -> bool:
+    if has_index(connection, table_name, index_name):
+        return False
+    connection.execute(text(f'ALTER TABLE {table_name} ADD {definition}'))
+    return True
+
+
+def add_counter_columns(connection: Connection):
+    added = [
+        add_column(connection, 'themes', 'theses_count', 'INTEGER UNSIGNED NOT NULL DEFAULT 0'),
+        add_column(connection, 'theses', 'favorites_count', 'INTEGER UNSIGNED NOT NULL DEFAULT 0'),
+        add_column(connection, 'theses', 'comments_count', 'INTEGER UNSIGNED NOT NULL DEFAULT 0'),
+    ]
+    add_index(connection, 'themes', 'ix_themes_theses_count', 'INDEX ix_themes_theses_count (theses_count)')
+    add_index(connection, 'theses', 'ix_theses_favorites_count', 'INDEX ix_theses_favorites_count (favorites_count)')
+    if any(added):
+        reconcile.reconcile_counters(connection)
+
+
+def add_fulltext_indexes(connection: Connection):
+    add_index(
+        connection,
+        'themes',
+        'ft_themes_free_words',
+        'FULLTEXT INDEX ft_themes_free_words (username, title, description) WITH PARSER ngram'
+    )
+    add_index(
+        connection,
+        'theses',
+        'ft_theses_free_words',
+        'FULLTEXT INDEX ft_theses_free_words (username, content, works_cited) WITH PARSER ngram'
+    )
+
+
+def add_favorite_username_index(connection: Connection):
+    add_index(
+        connection,
+        'favorite_theses',
+        'ix_favorite_theses_username_thesis_id',
+        'INDEX ix_favorite_theses_username_thesis_id (username, thesis_id)'
+    )
+
+
+def add_listing_indexes(connection: Connection):
+    # Secondary indexes end with the primary key, so (..., created_at) also
+    # serves the created_at, id tie-break without a filesort.
+    add_index(connection, 'themes', 'ix_themes_listing', 'INDEX ix_themes_listing (is_suspended, created_at)')
+    add_index(connection, 'theses', 'ix_theses_listing', 'INDEX ix_theses_listing (is_suspended, created_at)')
+    add_index(
+        connection,
+        'theses',
+        'ix_theses_theme_listing',
+        'INDEX ix_theses_theme_listing (theme_id, is_suspended, created_at)'
+    )
+    add_index(
+        connection,
+        'theses',
+        'ix_theses_theme_favorites',
+        'INDEX ix_theses_theme_favorites (theme_id, is_suspended, favorites_count)'
+    )
+    add_index(
+        connection,
+        'favorite_theses',
+        'ix_favorite_theses_user_listing',
+        'INDEX ix_favorite_theses_user_listing (username, created_at)'
+    )
+    add_index(
+        connection,
+        'comments',
+        'ix_comments_thesis_listing',
+        'INDEX ix_comments_thesis_listing (thesis_id, is_suspended, id)'
+    )
+
+
+def add_claim_columns(connection: Connection):
+    add_column(connection, 'email_outbox', 'claimed_by', 'VARCHAR(36) NULL')
+    add_column(connection, 'withdrawal_jobs', 'claimed_until', 'DATETIME NULL')
+
+
+MIGRATIONS = [
+    add_counter_columns,
+    add_fulltext_indexes,
+    add_favorite_username_index,
+    add_listing_indexes,
+    add_claim_columns,
+]
+
+
+def migrate(bind=engine):
+    with bind.connect() as connection:
+        # Several tasks start at once on deploy; only one may run the DDL.
+        connection.execute(text('SELECT GET_LOCK(:name, 300)'), {'name': LOCK_NAME})
+        try:
+            for migration in MIGRATIONS:
+                migration(connection)
+        finally:
+            connection.execute(text('SELECT RELEASE_LOCK(:name)'), {'name': LOCK_NAME})
+
+
+if __name__ == '__main__':
+    # Part of the deploy, run once before new tasks take traffic, so schema
+    # changes and the counter backfill never hold up a task's startup.
+    models.Base.metadata.create_all(bind=engine)
+    migrate()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.dialects.mysql import INTEGER, VARCHAR, TEXT, BOOLEAN, DATETIME, TINYINT, BIGINT
 from sqlalchemy.orm import relationship
 from .. import const
@@ -9,7 +9,14 @@ from .database import Base
 
 class Theme(Base):
     __tablename__ = 'themes'
-    __table_args__ = ({'mysql_charset': 'utf8mb4'})
+    __table_args__ = (
+        Index(
+            'ft_themes_free_words', 'username', 'title', 'description',
+            mysql_prefix='FULLTEXT', mysql_with_parser='ngram'
+        ),
+        Index('ix_themes_listing', 'is_suspended', 'created_at'),
+        {'mysql_charset': 'utf8mb4'}
+    )
 
     id = Column(BIGINT(unsigned=True), primary_key=True, index=True)
     username = Column(VARCHAR(length=const.USERNAME_MAX_LENGTH), index=True, nullable=True)
@@ -20,6 +27,7 @@ class Theme(Base):
     min_length = Column(INTEGER(unsigned=True), nullable=False)
     max_length = Column(INTEGER(unsigned=True), nullable=False)
     is_suspended = Column(BOOLEAN, default=False, nullable=False)
+    theses_count = Column(INTEGER(unsigned=True), index=True, default=0, server_default='0', nullable=False)
     created_at = Column(DATETIME(timezone=True), server_default=func.now())
     updated_at = Column(DATETIME(timezone=True), onupdate=func.now())
 
@@ -29,7 +37,17 @@ class Theme(Base):
 
 class Thesis(Base):
     __tablename__ = 'theses'
-    __table_args__ = (UniqueConstraint('theme_id', 'username'), {'mysql_charset': 'utf8mb4'})
+    __table_args__ = (
+        UniqueConstraint('theme_id', 'username'),
+        Index(
+            'ft_theses_free_words', 'username', 'content', 'works_cited',
+            mysql_prefix='FULLTEXT', mysql_with_parser='ngram'
+        ),
+        Index('ix_theses_listing', 'is_suspended', 'created_at'),
+        Index('ix_theses_theme_listing', 'theme_id', 'is_suspended', 'created_at'),
+        Index('ix_theses_theme_favorites', 'theme_id', 'is_suspended', 'favorites_count'),
+        {'mysql_charset': 'utf8mb4'}
+    )
 
     id = Column(BIGINT(unsigned=True), primary_key=True, index=True)
     username = Column(VARCHAR(length=const.USERNAME_MAX_LENGTH), index=True, nullable=True)
@@ -41,6 +59,8 @@ class Thesis(Base):
         ForeignKey('themes.id', onupdate='CASCADE', ondelete='CASCADE'),
         nullable=False
     )
+    favorites_count = Column(INTEGER(unsigned=True), index=True, default=0, server_default='0', nullable=False)
+    comments_count = Column(INTEGER(unsigned=True), default=0, server_default='0', nullable=False)
     created_at = Column(DATETIME(timezone=True), server_default=func.now())
     updated_at = Column(DATETIME(timezone=True), onupdate=func.now())
 
@@ -52,7 +72,13 @@ class Thesis(Base):
 
 class FavoriteThesis(Base):
     __tablename__ = 'favorite_theses'
-    __table_args__ = (UniqueConstraint('thesis_id', 'username'), {'mysql_charset': 'utf8mb4'})
+    __table_args__ = (
+        UniqueConstraint('thesis_id', 'username'),
+        # Covers both the per-user liked-set scan and username + thesis_id IN lookups.
+        Index('ix_favorite_theses_username_thesis_id', 'username', 'thesis_id'),
+        Index('ix_favorite_theses_user_listing', 'username', 'created_at'),
+        {'mysql_charset': 'utf8mb4'}
+    )
 
     id = Column(BIGINT(unsigned=True), primary_key=True, index=True)
     thesis_id = Column(
@@ -69,7 +95,10 @@ class FavoriteThesis(Base):
 
 class Comment(Base):
     __tablename__ = 'comments'
-    __table_args__ = ({'mysql_charset': 'utf8mb4'})
+    __table_args__ = (
+        Index('ix_comments_thesis_listing', 'thesis_id', 'is_suspended', 'id'),
+        {'mysql_charset': 'utf8mb4'}
+    )
 
     id = Column(BIGINT(unsigned=True), primary_key=True, index=True)
     thesis_id = Column(
@@ -211,3 +240,40 @@ class EmailNotificationSetting(Base):
     comment = Column(BOOLEAN, default=True, nullable=False)
     created_at = Column(DATETIME(timezone=True), server_default=func.now())
     updated_at = Column(DATETIME(timezone=True), onupdate=func.now())
+
+
+class EmailOutbox(Base):
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        Index('ix_email_outbox_pending', 'sent_at', 'next_attempt_at'),
+        {'mysql_charset': 'utf8mb4'}
+    )
+
+    id = Column(BIGINT(unsigned=True), primary_key=True, index=True)
+    username = Column(VARCHAR(length=const.USERNAME_MAX_LENGTH), nullable=False)
+    subject = Column(TEXT, nullable=False)
+    message = Column(TEXT, nullable=False)
+    attempts = Column(INTEGER(unsigned=True), default=0, server_default='0', nullable=False)
+    next_attempt_at = Column(DATETIME(timezone=True), server_default=func.now(), nullable=False)
+    claimed_by = Column(VARCHAR(length=36), nullable=True)
+    sent_at = Column(DATETIME(timezone=True), nullable=True)
+    created_at = Column(DATETIME(timezone=True), server_default=func.now())
+    updated_at = Column(DATETIME(timezone=True), onupdate=func.now())
+
+
+class WithdrawalJob(Base):
+    __tablename__ = 'withdrawal_jobs'
+    __table_args__ = (
+        Index('ix_withdrawal_jobs_pending', 'finished_at', 'id'),
+        {'mysql_charset': 'utf8mb4'}
+    )
+
+    id = Column(BIGINT(unsigned=True), primary_key=True, index=True)
+    username = Column(VARCHAR(length=const.USERNAME_MAX_LENGTH), index=True, nullable=False)
+    step = Column(INTEGER(unsigned=True), default=0, server_default='0', nullable=False)
+    last_id = Column(BIGINT(unsigned=True), default=0, server_default='0', nullable=False)
+    processed = Column(INTEGER(unsigned=True), default=0, server_default='0', nullable=False)
+    claimed_until = Column(DATETIME(timezone=True), nullable=True)
+    finished_at = Column(DATETIME(timezone=True), nullable=True)
+    created_at = Column(DATETIME(timezone=True), server_default=func.now())
+    updated_at = Column(DATETIME(timezone=True), onupdate=func.now())
@@ -0,0 +1,56 @@
+from sqlalchemy import update, select, func
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql.expression import false
+from . import models
+
+CHUNK_SIZE = 1000
+
+
+def reconcile_column(connection: Connection, model, counter, actual) -> int:
+    repaired = 0
+    last_id = 0
+    while True:
+        ids = connection.execute(
+            select(model.id).where(model.id > last_id).order_by(model.id).limit(CHUNK_SIZE)
+        ).scalars().all()
+        if not ids:
+            return repaired
+        statement = update(model)\
+            .where(model.id.between(ids[0], ids[-1]), counter != actual)\
+            .values({counter: actual, model.updated_at: model.updated_at})
+        with connection.begin():
+            repaired += connection.execute(statement).rowcount
+        last_id = ids[-1]
+
+
+def reconcile_counters(connection: Connection) -> dict:
+    # Writes through the app keep the counters current, but moderators
+    # suspend and restore rows directly in the database, so run this after
+    # changing is_suspended to bring theses_count and comments_count back.
+    theses_count = select(func.count(models.Thesis.id))\
+        .where(models.Thesis.theme_id == models.Theme.id, models.Thesis.is_suspended == false())\
+        .scalar_subquery()
+    favorites_count = select(func.count(models.FavoriteThesis.id))\
+        .where(models.FavoriteThesis.thesis_id == models.Thesis.id)\
+        .scalar_subquery()
+    comments_count = select(func.count(models.Comment.id))\
+        .where(models.Comment.thesis_id == models.Thesis.id, models.Comment.is_suspended == false())\
+        .scalar_subquery()
+    result = {
+        'themes.theses_count': reconcile_column(
+            connection, models.Theme, models.Theme.theses_count, theses_count
+        ),
+        'theses.favorites_count': reconcile_column(
+            connection, models.Thesis, models.Thesis.favorites_count, favorites_count
+        ),
+        'theses.comments_count': reconcile_column(
+            connection, models.Thesis, models.Thesis.comments_count, comments_count
+        ),
+    }
+    return result
+
+
+if __name__ == '__main__':
+    from .database import engine
+    with engine.connect() as connection:
+        print(reconcile_counters(connection))
@@ -0,0 +1,154 @@
+import threading
+import time
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from ..background import BackgroundWorker
+from .. import metrics
+from .. import querylog
+
+
+class Replica:
+    def __init__(self, name: str, engine, async_engine, weight: float = 1):
+        self.name = name
+        self.engine = engine
+        self.async_engine = async_engine
+        self.weight = weight
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        self.AsyncSessionLocal = sessionmaker(
+            autocommit=False,
+            autoflush=False,
+            expire_on_commit=False,
+            bind=async_engine,
+            class_=AsyncSession
+        )
+        self.healthy = True
+        self.lag = None
+        self.applied_until = None
+        self.outstanding = 0
+        self.sessions = 0
+        self.ejections = 0
+        querylog.instrument_engine(engine, name, 'sync')
+        querylog.instrument_engine(async_engine.sync_engine, name, 'async')
+
+    def load(self) -> float:
+        return (self.outstanding + 1) / self.weight
+
+    def stats(self) -> dict:
+        return {
+            'healthy': self.healthy,
+            'weight': self.weight,
+            'lag': self.lag,
+            'applied_until': self.applied_until,
+            'outstanding': self.outstanding,
+            'sessions': self.sessions,
+            'ejections': self.ejections,
+            'pool': get_pool_stats(self.engine.pool),
+            'async_pool': get_pool_stats(self.async_engine.sync_engine.pool),
+        }
+
+
+class ReplicaRouter:
+    def __init__(self, primary: Replica, replicas: list):
+        self.primary = primary
+        self.replicas = replicas
+        self.fallbacks = 0
+        self.consistency_fallbacks = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, not_before: float = None) -> Replica:
+        with self._lock:
+            candidates = [replica for replica in self.replicas if replica.healthy]
+            if not candidates:
+                self.fallbacks += 1
+            elif not_before is not None:
+                # applied_until and not_before come from different hosts' clocks;
+                # decode_token pads not_before for the skew between them.
+                candidates = [
+                    replica for replica in candidates
+                    if replica.applied_until is not None and replica.applied_until >= not_before
+                ]
+                if not candidates:
+                    self.consistency_fallbacks += 1
+            if candidates:
+                # Rotate the starting point so equally loaded replicas share ties.
+                self._next = (self._next + 1) % len(candidates)
+                candidates = candidates[self._next:] + candidates[:self._next]
+                target = min(candidates, key=Replica.load)
+            else:
+                target = self.primary
+            target.outstanding += 1
+            target.sessions += 1
+            return target
+
+    def release(self, target: Replica):
+        with self._lock:
+            target.outstanding -= 1
+
+    def stats(self) -> dict:
+        return {
+            'fallbacks': self.fallbacks,
+            'consistency_fallbacks': self.consistency_fallbacks,
+            'primary': self.primary.stats(),
+            'replicas': {replica.name: replica.stats() for replica in self.replicas},
+        }
+
+
+class ReplicaHealthChecker(BackgroundWorker):
+    def __init__(self, router: ReplicaRouter, interval: float = 5, max_lag: float = 30):
+        super().__init__('replica-health-checker', interval)
+        self.router = router
+        self.max_lag = max_lag
+
+    def run_once(self):
+        for replica in self.router.replicas:
+            self.probe(replica)
+
+    def probe(self, replica: Replica):
+        probed_at = time.time()
+        try:
+            with replica.engine.connect() as connection:
+                connection.exec_driver_sql('SELECT 1')
+                try:
+                    status = connection.exec_driver_sql('SHOW SLAVE STATUS').mappings().first()
+                except DBAPIError as e:
+                    if e.connection_invalidated:
+                        raise
+                    # Without REPLICATION CLIENT the lag is unknown; reachability has to do.
+                    status = {'Seconds_Behind_Master': 0}
+        except Exception as e:
+            self._mark(replica, False, None, str(e))
+            return
+        if status is None:
+            # Not a binlog replica (e.g. an Aurora reader), which has no lag to report here.
+            self._mark(replica, True, 0, None, probed_at)
+            return
+        lag = status['Seconds_Behind_Master']
+        if lag is None:
+            self._mark(replica, False, None, 'replication is not running')
+        elif lag > self.max_lag:
+            self._mark(replica, False, lag, f'replication lag {lag}s exceeds {self.max_lag}s')
+        else:
+            self._mark(replica, True, lag, None, probed_at)
+
+    def _mark(self, replica: Replica, healthy: bool, lag, error, probed_at: float = None):
+        if replica.healthy and not healthy:
+            replica.ejections += 1
+            print(f'{self.name}: ejected {replica.name}: {error}')
+        elif not replica.healthy and healthy:
+            print(f'{self.name}: restored {replica.name}')
+        replica.healthy = healthy
+        replica.lag = lag
+        if probed_at is not None:
+            # Seconds_Behind_Master is truncated to whole seconds, so assume up to
+            # one more second of lag when deciding what the replica has applied.
+            replica.applied_until = probed_at - lag - 1
+
+
+def get_pool_stats(pool) -> dict:
+    stats = {'status': pool.status()}
+    for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+        if hasattr(pool, name):
+            stats[name] = getattr(pool, name)()
+    return stats
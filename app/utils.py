@@ -1,7 +1,9 @@
-import boto3
-import os
 import json
+import base64
+from datetime import datetime
+from fastapi import HTTPException
 from . import const
+from . import auth
 
 def get_skip(limit: int, page: int) -> int:
     if limit < 1:
@@ -12,34 +14,49 @@ def get_skip(limit: int, page: int) -> int:
     return skip
 
 
+def encode_cursor(payload: dict) -> str:
+    def default(value):
+        if isinstance(value, datetime):
+            return {'$datetime': value.isoformat()}
+        raise TypeError(f'{type(value)} is not cursor serializable')
+    jsoned_payload = json.dumps(payload, default=default, separators=(',', ':'))
+    return base64.urlsafe_b64encode(jsoned_payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> dict:
+    def object_hook(value):
+        if '$datetime' in value:
+            return datetime.fromisoformat(value['$datetime'])
+        return value
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        jsoned_payload = base64.urlsafe_b64decode(cursor + padding).decode('utf-8')
+        payload = json.loads(jsoned_payload, object_hook=object_hook)
+    except Exception:
+        raise HTTPException(status_code=400, detail='カーソルが不正です')
+    if not isinstance(payload, dict) or not isinstance(payload.get('values'), list):
+        raise HTTPException(status_code=400, detail='カーソルが不正です')
+    return payload
+
+
+def check_cursor_values(values: list, types: tuple) -> list:
+    # decode_cursor only checks the payload's shape; the values go straight
+    # into the keyset condition, so they must match the sort keys one for one.
+    if len(values) != len(types) or not all(
+        isinstance(value, value_types) and not isinstance(value, bool)
+        for (value, value_types) in zip(values, types)
+    ):
+        raise HTTPException(status_code=400, detail='カーソルが不正です')
+    return values
+
+
 def get_not_found_message(subject: str) -> str:
     return f'{subject}が存在しないか、公開停止しています'
 
 
-def get_username(access_token: str) -> str:
-    client = boto3.client('cognito-idp')
-    user = client.get_user(AccessToken=access_token)
-    return user['Username']
-
-
-def send_email_notification(username: str, subject: str, main: str):
-    with open(f'{const.SES_TEMPLATE_DIRECTORY}/header.txt', 'r') as f:
-        header_template = f.read()
-    header = header_template.format(username)
-    with open(f'{const.SES_TEMPLATE_DIRECTORY}/footer.txt', 'r') as f:
-        footer = f.read()
-    message = f'{header}\n\n{main}\n\n{footer}'
-    sqs = boto3.client('sqs')
-    queue_url = sqs.get_queue_url(QueueName=os.environ['EMAIL_TO_USER_QUEUE'])['QueueUrl']
-    encode = lambda value : value.encode('utf-8').hex()
-    body = {
-        'username': encode(username),
-        'subject': encode(subject),
-        'message': encode(message),
-    }
-    jsoned_body = json.dumps(body)
-    response = sqs.send_message(
-        QueueUrl=queue_url,
-        MessageBody=jsoned_body
-    )
-    print(f'send email to {username}\nresponse:{response}')
+def get_username(access_token: str, strict: bool = False) -> str:
+    return auth.get_username(access_token, strict=strict)
+
+
+async def get_username_async(access_token: str, strict: bool = False) -> str:
+    return await auth.get_username_async(access_token, strict=strict)
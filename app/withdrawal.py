@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+from sqlalchemy import or_, select, update
+from .background import BackgroundWorker
+from .sql import crud, models
+from .sql.database import SessionLocal
+from . import const
+from . import cache
+
+
+def invalidate(username: str):
+    # Withdrawal anonymizes rows across every cached document type. Like any
+    # other write this only reaches this task's caches; other tasks keep
+    # serving theirs for up to RESPONSE_CACHE/LIKED_CACHE/PROFILE_CACHE ttl.
+    cache.response_cache.clear()
+    cache.liked_cache.invalidate(cache.liked_tag(username))
+    cache.profile_cache.invalidate(cache.profile_tag(username))
+
+
+class WithdrawalWorker(BackgroundWorker):
+    def __init__(self, poll_interval: float = 60, chunk_size: int = 500, claim_seconds: float = 300):
+        super().__init__('withdrawal-worker', poll_interval)
+        self.chunk_size = chunk_size
+        self.claim_seconds = claim_seconds
+        self.chunks = 0
+        self.finished = 0
+
+    def stats(self) -> dict:
+        return {
+            'chunks': self.chunks,
+            'finished': self.finished,
+        }
+
+    def run_once(self):
+        while self._run_chunk():
+            pass
+
+    def _run_chunk(self) -> bool:
+        db = SessionLocal()
+        try:
+            job = self._claim(db)
+            if job is None:
+                return False
+            finished = crud.run_withdrawal_chunk(db, job.id, self.chunk_size)
+            db.execute(
+                update(models.WithdrawalJob)
+                .where(models.WithdrawalJob.id == job.id)
+                .values(claimed_until=None)
+            )
+            db.commit()
+            self.chunks += 1
+            if finished:
+                self.finished += 1
+                invalidate(job.username)
+            return True
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _claim(self, db):
+        # Claims the oldest job nobody holds with a conditional UPDATE, so
+        # workers spread over pending jobs without SKIP LOCKED (MySQL 8
+        # only). A claim left by a crashed worker runs out after the lease;
+        # run_withdrawal_chunk still locks the job row, so overlapping runs
+        # stay correct.
+        now = datetime.now()
+        claimable = (
+            models.WithdrawalJob.finished_at.is_(None),
+            or_(models.WithdrawalJob.claimed_until.is_(None), models.WithdrawalJob.claimed_until < now),
+        )
+        for job in db.execute(
+            select(models.WithdrawalJob.id, models.WithdrawalJob.username)
+            .where(*claimable)
+            .order_by(models.WithdrawalJob.id)
+            .limit(10)
+        ).all():
+            claimed = db.execute(
+                update(models.WithdrawalJob)
+                .where(models.WithdrawalJob.id == job.id, *claimable)
+                .values(claimed_until=now + timedelta(seconds=self.claim_seconds))
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+            if claimed:
+                return job
+        return None
+
+
+worker = WithdrawalWorker(
+    poll_interval=const.WITHDRAWAL['poll_interval'],
+    chunk_size=const.WITHDRAWAL['chunk_size'],
+    claim_seconds=const.WITHDRAWAL['claim_seconds']
+)
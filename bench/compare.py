@@ -0,0 +1,50 @@
+import argparse
+import json
+import sys
+
+FIGURES = ('throughput', 'p50_ms', 'p95_ms', 'p99_ms')
+
+
+def load(path: str) -> dict:
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def change(before: float, after: float) -> float:
+    return (after - before) / before * 100 if before else 0.0
+
+
+def compare(base: dict, head: dict, threshold: float) -> list:
+    # A regression is lower throughput or a higher p95/p99 beyond the threshold.
+    regressions = []
+    rows = sorted(set(base['endpoints']) & set(head['endpoints'])) + ['TOTAL']
+    print(f'{"endpoint":<42} ' + ' '.join(f'{figure:>20}' for figure in FIGURES))
+    for name in rows:
+        before = base['total'] if name == 'TOTAL' else base['endpoints'][name]
+        after = head['total'] if name == 'TOTAL' else head['endpoints'][name]
+        cells = []
+        for figure in FIGURES:
+            delta = change(before[figure], after[figure])
+            cells.append(f'{before[figure]:>8.1f}→{after[figure]:>8.1f}{delta:>+4.0f}%')
+            worse = -delta if figure == 'throughput' else delta
+            if figure in ('throughput', 'p95_ms', 'p99_ms') and worse > threshold:
+                regressions.append((name, figure, delta))
+        print(f'{name:<42} ' + ' '.join(f'{cell:>20}' for cell in cells))
+    for name in sorted(set(base['endpoints']) ^ set(head['endpoints'])):
+        print(f'{name:<42} only in {"base" if name in base["endpoints"] else "head"}')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare two load reports saved by bench.load.')
+    parser.add_argument('base')
+    parser.add_argument('head')
+    parser.add_argument('--threshold', type=float, default=10.0, help='percent change counted as a regression')
+    args = parser.parse_args()
+    base = load(args.base)
+    head = load(args.head)
+    print(f'base {base["meta"]["commit"][:12]}  head {head["meta"]["commit"][:12]}')
+    regressions = compare(base, head, args.threshold)
+    for name, figure, delta in regressions:
+        print(f'regression {name} {figure} {delta:+.1f}%')
+    sys.exit(1 if regressions else 0)
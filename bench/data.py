@@ -0,0 +1,198 @@
+import argparse
+from datetime import datetime, timedelta
+from itertools import accumulate
+import math
+import random
+import time
+from .env import configure
+
+configure()
+
+from sqlalchemy import func, insert, select
+from app import const
+from app.sql import migrations, models
+from app.sql.database import engine
+
+SCALES = {
+    'small': {'users': 2000, 'themes': 1000, 'theses': 10000, 'favorites': 100000, 'comments': 20000},
+    'medium': {'users': 20000, 'themes': 10000, 'theses': 100000, 'favorites': 1000000, 'comments': 200000},
+    'large': {'users': 200000, 'themes': 100000, 'theses': 1000000, 'favorites': 10000000, 'comments': 2000000},
+}
+
+BATCH_SIZE = 5000
+
+WORDS = (
+    '私', '考え', '社会', '問題', '意見', '理由', '経験', '教育', '環境', '技術', '未来', '歴史',
+    '文化', '経済', '政治', '科学', '言葉', '関係', '影響', '必要', '重要', '可能性', '結論', '論点',
+    '議論', '根拠', '主張', '反論', '事例', '調査', '結果', '方法', '目的', '価値', '責任', '自由',
+    'は', 'が', 'を', 'に', 'で', 'と', 'の', 'も', 'から', 'まで', 'より', 'について',
+    'である', 'と考える', 'だろう', 'かもしれない', 'といえる', 'ではないか', 'が重要だ', 'を示している',
+)
+PUNCTUATIONS = ('、', '。', '', '', '')
+REPORT_REASONS = ('スパム', '誹謗中傷', '個人情報の掲載', '不適切な内容', 'その他')
+
+
+def zipf_cum_weights(n: int, s: float = 1.1) -> list:
+    return list(accumulate(1 / ((rank + 1) ** s) for rank in range(n)))
+
+
+def japanese_text(rng: random.Random, median: int, max_length: int) -> str:
+    # Log-normal lengths: most posts are short, a few run to the column limit.
+    length = max(1, min(max_length, int(rng.lognormvariate(math.log(median), 1.0))))
+    parts = []
+    size = 0
+    while size < length:
+        word = rng.choice(WORDS) + rng.choice(PUNCTUATIONS)
+        parts.append(word)
+        size += len(word)
+    return ''.join(parts)[:length]
+
+
+def pick_distinct(rng: random.Random, k: int, n: int, cum_weights: list) -> list:
+    # Skewed pick of k distinct indexes; falls back to uniform once k is a
+    # large share of n and rejection sampling would stall.
+    if k * 2 > n:
+        return rng.sample(range(n), k)
+    picked = set()
+    while len(picked) < k:
+        picked.update(rng.choices(range(n), cum_weights=cum_weights, k=k - len(picked)))
+    return list(picked)
+
+
+def spread_counts(total: int, n: int, cap: int, floor: int = 1, s: float = 1.1) -> list:
+    weights = [1 / ((rank + 1) ** s) for rank in range(n)]
+    weight_sum = sum(weights)
+    return [min(cap, max(floor, round(total * weight / weight_sum))) for weight in weights]
+
+
+def count_suspended(rng: random.Random, count: int, rate: float = 0.01) -> int:
+    return sum(rng.random() < rate for _ in range(count))
+
+
+def insert_batches(connection, model, rows):
+    batch = []
+    inserted = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            with connection.begin():
+                connection.execute(insert(model), batch)
+            inserted += len(batch)
+            batch = []
+    if batch:
+        with connection.begin():
+            connection.execute(insert(model), batch)
+        inserted += len(batch)
+    return inserted
+
+
+def next_id(connection, model) -> int:
+    return connection.execute(select(func.coalesce(func.max(model.id), 0) + 1)).scalar()
+
+
+def seed(connection, users: int, themes: int, theses: int, favorites: int, comments: int, random_seed: int = 0):
+    rng = random.Random(random_seed)
+    now = datetime.now()
+    max_length = const.STR_DEFAULT_MAX_LENGTH
+    usernames = [f'bench-user-{i}' for i in range(users)]
+    user_weights = zipf_cum_weights(users)
+
+    def created_at() -> datetime:
+        return now - timedelta(seconds=rng.randint(0, 60 * 60 * 24 * 365))
+
+    if not connection.execute(select(func.count(models.ReportReason.id))).scalar():
+        with connection.begin():
+            connection.execute(insert(models.ReportReason), [{'reason': reason} for reason in REPORT_REASONS])
+
+    theses_counts = spread_counts(theses, themes, cap=users)
+    # Counters skip suspended rows, as app.sql.reconcile does, so suspensions
+    # are drawn before the counters are written.
+    suspended_theses_counts = [count_suspended(rng, count) for count in theses_counts]
+    first_theme_id = next_id(connection, models.Theme)
+
+    def theme_rows():
+        for i in range(themes):
+            roll = rng.random()
+            # Most themes accept posts now so the write endpoints have targets.
+            start_datetime = None if roll < 0.7 else now + timedelta(days=rng.randint(-30, 30))
+            expire_datetime = None if roll < 0.8 else now + timedelta(days=rng.randint(1, 60))
+            if start_datetime is not None and expire_datetime is not None and start_datetime >= expire_datetime:
+                start_datetime = None
+            yield {
+                'id': first_theme_id + i,
+                'username': usernames[rng.choices(range(users), cum_weights=user_weights)[0]],
+                'title': japanese_text(rng, 20, const.THEME['title_max_length']),
+                'description': japanese_text(rng, 200, max_length),
+                'start_datetime': start_datetime,
+                'expire_datetime': expire_datetime,
+                'min_length': 1,
+                'max_length': max_length,
+                'is_suspended': rng.random() < 0.01,
+                'theses_count': theses_counts[i] - suspended_theses_counts[i],
+                'created_at': created_at(),
+            }
+    print(f'themes: {insert_batches(connection, models.Theme, theme_rows())}')
+
+    thesis_ids = []
+    first_thesis_id = next_id(connection, models.Thesis)
+    total_theses = sum(theses_counts)
+    favorites_counts = spread_counts(favorites, total_theses, cap=users, floor=0)
+    comments_counts = spread_counts(comments, total_theses, cap=comments, floor=0)
+    # Popularity should not follow insertion order.
+    rng.shuffle(favorites_counts)
+    rng.shuffle(comments_counts)
+    suspended_comments_counts = [count_suspended(rng, count) for count in comments_counts]
+
+    def thesis_rows():
+        thesis_id = first_thesis_id
+        for i in range(themes):
+            for (j, author) in enumerate(pick_distinct(rng, theses_counts[i], users, user_weights)):
+                index = thesis_id - first_thesis_id
+                thesis_ids.append(thesis_id)
+                yield {
+                    'id': thesis_id,
+                    'username': usernames[author],
+                    'content': japanese_text(rng, 400, max_length),
+                    'works_cited': japanese_text(rng, 30, max_length) if rng.random() < 0.3 else '',
+                    'theme_id': first_theme_id + i,
+                    'is_suspended': j < suspended_theses_counts[i],
+                    'favorites_count': favorites_counts[index],
+                    'comments_count': comments_counts[index] - suspended_comments_counts[index],
+                    'created_at': created_at(),
+                }
+                thesis_id += 1
+    print(f'theses: {insert_batches(connection, models.Thesis, thesis_rows())}')
+
+    def favorite_rows():
+        for index, thesis_id in enumerate(thesis_ids):
+            for user in pick_distinct(rng, favorites_counts[index], users, user_weights):
+                yield {'thesis_id': thesis_id, 'username': usernames[user], 'created_at': created_at()}
+    print(f'favorites: {insert_batches(connection, models.FavoriteThesis, favorite_rows())}')
+
+    def comment_rows():
+        for index, thesis_id in enumerate(thesis_ids):
+            for j in range(comments_counts[index]):
+                yield {
+                    'thesis_id': thesis_id,
+                    'username': usernames[rng.choices(range(users), cum_weights=user_weights)[0]],
+                    'content': japanese_text(rng, 60, max_length),
+                    'is_suspended': j < suspended_comments_counts[index],
+                    'created_at': created_at(),
+                }
+    print(f'comments: {insert_batches(connection, models.Comment, comment_rows())}')
+
+    for table in ('themes', 'theses', 'favorite_theses', 'comments'):
+        connection.exec_driver_sql(f'ANALYZE TABLE {table}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Seed a local MySQL with skewed synthetic data.')
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--random-seed', type=int, default=0)
+    args = parser.parse_args()
+    models.Base.metadata.create_all(bind=engine)
+    migrations.migrate(bind=engine)
+    started_at = time.time()
+    with engine.connect() as connection:
+        seed(connection, random_seed=args.random_seed, **SCALES[args.scale])
+    print(f'seeded {args.scale} in {time.time() - started_at:.1f}s')
@@ -0,0 +1,24 @@
+import os
+import sys
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def configure(require_db: bool = True):
+    # Only DB_INFO has to point at a real (local) MySQL; everything else is stubbed.
+    if not require_db:
+        # Engines are created lazily, so a placeholder is enough for benchmarks that never connect.
+        os.environ.setdefault('DB_INFO', '{"username":"bench","password":"","host":"127.0.0.1",'
+                                         '"slave_host":"127.0.0.1","port":"3306","database":"bench"}')
+    if 'DB_INFO' not in os.environ:
+        sys.exit('DB_INFO must point at a local MySQL, e.g. '
+                 '{"username":"root","password":"","host":"127.0.0.1","slave_host":"127.0.0.1",'
+                 '"port":"3306","database":"wareomofu_bench"}')
+    os.environ.setdefault('COGNITO_INFO', '{"user_pool_id": "ap-northeast-1_bench", "client_id": "bench"}')
+    os.environ.setdefault('SNS_TOPIC_ARN', 'arn:aws:sns:ap-northeast-1:000000000000:bench')
+    os.environ.setdefault('EMAIL_TO_USER_QUEUE', 'bench')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-northeast-1')
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+    if ROOT_DIRECTORY not in sys.path:
+        sys.path.insert(0, ROOT_DIRECTORY)
@@ -0,0 +1,350 @@
+import argparse
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import count
+import json
+import math
+import os
+import random
+import subprocess
+import threading
+import time
+from .env import ROOT_DIRECTORY, configure
+
+configure()
+
+import requests
+from app import auth, const
+from . import stubs
+from .data import REPORT_REASONS, japanese_text
+
+Call = namedtuple('Call', ['method', 'path', 'params', 'body'])
+
+
+def call(method: str, path: str, params: dict = None, body: dict = None) -> Call:
+    return Call(method, path, params, body)
+
+
+class Targets:
+    # Ids and names discovered through the API, so the load driver never needs
+    # a database connection of its own.
+    def __init__(self, base_url: str, key: dict, users: int, run_id: str):
+        self.base_url = base_url
+        self.key = key
+        self.run_id = run_id
+        self._fresh = count()
+        session = requests.Session()
+
+        def get(path: str, **params):
+            response = session.get(base_url + path, params=params, timeout=60)
+            response.raise_for_status()
+            return response
+
+        themes = get('/themes/1').json() + get('/themes/1', sort_type=int(const.ThemeSortType.NUM_OF_THESES)).json()
+        accepting = get('/themes/1', exclude_not_yet=1, exclude_expired=1).json()
+        theses = get('/theses/1').json() + get('/theses/1', sort_type=int(const.ThesisSortType.NUM_OF_FAVORITES)).json()
+        if not themes or not theses or not accepting:
+            raise SystemExit('no themes or theses found; seed the database with python -m bench.data first')
+        self.theme_ids = [theme['id'] for theme in themes]
+        self.accepting_theme_ids = [theme['id'] for theme in accepting]
+        self.thesis_ids = [thesis['id'] for thesis in theses]
+        self.usernames = sorted({
+            item['username'] for item in themes + theses if item['username'] is not None
+        })[:users]
+        self.theme_cursor = get('/themes/1').headers.get(const.NEXT_CURSOR_HEADER)
+        self.thesis_cursor = get('/theses/1').headers.get(const.NEXT_CURSOR_HEADER)
+        self.comment_ids = []
+        for thesis_id in self.thesis_ids[:20]:
+            self.comment_ids += [comment['id'] for comment in get(f'/comments/{thesis_id}/1').json()]
+        self.report_reason_ids = [reason['id'] for reason in get('/report/reasons').json()] or [1]
+        self.tokens = {username: self.token(username) for username in self.usernames}
+
+    def token(self, username: str) -> str:
+        client_id = const.COGNITO_INFO.get('client_id', '')
+        return stubs.mint_token(self.key, auth.ISSUER, client_id, username)
+
+    def fresh_user(self) -> tuple:
+        # Writes go through users that exist only for this run, so likes and
+        # reports never collide with unique constraints from earlier requests.
+        username = f'bench-load-{self.run_id}-{next(self._fresh)}'
+        return username, self.token(username)
+
+    def known_user(self, rng: random.Random) -> tuple:
+        username = rng.choice(self.usernames)
+        return username, self.tokens[username]
+
+
+def read_themes(targets: Targets, rng: random.Random):
+    params = {'sort_type': int(rng.choice(list(const.ThemeSortType)))}
+    if params['sort_type'] == const.ThemeSortType.RELEVANCE:
+        params['free_words'] = ['社会']
+    return [], call('GET', '/themes/{page}', params)
+
+
+def read_themes_cursor(targets: Targets, rng: random.Random):
+    return [], call('GET', '/themes/{page}', {'cursor': targets.theme_cursor})
+
+
+def read_theses(targets: Targets, rng: random.Random):
+    params = {'sort_type': int(rng.choice(list(const.ThesisSortType)))}
+    if params['sort_type'] == const.ThesisSortType.RELEVANCE:
+        params['free_words'] = ['社会']
+    if rng.random() < 0.5:
+        params['theme_id'] = rng.choice(targets.theme_ids)
+    return [], call('GET', '/theses/{page}', params)
+
+
+def read_theses_cursor(targets: Targets, rng: random.Random):
+    return [], call('GET', '/theses/{page}', {'cursor': targets.thesis_cursor})
+
+
+SCENARIOS = {
+    # name: (weight, builder). Builders return (setup calls, measured call);
+    # setup calls run first and are left out of the figures.
+    'GET /constant/theme': (1, lambda t, rng: ([], call('GET', '/constant/theme'))),
+    'GET /constant/thesis': (1, lambda t, rng: ([], call('GET', '/constant/thesis'))),
+    'GET /themes/{page}': (20, read_themes),
+    'GET /themes/{page} cursor': (5, read_themes_cursor),
+    'GET /themes/{page} summary': (10, lambda t, rng: ([], call('GET', '/themes/{page}', {
+        'view': 'summary',
+        'top_theses': rng.choice((0, 3)),
+        'sort_type': int(rng.choice(list(const.ThemeSortType)[:-1])),
+    }))),
+    'GET /pages/themes': (5, lambda t, rng: ([], call('GET', '/pages/themes'))),
+    'GET /theme/{theme_id}': (15, lambda t, rng: ([], call('GET', f'/theme/{rng.choice(t.theme_ids)}'))),
+    'POST /theme/create': (1, lambda t, rng: ([], call('POST', '/theme/create', body={
+        'access_token': t.fresh_user()[1],
+        'title': japanese_text(rng, 20, const.THEME['title_max_length']),
+        'description': japanese_text(rng, 200, const.STR_DEFAULT_MAX_LENGTH),
+        'min_length': 1,
+        'max_length': const.STR_DEFAULT_MAX_LENGTH,
+    }))),
+    'GET /theses/{page}': (20, read_theses),
+    'GET /theses/{page} cursor': (5, read_theses_cursor),
+    'GET /pages/theses': (5, lambda t, rng: ([], call('GET', '/pages/theses', {'theme_id': rng.choice(t.theme_ids)}))),
+    'GET /thesis/{thesis_id}': (15, lambda t, rng: ([], call('GET', f'/thesis/{rng.choice(t.thesis_ids)}'))),
+    'POST /thesis/create': (2, lambda t, rng: ([], call('POST', '/thesis/create', body={
+        'access_token': t.fresh_user()[1],
+        'theme_id': rng.choice(t.accepting_theme_ids),
+        'content': japanese_text(rng, 400, const.STR_DEFAULT_MAX_LENGTH),
+        'works_cited': '',
+    }))),
+    'GET /pages/comments/{thesis_id}': (5, lambda t, rng: (
+        [], call('GET', f'/pages/comments/{rng.choice(t.thesis_ids)}')
+    )),
+    'GET /comments/{thesis_id}/{page}': (10, lambda t, rng: (
+        [], call('GET', f'/comments/{rng.choice(t.thesis_ids)}/1')
+    )),
+    'POST /comment/create': (2, lambda t, rng: ([], call('POST', '/comment/create', body={
+        'access_token': t.fresh_user()[1],
+        'thesis_id': rng.choice(t.thesis_ids),
+        'content': japanese_text(rng, 60, const.STR_DEFAULT_MAX_LENGTH),
+    }))),
+    'GET /favorites/{page}': (5, lambda t, rng: ([], call('GET', '/favorites/1', {'username': rng.choice(t.usernames)}))),
+    'GET /pages/favorites': (3, lambda t, rng: ([], call('GET', '/pages/favorites', {'username': rng.choice(t.usernames)}))),
+    'POST /favorite/read': (10, lambda t, rng: ([], call('POST', '/favorite/read', body={
+        'access_token': t.known_user(rng)[1],
+        'thesis_id': rng.choice(t.thesis_ids),
+    }))),
+    'POST /favorite/read/batch': (5, lambda t, rng: ([], call('POST', '/favorite/read/batch', body={
+        'access_token': t.known_user(rng)[1],
+        'thesis_ids': t.thesis_ids[:const.FAVORITE['read_batch_max_size']],
+    }))),
+    'POST /favorite/like': (3, lambda t, rng: ([], call('POST', '/favorite/like', body={
+        'access_token': t.fresh_user()[1],
+        'thesis_id': rng.choice(t.thesis_ids),
+    }))),
+    'DELETE /favorite/dislike': (2, lambda t, rng: dislike(t, rng)),
+    'GET /report/reasons': (2, lambda t, rng: ([], call('GET', '/report/reasons'))),
+    'POST /report/user': (1, lambda t, rng: ([], call('POST', '/report/user', body={
+        **report_base(t, rng), 'target_username': rng.choice(t.usernames),
+    }))),
+    'POST /report/theme': (1, lambda t, rng: ([], call('POST', '/report/theme', body={
+        **report_base(t, rng), 'theme_id': rng.choice(t.theme_ids),
+    }))),
+    'POST /report/thesis': (1, lambda t, rng: ([], call('POST', '/report/thesis', body={
+        **report_base(t, rng), 'thesis_id': rng.choice(t.thesis_ids),
+    }))),
+    'POST /report/comment': (1, lambda t, rng: ([], call('POST', '/report/comment', body={
+        **report_base(t, rng), 'comment_id': rng.choice(t.comment_ids),
+    })) if t.comment_ids else None),
+    'GET /users/{username}': (5, lambda t, rng: ([], call('GET', f'/users/{rng.choice(t.usernames)}'))),
+    'POST /users/profiles': (3, lambda t, rng: ([], call('POST', '/users/profiles', body={
+        'usernames': rng.sample(t.usernames, min(len(t.usernames), const.PROFILE['read_batch_max_size'])),
+    }))),
+    'POST /user/email_notification_setting': (2, lambda t, rng: ([], call(
+        'POST', '/user/email_notification_setting', body={'access_token': t.known_user(rng)[1]}
+    ))),
+    'PUT /user/email_notification_setting': (1, lambda t, rng: ([], call(
+        'PUT', '/user/email_notification_setting', body={
+            'access_token': t.fresh_user()[1],
+            'thesis': rng.random() < 0.5,
+            'favorite': rng.random() < 0.5,
+            'comment': rng.random() < 0.5,
+        }
+    ))),
+    'DELETE /user/withdraw': (1, lambda t, rng: withdraw(t, rng)),
+}
+
+
+def report_base(targets: Targets, rng: random.Random) -> dict:
+    return {
+        'access_token': targets.fresh_user()[1],
+        'report_reason_id': rng.choice(targets.report_reason_ids),
+        'detail': rng.choice(REPORT_REASONS),
+    }
+
+
+def dislike(targets: Targets, rng: random.Random):
+    token = targets.fresh_user()[1]
+    body = {'access_token': token, 'thesis_id': rng.choice(targets.thesis_ids)}
+    return [call('POST', '/favorite/like', body=body)], call('DELETE', '/favorite/dislike', body=body)
+
+
+def withdraw(targets: Targets, rng: random.Random):
+    # Give the user something to clean up so the chunked withdrawal has work to do.
+    token = targets.fresh_user()[1]
+    setup = [
+        call('POST', '/favorite/like', body={'access_token': token, 'thesis_id': thesis_id})
+        for thesis_id in rng.sample(targets.thesis_ids, min(3, len(targets.thesis_ids)))
+    ]
+    return setup, call('DELETE', '/user/withdraw', body={'access_token': token})
+
+
+def send(session: requests.Session, base_url: str, request: Call) -> requests.Response:
+    path = request.path.replace('{page}', '1')
+    return session.request(request.method, base_url + path, params=request.params, json=request.body, timeout=60)
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    # Nearest-rank, so every figure is a latency that was actually observed.
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def run(base_url: str, targets: Targets, scenarios: dict, concurrency: int, duration: float, warmup: float, random_seed: int):
+    names = list(scenarios)
+    weights = [scenarios[name][0] for name in names]
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+    started_at = time.perf_counter()
+    measure_from = started_at + warmup
+    stop_at = measure_from + duration
+
+    def worker(index: int):
+        rng = random.Random(random_seed + index)
+        session = requests.Session()
+        local_samples = {name: [] for name in names}
+        local_errors = {name: 0 for name in names}
+        while time.perf_counter() < stop_at:
+            name = rng.choices(names, weights=weights)[0]
+            built = scenarios[name][1](targets, rng)
+            if built is None:
+                continue
+            setup, request = built
+            for setup_request in setup:
+                send(session, base_url, setup_request)
+            begin = time.perf_counter()
+            try:
+                ok = send(session, base_url, request).status_code < 400
+            except requests.RequestException:
+                ok = False
+            end = time.perf_counter()
+            if begin < measure_from:
+                continue
+            local_samples[name].append(end - begin)
+            if not ok:
+                local_errors[name] += 1
+        with lock:
+            for name in names:
+                samples[name] += local_samples[name]
+                errors[name] += local_errors[name]
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - measure_from
+    return summarize(samples, errors, elapsed)
+
+
+def summarize(samples: dict, errors: dict, elapsed: float) -> dict:
+    def figures(latencies: list, error_count: int) -> dict:
+        latencies = sorted(latencies)
+        return {
+            'requests': len(latencies),
+            'errors': error_count,
+            'throughput': len(latencies) / elapsed if elapsed > 0 else 0.0,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'max_ms': (latencies[-1] if latencies else 0.0) * 1000,
+        }
+    endpoints = {name: figures(samples[name], errors[name]) for name in samples if samples[name]}
+    total = figures([value for values in samples.values() for value in values], sum(errors.values()))
+    return {'elapsed_seconds': elapsed, 'endpoints': endpoints, 'total': total}
+
+
+def git_revision() -> dict:
+    def git(*args) -> str:
+        try:
+            return subprocess.run(
+                ['git', *args], cwd=ROOT_DIRECTORY, capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return ''
+    return {'commit': git('rev-parse', 'HEAD'), 'dirty': bool(git('status', '--porcelain', '--', 'app'))}
+
+
+def print_report(report: dict):
+    print(f'{"endpoint":<42} {"req":>7} {"err":>5} {"rps":>8} {"p50":>8} {"p95":>8} {"p99":>8} {"max":>8}')
+    rows = sorted(report['endpoints'].items()) + [('TOTAL', report['total'])]
+    for name, figures in rows:
+        print(
+            f'{name:<42} {figures["requests"]:>7} {figures["errors"]:>5} {figures["throughput"]:>8.1f} '
+            f'{figures["p50_ms"]:>8.1f} {figures["p95_ms"]:>8.1f} {figures["p99_ms"]:>8.1f} {figures["max_ms"]:>8.1f}'
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Drive every API endpoint concurrently and report latency percentiles.')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=60.0, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=10.0, help='unmeasured seconds before the run')
+    parser.add_argument('--users', type=int, default=500, help='seeded users to read as')
+    parser.add_argument('--only', action='append', help='restrict to scenarios whose name contains this text')
+    parser.add_argument('--random-seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON report path (default: bench/results/<commit>-<time>.json)')
+    args = parser.parse_args()
+    run_id = datetime.now().strftime('%Y%m%d%H%M%S')
+    targets = Targets(args.base_url, stubs.load_or_create_key(), args.users, run_id)
+    scenarios = {
+        name: scenario for name, scenario in SCENARIOS.items()
+        if not args.only or any(text in name for text in args.only)
+    }
+    result = run(args.base_url, targets, scenarios, args.concurrency, args.duration, args.warmup, args.random_seed)
+    revision = git_revision()
+    report = {
+        'meta': {
+            **revision,
+            'started_at': run_id,
+            'base_url': args.base_url,
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'random_seed': args.random_seed,
+            'scenarios': sorted(scenarios),
+        },
+        **result,
+    }
+    print_report(report)
+    output = args.output or os.path.join(
+        ROOT_DIRECTORY, 'bench', 'results', f'{revision["commit"][:12] or "unknown"}-{run_id}.json'
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'saved {output}')
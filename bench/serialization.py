@@ -0,0 +1,92 @@
+import argparse
+from datetime import datetime, timedelta
+import random
+import timeit
+from typing import List
+from .env import configure
+
+configure(require_db=False)
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.utils import create_response_field
+from app import schemas, serializers
+from app.sql import models
+from .data import japanese_text
+
+
+def make_thesis(rng: random.Random, thesis_id: int, theme_id: int, favorites: int, now: datetime) -> models.Thesis:
+    thesis = models.Thesis(
+        id=thesis_id,
+        username=f'bench-user-{rng.randrange(1000)}',
+        content=japanese_text(rng, 400, 2000),
+        works_cited='',
+        theme_id=theme_id,
+        is_suspended=False,
+        created_at=now - timedelta(seconds=rng.randrange(10 ** 6), microseconds=rng.randrange(10 ** 6)),
+    )
+    thesis.favorites = [
+        models.FavoriteThesis(
+            id=thesis_id * 1000 + i,
+            thesis_id=thesis_id,
+            username=f'bench-user-{i}',
+            created_at=now,
+        )
+        for i in range(favorites)
+    ]
+    return thesis
+
+
+def make_themes(rng: random.Random, themes: int, theses: int, favorites: int) -> list:
+    now = datetime.now()
+    result = []
+    for theme_id in range(1, themes + 1):
+        theme = models.Theme(
+            id=theme_id,
+            username=f'bench-user-{rng.randrange(1000)}',
+            title=japanese_text(rng, 20, 100),
+            description=japanese_text(rng, 200, 2000),
+            start_datetime=None if theme_id % 2 else now,
+            expire_datetime=now + timedelta(days=theme_id),
+            min_length=1,
+            max_length=2000,
+            created_at=now,
+        )
+        theme.theses = [make_thesis(rng, theme_id * 100 + i, theme_id, favorites, now) for i in range(theses)]
+        result.append(theme)
+    return result
+
+
+def legacy_dumps(model, content) -> bytes:
+    # What FastAPI did for a response_model: validate into pydantic copies,
+    # run jsonable_encoder, then encode with stdlib json.
+    field = create_response_field(name='response', type_=List[model])
+    value, errors = field.validate(content, {}, loc=('response',))
+    assert not errors, errors
+    return JSONResponse(jsonable_encoder(value)).body
+
+
+def measure(name: str, model, content, number: int):
+    legacy = legacy_dumps(model, content)
+    fast = serializers.dumps(model, content)
+    assert legacy == fast, f'{name}: output differs from the legacy encoder'
+    legacy_seconds = min(timeit.repeat(lambda: legacy_dumps(model, content), number=number, repeat=3)) / number
+    fast_seconds = min(timeit.repeat(lambda: serializers.dumps(model, content), number=number, repeat=3)) / number
+    print(
+        f'{name:<32} {len(fast) / 1024:>8.0f}KiB  legacy {legacy_seconds * 1000:>8.2f}ms'
+        f'  fast {fast_seconds * 1000:>8.2f}ms  x{legacy_seconds / fast_seconds:.1f}'
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the pydantic + json response path with the precompiled orjson one.')
+    parser.add_argument('--themes', type=int, default=100)
+    parser.add_argument('--theses-per-theme', type=int, default=10)
+    parser.add_argument('--favorites-per-thesis', type=int, default=5)
+    parser.add_argument('--number', type=int, default=5)
+    args = parser.parse_args()
+    rng = random.Random(0)
+    themes = make_themes(rng, args.themes, args.theses_per_theme, args.favorites_per_thesis)
+    theses = [thesis for theme in themes for thesis in theme.theses][:100]
+    measure(f'List[Theme] x{len(themes)}', schemas.Theme, themes, args.number)
+    measure(f'List[Thesis] x{len(theses)}', schemas.Thesis, theses, args.number)
@@ -0,0 +1,21 @@
+import argparse
+from .env import configure
+
+configure()
+
+import uvicorn
+from . import stubs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the API against local MySQL with AWS replaced by stubs.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--aws-latency-ms', type=float, default=0.0,
+                        help='sleep inside every stubbed AWS call to mimic network round trips')
+    args = parser.parse_args()
+    stubs.install(latency=args.aws_latency_ms / 1000)
+    from app.main import app
+    # A single process on purpose: uvicorn workers re-import app.main from an
+    # import string and would come up without the stubs installed.
+    uvicorn.run(app, host=args.host, port=args.port, access_log=False)
@@ -0,0 +1,122 @@
+import json
+import os
+import tempfile
+import time
+import uuid
+from botocore.exceptions import ClientError
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+import jwt
+
+KEY_FILE = os.environ.get('BENCH_KEY_FILE', os.path.join(tempfile.gettempdir(), 'wareomofu-bench-key.json'))
+KID = 'bench'
+
+
+def load_or_create_key(path: str = KEY_FILE) -> dict:
+    # The server verifies and the load driver mints, so both processes share one key file.
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    key = {
+        'private_pem': private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        ).decode(),
+    }
+    with open(path, 'w') as f:
+        json.dump(key, f)
+    return key
+
+
+def mint_token(key: dict, issuer: str, client_id: str, username: str, ttl: int = 60 * 60 * 24) -> str:
+    now = int(time.time())
+    claims = {
+        'sub': str(uuid.uuid5(uuid.NAMESPACE_URL, username)),
+        'username': username,
+        'token_use': 'access',
+        'client_id': client_id,
+        'iss': issuer,
+        'iat': now,
+        'exp': now + ttl,
+    }
+    return jwt.encode(claims, key['private_pem'], algorithm='RS256', headers={'kid': KID})
+
+
+class StaticJWKS:
+    def __init__(self, key: dict):
+        private_key = serialization.load_pem_private_key(key['private_pem'].encode(), password=None)
+        self._public_key = private_key.public_key()
+
+    def get_key(self, kid: str):
+        from app.auth import AuthError
+        if kid != KID:
+            raise AuthError()
+        return self._public_key
+
+
+class Stub:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    def _call(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+
+class StubCognito(Stub):
+    def get_user(self, AccessToken: str) -> dict:
+        self._call()
+        try:
+            claims = jwt.decode(AccessToken, options={'verify_signature': False})
+        except jwt.PyJWTError:
+            raise ClientError({'Error': {'Code': 'NotAuthorizedException'}}, 'GetUser')
+        return {'Username': claims['username'], 'UserAttributes': []}
+
+    def delete_user(self, AccessToken: str) -> dict:
+        self._call()
+        return {}
+
+    def admin_get_user(self, UserPoolId: str, Username: str) -> dict:
+        self._call()
+        return {
+            'Username': Username,
+            'UserAttributes': [{'Name': 'profile', 'Value': f'{Username}のプロフィールです'}],
+        }
+
+
+class StubSQS(Stub):
+    def get_queue_url(self, QueueName: str) -> dict:
+        self._call()
+        return {'QueueUrl': f'https://sqs.local/{QueueName}'}
+
+    def send_message_batch(self, QueueUrl: str, Entries: list) -> dict:
+        self._call()
+        return {'Successful': [{'Id': entry['Id']} for entry in Entries], 'Failed': []}
+
+
+class StubSNS(Stub):
+    def publish(self, **kwargs) -> dict:
+        self._call()
+        return {'MessageId': str(uuid.uuid4())}
+
+
+class StubDynamoDB(Stub):
+    def batch_write_item(self, RequestItems: dict) -> dict:
+        self._call()
+        return {'UnprocessedItems': {}}
+
+
+def install(latency: float = 0.0):
+    # Must run before app.main is imported so startup warm-up sees the stubs.
+    from app import auth, aws, const
+    from .env import ROOT_DIRECTORY
+    auth.jwks = StaticJWKS(load_or_create_key())
+    aws.registry.override('cognito-idp', client=StubCognito(latency))
+    aws.registry.override('sqs', client=StubSQS(latency))
+    aws.registry.override('sns', client=StubSNS(latency))
+    aws.registry.override('dynamodb', client=StubDynamoDB(latency))
+    const.SES_TEMPLATE_DIRECTORY = os.path.join(ROOT_DIRECTORY, 'app', 'ses-template')
@@ -0,0 +1,32 @@
+import os
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.dialects.mysql import BIGINT, TINYINT
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# app.const and app.sql.database read these at import time. Engines connect
+# lazily, so nothing here needs a running MySQL.
+os.environ.setdefault('COGNITO_INFO', '{"user_pool_id": "ap-northeast-1_test", "client_id": "test"}')
+os.environ.setdefault('SNS_TOPIC_ARN', 'arn:aws:sns:ap-northeast-1:000000000000:test')
+os.environ.setdefault('EMAIL_TO_USER_QUEUE', 'test')
+os.environ.setdefault('DB_INFO', '{"username":"test","password":"","host":"127.0.0.1",'
+                                 '"slave_host":"127.0.0.1","port":"3306","database":"test"}')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-northeast-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'test')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'test')
+
+# The models use MySQL integer types; sqlite stores them all as INTEGER.
+compiles(TINYINT, 'sqlite')(lambda type_, compiler, **kw: 'INTEGER')
+compiles(BIGINT, 'sqlite')(lambda type_, compiler, **kw: 'INTEGER')
+
+
+@pytest.fixture
+def SessionLocal():
+    from app.sql import models
+    # One shared in-memory database, also visible to worker threads.
+    engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+    models.Base.metadata.create_all(engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
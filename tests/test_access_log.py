@@ -0,0 +1,115 @@
+import asyncio
+import hashlib
+import json
+from types import SimpleNamespace
+from unittest import mock
+from fastapi import HTTPException, Request, Response
+import pytest
+from app import access_log, const
+
+QUERIES = SimpleNamespace(count=2, seconds=0.0123)
+
+
+def make_request(method: str, path: str, body: bytes = b'', headers: dict = None) -> Request:
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'headers': [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        'query_string': b'',
+        'client': ('192.0.2.1', 1234),
+        'server': ('test', 80),
+        'scheme': 'http',
+        'root_path': '',
+        'http_version': '1.1',
+    }
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+    return Request(scope, receive)
+
+
+def get_username(access_token, strict=False):
+    if access_token == 'valid':
+        return 'alice'
+    raise ValueError('invalid token')
+
+
+@pytest.fixture
+def shipper():
+    shipper = access_log.AccessLogShipper('test', max_queue_size=2, batch_size=25)
+    with mock.patch.object(access_log, 'shipper', shipper), \
+            mock.patch.object(access_log.utils, 'get_username', get_username):
+        yield shipper
+
+
+def record(shipper, request: Request, status: int = 200, response: Response = None, error=None) -> dict:
+    asyncio.run(access_log.record_access(request, '/test', status, 0.0, 0.5, QUERIES, response, error))
+    return access_log.build_record(shipper._queue[-1])
+
+
+def test_entries_are_queued_raw_and_built_later(shipper):
+    body = json.dumps({'access_token': 'valid', 'content': 'x'}).encode()
+    response = Response(b'{"ok":true}', media_type='application/json')
+    asyncio.run(access_log.record_access(
+        make_request('POST', '/thesis/create', body, {'User-Agent': 'ua', 'Cookie': 'secret'}),
+        '/thesis/create', 200, 0.0, 0.5, QUERIES, response
+    ))
+    entry = shipper._queue[-1]
+    assert entry['request_body'] == body
+    assert 'username' not in entry
+    built = access_log.build_record(entry)
+    assert built['username'] == hashlib.sha256(b'alice').hexdigest()
+    assert built['request_body'] == {'access_token': access_log.SECRET, 'content': 'x'}
+    assert built['request_headers'] == {'user-agent': 'ua'}
+    assert built['response_body'] == '{"ok":true}'
+    assert built['db_queries'] == 2
+
+
+def test_large_body_is_redacted_before_truncation(shipper):
+    with mock.patch.dict(const.ACCESS_LOG, max_body_bytes=64):
+        body = json.dumps({'access_token': 'valid', 'content': 'a' * 200}).encode()
+        built = record(shipper, make_request('POST', '/thesis/create', body))
+    assert built['username'] == hashlib.sha256(b'alice').hexdigest()
+    assert 'valid' not in built['request_body_text']
+    assert built['request_body_bytes'] == len(body) - len('valid') + len(access_log.SECRET)
+
+
+def test_invalid_token_keeps_the_record_anonymous(shipper):
+    body = json.dumps({'access_token': 'forged'}).encode()
+    built = record(shipper, make_request('POST', '/favorite/like', body), 401,
+                   error=HTTPException(status_code=401, detail='invalid token'))
+    assert built['username'] == 'cannot_identify'
+    assert json.loads(built['response_body']) == {'detail': 'invalid token'}
+
+
+def test_unhandled_error_is_recorded(shipper):
+    built = record(shipper, make_request('GET', '/theme/1'), 500, error=RuntimeError('boom'))
+    assert built['error'] == 'RuntimeError: boom'
+    assert built['response_body'] == ''
+
+
+def test_sampled_out_requests_are_skipped(shipper):
+    with mock.patch.dict(const.ACCESS_LOG, route_sample_rates={'/test': 0.0}):
+        asyncio.run(access_log.record_access(make_request('GET', '/test'), '/test', 200, 0.0, 0.01, QUERIES))
+        asyncio.run(access_log.record_access(make_request('GET', '/test'), '/test', 404, 0.0, 0.01, QUERIES))
+    assert shipper.stats()['skipped'] == 1
+    assert [entry['status'] for entry in shipper._queue] == [404]
+
+
+def test_full_queue_drops_the_oldest(shipper):
+    for status in (200, 201, 202):
+        shipper.put_nowait({'status': status})
+    assert [entry['status'] for entry in shipper._queue] == [201, 202]
+    assert shipper.stats()['dropped'] == 1
+
+
+def test_run_once_builds_and_writes_batches(shipper):
+    record(shipper, make_request('GET', '/theme/1'))
+    shipper._queue.append({'broken': True})
+    with mock.patch.object(shipper, '_write') as write:
+        shipper.run_once()
+    (records,), _ = write.call_args
+    assert [built['request_uri'] for built in records] == ['/theme/1']
+    assert shipper.stats()['failed'] == 1
+    assert shipper.stats()['queued'] == 0
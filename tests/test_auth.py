@@ -0,0 +1,125 @@
+import json
+import time
+from unittest import mock
+from cryptography.hazmat.primitives.asymmetric import rsa
+import jwt
+import pytest
+import requests
+from app import auth, const
+
+KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+OTHER_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def make_jwks(*kids) -> dict:
+    public = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(KEY.public_key()))
+    return {'keys': [dict(public, kid=kid, alg='RS256', use='sig') for kid in kids]}
+
+
+def make_token(kid: str = 'k1', key=KEY, **overrides) -> str:
+    claims = {
+        'iss': auth.ISSUER,
+        'exp': int(time.time()) + 3600,
+        'token_use': 'access',
+        'client_id': const.COGNITO_INFO['client_id'],
+        'username': 'alice',
+    }
+    claims.update(overrides)
+    claims = {name: value for name, value in claims.items() if value is not None}
+    return jwt.encode(claims, key, algorithm='RS256', headers={'kid': kid})
+
+
+class FakeJWKSEndpoint:
+    def __init__(self, *kids):
+        self.body = make_jwks(*kids)
+        self.fail = False
+        self.calls = 0
+
+    def get(self, url, timeout):
+        self.calls += 1
+        if self.fail:
+            raise requests.ConnectionError('unreachable')
+        response = mock.Mock()
+        response.json.return_value = self.body
+        return response
+
+
+@pytest.fixture
+def endpoint():
+    endpoint = FakeJWKSEndpoint('k1')
+    jwks = auth.JWKSCache('https://example.com/jwks.json', ttl=3600, min_refresh_interval=60)
+    with mock.patch.object(auth.requests, 'get', endpoint.get), \
+            mock.patch.object(auth, 'jwks', jwks), \
+            mock.patch.object(auth, 'usernames', auth.UsernameCache(10)):
+        yield endpoint
+
+
+def test_valid_token_is_verified_once_and_cached(endpoint):
+    token = make_token()
+    assert auth.get_username(token) == 'alice'
+    with mock.patch.object(auth, 'verify_access_token') as verify:
+        assert auth.get_username(token) == 'alice'
+    verify.assert_not_called()
+    assert endpoint.calls == 1
+
+
+@pytest.mark.parametrize('token', [
+    'not a jwt',
+    make_token(exp=int(time.time()) - 10),
+    make_token(iss='https://cognito-idp.ap-northeast-1.amazonaws.com/other'),
+    make_token(token_use='id'),
+    make_token(client_id='another-client'),
+    make_token(username=None),
+    make_token(key=OTHER_KEY),
+    jwt.encode({'username': 'alice'}, None, algorithm='none', headers={'kid': 'k1'}),
+], ids=['malformed', 'expired', 'issuer', 'token_use', 'client_id', 'username', 'signature', 'alg_none'])
+def test_rejected_tokens_raise_401_and_are_not_cached(endpoint, token):
+    with pytest.raises(auth.AuthError) as error:
+        auth.get_username(token)
+    assert error.value.status_code == 401
+    assert auth.usernames.get(auth.hash_token(token)) is None
+
+
+def test_unknown_kid_refetches_at_most_once_per_interval(endpoint):
+    token = make_token(kid='rotated')
+    for _ in range(3):
+        with pytest.raises(auth.AuthError):
+            auth.get_username(token)
+    assert endpoint.calls == 1
+
+
+def test_rotated_key_is_picked_up_after_the_interval(endpoint):
+    auth.get_username(make_token())
+    endpoint.body = make_jwks('k1', 'k2')
+    auth.jwks._fetched_at -= 60
+    assert auth.get_username(make_token(kid='k2')) == 'alice'
+    assert endpoint.calls == 2
+
+
+def test_unreachable_jwks_is_503_and_keeps_previous_keys(endpoint):
+    assert auth.get_username(make_token()) == 'alice'
+    endpoint.fail = True
+    auth.jwks._fetched_at -= 3600
+    with pytest.raises(auth.AuthUnavailableError) as error:
+        auth.get_username(make_token(kid='rotated'))
+    assert error.value.status_code == 503
+    assert auth.get_username(make_token(username='bob')) == 'bob'
+
+
+def test_forget_drops_the_cached_username(endpoint):
+    token = make_token()
+    auth.get_username(token)
+    auth.forget(token)
+    assert auth.usernames.get(auth.hash_token(token)) is None
+
+
+def test_username_cache_expires_and_evicts_least_recent():
+    usernames = auth.UsernameCache(2)
+    usernames.set('a', 'alice', time.time() + 60)
+    usernames.set('b', 'bob', time.time() - 1)
+    assert usernames.get('b') is None
+    usernames.set('c', 'carol', time.time() + 60)
+    usernames.get('a')
+    usernames.set('d', 'dave', time.time() + 60)
+    assert usernames.get('c') is None
+    assert usernames.get('a') == 'alice'
@@ -0,0 +1,118 @@
+from unittest import mock
+import pytest
+from app import cache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    clock = FakeClock()
+    with mock.patch.object(cache, 'time', clock):
+        yield clock
+
+
+def test_entries_expire_after_ttl(clock):
+    store = cache.TTLCache(maxsize=10, ttl=30)
+    store.set('key', b'value')
+    clock.now += 29
+    assert store.get('key') == b'value'
+    clock.now += 1
+    assert store.get('key') is None
+    assert store.stats()['size'] == 0
+    assert (store.hits, store.misses) == (1, 1)
+
+
+def test_per_entry_ttl(clock):
+    store = cache.TTLCache(maxsize=10, ttl=30)
+    store.set('key', b'value', ttl=5)
+    clock.now += 5
+    assert store.get('key') is None
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    store = cache.TTLCache(maxsize=2, ttl=30)
+    store.set('a', 1)
+    store.set('b', 2)
+    store.get('a')
+    store.set('c', 3)
+    assert store.get('b') is None
+    assert store.get('a') == 1
+    assert store.get('c') == 3
+    assert store.evictions == 1
+
+
+def test_invalidate_drops_every_key_with_the_tag(clock):
+    store = cache.TTLCache(maxsize=10, ttl=30)
+    store.set('theme', 1, tags=(cache.theme_tag(1),))
+    store.set('themes', 2, tags=(cache.theme_tag(1), cache.theme_tag(2)))
+    store.set('other', 3, tags=(cache.theme_tag(2),))
+    store.invalidate(cache.theme_tag(1))
+    assert store.get('theme') is None
+    assert store.get('themes') is None
+    assert store.get('other') == 3
+    assert store.invalidations == 2
+    # The removed keys no longer hang off their other tags.
+    store.invalidate(cache.theme_tag(2))
+    assert store.invalidations == 3
+
+
+def test_reads_finishing_within_the_grace_window_are_not_cached(clock):
+    store = cache.TTLCache(maxsize=10, ttl=30, invalidation_grace=2)
+    tag = cache.thesis_tag(1)
+    store.invalidate(tag)
+    clock.now += 1
+    store.set('thesis', b'stale', tags=(tag,))
+    assert store.get('thesis') is None
+    store.set('untagged', b'fresh')
+    assert store.get('untagged') == b'fresh'
+    clock.now += 1
+    store.set('thesis', b'fresh', tags=(tag,))
+    assert store.get('thesis') == b'fresh'
+
+
+def test_entries_read_before_the_token_are_skipped(clock):
+    store = cache.TTLCache(maxsize=10, ttl=30)
+    store.set('key', b'old', read_at=clock.now)
+    assert store.get('key', not_before=clock.now) == b'old'
+    assert store.get('key', not_before=clock.now + 1) is None
+    assert store.get('key') is None
+
+
+def test_clear_counts_every_entry(clock):
+    store = cache.TTLCache(maxsize=10, ttl=30)
+    store.set('a', 1, tags=('x',))
+    store.set('b', 2)
+    store.clear()
+    assert store.stats()['size'] == 0
+    assert store.invalidations == 2
+    store.set('a', 1, tags=('x',))
+    assert store.get('a') == 1
+
+
+def test_writes_invalidate_the_cached_reads(SessionLocal):
+    from app.sql import crud, models
+    with SessionLocal() as db:
+        db.add(models.Theme(id=1, title='t', description='d', min_length=1, max_length=10, is_suspended=False))
+        db.add(models.Thesis(id=1, username='alice', content='c', works_cited='', theme_id=1, is_suspended=False))
+        db.commit()
+        response_cache = cache.TTLCache(maxsize=10, ttl=30)
+        liked_cache = cache.TTLCache(maxsize=10, ttl=30)
+        with mock.patch.object(cache, 'response_cache', response_cache), \
+                mock.patch.object(cache, 'liked_cache', liked_cache):
+            response_cache.set('thesis', b'{}', tags=(cache.thesis_tag(1),))
+            response_cache.set('theme', b'{}', tags=(cache.theme_tag(1),))
+            liked_cache.set('liked', {1}, tags=(cache.liked_tag('bob'),))
+            crud.create_favorite_thesis(db, thesis_id=1, username='bob')
+            assert response_cache.get('thesis') is None
+            assert liked_cache.get('liked') is None
+            assert response_cache.get('theme') == b'{}'
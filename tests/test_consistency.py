@@ -0,0 +1,59 @@
+from unittest import mock
+from fastapi import APIRouter, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+import pytest
+from app import const, consistency
+from app.route import LoggingContextRoute
+from app.sql.database import SessionLocal
+
+engine = create_engine('sqlite://')
+router = APIRouter(route_class=LoggingContextRoute)
+
+
+@router.post('/write')
+def write(fail: bool = False):
+    # Plain def handlers run in the threadpool with a copy of the context.
+    db = SessionLocal(bind=engine)
+    try:
+        db.commit()
+    finally:
+        db.close()
+    if fail:
+        raise HTTPException(status_code=403, detail='forbidden')
+    return True
+
+
+@router.get('/read')
+async def read():
+    return True
+
+
+app = FastAPI()
+app.include_router(router)
+
+
+@pytest.fixture
+def client():
+    with mock.patch('app.access_log.shipper.put_nowait'):
+        yield TestClient(app)
+
+
+def test_write_returns_a_consistency_token(client):
+    response = client.post('/write')
+    token = response.headers[const.CONSISTENCY_TOKEN_HEADER]
+    assert consistency.decode_token(token) is not None
+    assert const.CONSISTENCY_TOKEN_HEADER not in client.get('/read').headers
+
+
+def test_failed_write_returns_no_token(client):
+    response = client.post('/write', params={'fail': True})
+    assert response.status_code == 403
+    assert const.CONSISTENCY_TOKEN_HEADER not in response.headers
+
+
+def test_commits_outside_a_request_are_not_recorded():
+    db = SessionLocal(bind=engine)
+    db.commit()
+    db.close()
+    assert consistency.current.get() is None
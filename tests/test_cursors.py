@@ -0,0 +1,105 @@
+import base64
+from datetime import datetime
+import json
+from fastapi import HTTPException
+import pytest
+from sqlalchemy.dialects import mysql
+from app import const, utils
+from app.sql import crud, models
+
+CREATED_AT = datetime(2022, 8, 1, 12, 30, 15, 123456)
+
+
+def encode_raw(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def test_cursor_round_trip():
+    payload = {'sort_type': const.ThemeSortType.START_LATER, 'datetime_null_is_earlier': True,
+               'values': [0, CREATED_AT, 42]}
+    cursor = utils.encode_cursor(payload)
+    assert '=' not in cursor
+    decoded = utils.decode_cursor(cursor)
+    assert decoded['values'] == [0, CREATED_AT, 42]
+    assert decoded['sort_type'] == const.ThemeSortType.START_LATER
+    types = crud.get_theme_sort_value_types(const.ThemeSortType(decoded['sort_type']))
+    assert utils.check_cursor_values(decoded['values'], types) == [0, CREATED_AT, 42]
+
+
+def test_cursor_round_trip_from_row():
+    theme = models.Theme(id=7, created_at=CREATED_AT, theses_count=3, start_datetime=None)
+    for sort_type in const.ThemeSortType:
+        values = crud.get_theme_sort_values(theme, sort_type)
+        if values is None:
+            continue
+        decoded = utils.decode_cursor(utils.encode_cursor({'values': values}))
+        assert utils.check_cursor_values(decoded['values'], crud.get_theme_sort_value_types(sort_type)) == values
+    thesis = models.Thesis(id=9, created_at=CREATED_AT, favorites_count=0)
+    for sort_type in list(const.ThesisSortType) + [None]:
+        values = crud.get_thesis_sort_values(thesis, sort_type)
+        if values is None:
+            continue
+        decoded = utils.decode_cursor(utils.encode_cursor({'values': values}))
+        assert utils.check_cursor_values(decoded['values'], crud.get_thesis_sort_value_types(sort_type)) == values
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64 !',
+    encode_raw([1, 2]),
+    encode_raw({'values': 'x'}),
+    encode_raw({'sort_type': 'newer'}),
+    base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+])
+def test_decode_rejects_malformed_cursor(cursor):
+    with pytest.raises(HTTPException) as error:
+        utils.decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize('values', [
+    [],
+    [CREATED_AT],
+    [CREATED_AT, 1, 2],
+    ['2022-08-01T12:30:15', 1],
+    [CREATED_AT, '1'],
+    [CREATED_AT, True],
+    [CREATED_AT, 1.5],
+    [CREATED_AT, None],
+])
+def test_check_rejects_values_that_do_not_fit_the_sort(values):
+    types = crud.get_thesis_sort_value_types(const.ThesisSortType.NEWER)
+    with pytest.raises(HTTPException) as error:
+        utils.check_cursor_values(values, types)
+    assert error.value.status_code == 400
+
+
+def test_check_accepts_null_datetime_only_where_nullable():
+    nullable = crud.get_theme_sort_value_types(const.ThemeSortType.EXPIRE_EARLIER)
+    assert utils.check_cursor_values([1, None, 5], nullable) == [1, None, 5]
+    with pytest.raises(HTTPException):
+        utils.check_cursor_values([None, 5], crud.get_theme_sort_value_types(const.ThemeSortType.NEWER))
+
+
+def test_keyset_condition_requires_one_value_per_key():
+    sort_keys = crud.get_thesis_sort_keys(const.ThesisSortType.NEWER)
+    with pytest.raises(ValueError):
+        crud.keyset_condition(sort_keys, [])
+    with pytest.raises(ValueError):
+        crud.keyset_condition(sort_keys, [CREATED_AT])
+
+
+def test_keyset_condition_continues_after_the_cursor():
+    sort_keys = crud.get_thesis_sort_keys(const.ThesisSortType.NEWER)
+    compiled = crud.keyset_condition(sort_keys, [CREATED_AT, 10]).compile(dialect=mysql.dialect())
+    assert str(compiled) == (
+        'theses.created_at < %s OR theses.created_at = %s AND theses.id < %s'
+    )
+    assert list(compiled.params.values()) == [CREATED_AT, CREATED_AT, 10]
+
+
+def test_keyset_condition_groups_nulls_by_the_flag_key():
+    sort_keys = crud.get_theme_sort_keys(const.ThemeSortType.START_EARLIER, datetime_null_is_earlier=True)
+    condition = crud.keyset_condition(sort_keys, [1, None, 3])
+    sql = str(condition.compile(dialect=mysql.dialect(), compile_kwargs={'literal_binds': True}))
+    assert 'themes.start_datetime IS NULL' in sql
+    assert 'themes.id > 3' in sql
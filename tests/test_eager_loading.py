@@ -0,0 +1,80 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import raiseload
+from app import schemas
+from app.sql import crud, models
+
+NOW = datetime(2022, 8, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def db(SessionLocal):
+    with SessionLocal() as db:
+        for theme_id in range(1, 6):
+            db.add(models.Theme(
+                id=theme_id, username='alice', title='t', description='d', min_length=1, max_length=10,
+                is_suspended=False, created_at=NOW + timedelta(minutes=theme_id)
+            ))
+            for n in range(3):
+                thesis_id = theme_id * 10 + n
+                db.add(models.Thesis(
+                    id=thesis_id, username=f'user-{n}', content='c', works_cited='', theme_id=theme_id,
+                    is_suspended=False, created_at=NOW + timedelta(minutes=thesis_id)
+                ))
+                db.add(models.FavoriteThesis(thesis_id=thesis_id, username='carol', created_at=NOW))
+        db.commit()
+        yield db
+
+
+@contextmanager
+def count_statements(db):
+    statements = []
+
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    engine = db.get_bind()
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def test_theme_load_options_cover_every_nested_field(db):
+    # raiseload makes any relationship the options miss fail instead of lazy loading.
+    query = crud.get_themes_common(
+        username=None, exclude_not_yet=False, exclude_accepting=False, exclude_expired=False,
+        free_words=None, sort_type=None, limit=100
+    ).options(*crud.THEME_LOAD_OPTIONS, raiseload('*'))
+    themes = db.execute(query).scalars().all()
+    assert [len(schemas.Theme.from_orm(theme).theses) for theme in themes] == [3] * 5
+
+
+def test_thesis_load_options_cover_every_nested_field(db):
+    query = crud.get_theses_common(
+        username=None, theme_id=None, free_words=None, sort_type=None, limit=100
+    ).options(*crud.THESIS_LOAD_OPTIONS, raiseload('*'))
+    theses = db.execute(query).scalars().all()
+    assert [len(schemas.Thesis.from_orm(thesis).favorites) for thesis in theses] == [1] * 15
+
+
+@pytest.mark.parametrize('limit', [1, 5])
+def test_theme_page_costs_one_query_per_level(db, limit):
+    with count_statements(db) as statements:
+        themes = crud.get_themes(db, limit=limit)
+        [schemas.Theme.from_orm(theme) for theme in themes]
+    assert len(statements) == 3
+
+
+@pytest.mark.parametrize('limit', [1, 15])
+def test_thesis_page_costs_one_query_per_level(db, limit):
+    with count_statements(db) as statements:
+        theses = crud.get_theses(db, limit=limit)
+        [schemas.Thesis.from_orm(thesis) for thesis in theses]
+    assert len(statements) == 2
+    with count_statements(db) as statements:
+        favorites = crud.get_user_favorites(db, username='carol', limit=limit)
+        [schemas.Thesis.from_orm(thesis) for thesis in favorites]
+    assert len(statements) == 2
@@ -0,0 +1,109 @@
+from unittest import mock
+from fastapi.testclient import TestClient
+import pytest
+from app import cache, etag, schemas
+from app.dependencies import get_async_slave_db
+from app.main import app
+from app.sql import models
+
+
+def test_make_depends_on_model_and_version():
+    tag = etag.make(schemas.Comment, 1, (2, 'x'))
+    assert tag == etag.make(schemas.Comment, 1, (2, 'x'))
+    assert tag != etag.make(schemas.Comment, 1, (3, 'x'))
+    assert tag != etag.make(schemas.Thesis, 1, (2, 'x'))
+    assert tag.startswith('"') and tag.endswith('"')
+
+
+def test_match_compares_weakly_and_strips_the_encoding():
+    tag = etag.make(schemas.Comment, 1)
+    gzipped = etag.encoded(tag, 'gzip')
+    assert etag.decoded(gzipped) == tag
+    assert etag.match(tag, tag) == tag
+    assert etag.match(f'W/{tag}', tag) == tag
+    assert etag.match(f'"other", {gzipped}', tag) == gzipped
+    assert etag.match('*', tag) == tag
+    assert etag.match('"other"', tag) is None
+    assert etag.match(None, tag) is None
+    assert etag.match(tag, None) is None
+
+
+class SyncAsyncSession:
+    # async_crud only awaits execute(), which sqlite can serve synchronously.
+    def __init__(self, db):
+        self.db = db
+        self.executed = 0
+
+    async def execute(self, statement):
+        self.executed += 1
+        return self.db.execute(statement)
+
+
+@pytest.fixture
+def client(SessionLocal):
+    with SessionLocal() as db:
+        db.add(models.Theme(id=1, title='t', description='d', min_length=1, max_length=10, is_suspended=False))
+        db.add(models.Thesis(id=1, username='alice', content='c', works_cited='', theme_id=1, is_suspended=False))
+        db.add(models.Comment(id=1, thesis_id=1, username='bob', content='x' * 2000, is_suspended=False))
+        db.commit()
+    sessions = []
+
+    async def get_session():
+        with SessionLocal() as db:
+            sessions.append(SyncAsyncSession(db))
+            yield sessions[-1]
+    app.dependency_overrides[get_async_slave_db] = get_session
+    client = TestClient(app)
+    client.sessions = sessions
+    client.SessionLocal = SessionLocal
+    with mock.patch.object(cache, 'response_cache', cache.TTLCache(maxsize=10, ttl=30)), \
+            mock.patch('app.access_log.shipper.put_nowait'):
+        yield client
+    app.dependency_overrides.clear()
+
+
+def get_comments(client, **headers):
+    client.sessions.clear()
+    response = client.get('/comments/1/1', headers=dict({'Accept-Encoding': 'identity'}, **headers))
+    return response, sum(session.executed for session in client.sessions)
+
+
+def test_cached_response_is_answered_with_304(client):
+    response, _ = get_comments(client)
+    assert response.status_code == 200
+    tag = response.headers['etag']
+    response, queries = get_comments(client, **{'If-None-Match': tag})
+    assert response.status_code == 304
+    assert response.headers['etag'] == tag
+    assert response.content == b''
+    assert queries == 0
+
+
+def test_uncached_response_is_validated_by_the_version_query(client):
+    tag = get_comments(client)[0].headers['etag']
+    cache.response_cache.clear()
+    response, queries = get_comments(client, **{'If-None-Match': tag})
+    assert response.status_code == 304
+    assert queries == 1
+
+
+def test_changed_comments_get_a_new_tag(client):
+    tag = get_comments(client)[0].headers['etag']
+    with client.SessionLocal() as db:
+        db.add(models.Comment(id=2, thesis_id=1, username='carol', content='y', is_suspended=False))
+        db.commit()
+    cache.response_cache.invalidate(cache.comments_tag(1))
+    response, _ = get_comments(client, **{'If-None-Match': tag})
+    assert response.status_code == 200
+    assert response.headers['etag'] != tag
+    assert [comment['id'] for comment in response.json()] == [1, 2]
+
+
+def test_compressed_tag_round_trips(client):
+    response, _ = get_comments(client, **{'Accept-Encoding': 'gzip'})
+    assert response.headers['content-encoding'] == 'gzip'
+    tag = response.headers['etag']
+    assert tag.endswith('-gzip"')
+    response, _ = get_comments(client, **{'Accept-Encoding': 'gzip', 'If-None-Match': tag})
+    assert response.status_code == 304
+    assert response.headers['etag'] == tag
@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta
+from unittest import mock
+import pytest
+from sqlalchemy import select
+from app import notification
+from app.sql import crud, models
+
+
+class FakeSQS:
+    def __init__(self):
+        self.batches = []
+        self.failing_ids = set()
+        self.error = None
+
+    def get_queue_url(self, QueueName):
+        return {'QueueUrl': f'https://sqs.example.com/{QueueName}'}
+
+    def send_message_batch(self, QueueUrl, Entries):
+        if self.error is not None:
+            raise self.error
+        self.batches.append([entry['Id'] for entry in Entries])
+        return {'Failed': [{'Id': entry['Id'], 'Message': 'throttled'}
+                           for entry in Entries if entry['Id'] in self.failing_ids]}
+
+
+@pytest.fixture
+def sqs(SessionLocal):
+    sqs = FakeSQS()
+    with mock.patch.object(notification, 'SessionLocal', SessionLocal), \
+            mock.patch.object(notification.aws, 'client', lambda name: sqs):
+        yield sqs
+
+
+def make_dispatcher(**kwargs) -> notification.OutboxDispatcher:
+    return notification.OutboxDispatcher('test', **dict({'batch_size': 2, 'max_attempts': 3}, **kwargs))
+
+
+def add_emails(SessionLocal, count: int, **values) -> list:
+    with SessionLocal() as db:
+        emails = [
+            models.EmailOutbox(username='alice', subject='s', message='m',
+                               **dict({'next_attempt_at': datetime.now() - timedelta(seconds=1)}, **values))
+            for _ in range(count)
+        ]
+        db.add_all(emails)
+        db.commit()
+        return [email.id for email in emails]
+
+
+def get_emails(SessionLocal) -> list:
+    with SessionLocal() as db:
+        return db.execute(select(models.EmailOutbox).order_by(models.EmailOutbox.id)).scalars().all()
+
+
+def make_due(SessionLocal):
+    with SessionLocal() as db:
+        for email in db.execute(select(models.EmailOutbox)).scalars():
+            email.next_attempt_at = datetime.now() - timedelta(seconds=1)
+        db.commit()
+
+
+def test_due_emails_are_sent_in_batches(SessionLocal, sqs):
+    ids = add_emails(SessionLocal, 3)
+    dispatcher = make_dispatcher()
+    dispatcher.run_once()
+    assert sqs.batches == [[str(ids[0]), str(ids[1])], [str(ids[2])]]
+    assert all(email.sent_at is not None for email in get_emails(SessionLocal))
+    assert dispatcher.stats() == {'sent': 3, 'failed': 0}
+    dispatcher.run_once()
+    assert len(sqs.batches) == 2
+
+
+def test_failed_entries_back_off_and_are_retried(SessionLocal, sqs):
+    ids = add_emails(SessionLocal, 2)
+    sqs.failing_ids = {str(ids[1])}
+    dispatcher = make_dispatcher(retry_base_seconds=30)
+    dispatcher.run_once()
+    sent, failed = get_emails(SessionLocal)
+    assert sent.sent_at is not None
+    assert failed.sent_at is None and failed.attempts == 1
+    assert failed.next_attempt_at >= datetime.now() + timedelta(seconds=59)
+    # Not due yet.
+    dispatcher.run_once()
+    assert len(sqs.batches) == 1
+    sqs.failing_ids = set()
+    make_due(SessionLocal)
+    dispatcher.run_once()
+    assert sqs.batches[-1] == [str(ids[1])]
+    assert get_emails(SessionLocal)[1].sent_at is not None
+
+
+def test_unreachable_queue_retries_the_whole_batch(SessionLocal, sqs):
+    add_emails(SessionLocal, 2)
+    sqs.error = ConnectionError('unreachable')
+    dispatcher = make_dispatcher()
+    dispatcher.run_once()
+    assert [email.attempts for email in get_emails(SessionLocal)] == [1, 1]
+    assert dispatcher.stats() == {'sent': 0, 'failed': 2}
+
+
+def test_emails_stop_after_max_attempts(SessionLocal, sqs):
+    add_emails(SessionLocal, 1, attempts=3)
+    make_dispatcher(max_attempts=3).run_once()
+    assert sqs.batches == []
+
+
+def test_claimed_rows_are_skipped_by_other_dispatchers(SessionLocal, sqs):
+    add_emails(SessionLocal, 2)
+    with SessionLocal() as db:
+        claimed = make_dispatcher()._claim(db, datetime.now())
+        assert len(claimed) == 2
+        assert make_dispatcher()._claim(db, datetime.now()) == []
+    # A dispatcher that died mid-batch loses its claim once the lease runs out.
+    make_due(SessionLocal)
+    make_dispatcher().run_once()
+    assert len(sqs.batches[0]) == 2
+
+
+def test_outbox_row_commits_with_the_row_it_announces(SessionLocal):
+    with SessionLocal() as db:
+        db.add(models.Theme(id=1, title='t', description='d', min_length=1, max_length=10, is_suspended=False))
+        db.add(models.Thesis(id=1, username='alice', content='c', works_cited='', theme_id=1, is_suspended=False))
+        db.commit()
+        crud.create_favorite_thesis(
+            db, thesis_id=1, username='bob',
+            notification=lambda favorite: {'username': 'alice', 'subject': 's', 'message': str(favorite.id)}
+        )
+    emails = get_emails(SessionLocal)
+    assert [(email.username, email.sent_at) for email in emails] == [('alice', None)]
@@ -0,0 +1,26 @@
+from app import querylog
+
+
+def test_fingerprint_folds_in_lists_but_keeps_their_length():
+    two, normalized = querylog.fingerprint(
+        'SELECT * FROM theses WHERE id IN (%s, %s)', querylog.get_parameter_shape((1, 2), False)
+    )
+    three, _ = querylog.fingerprint(
+        'SELECT * FROM theses WHERE id IN (%s, %s, %s)', querylog.get_parameter_shape((1, 2, 3), False)
+    )
+    assert normalized == 'SELECT * FROM theses WHERE id IN (?...)'
+    assert two != three
+
+
+def test_fingerprint_tells_parameter_types_apart():
+    statement = 'SELECT * FROM theses WHERE username = %(username)s'
+    by_name, _ = querylog.fingerprint(statement, querylog.get_parameter_shape({'username': 'alice'}, False))
+    by_null, _ = querylog.fingerprint(statement, querylog.get_parameter_shape({'username': None}, False))
+    again, _ = querylog.fingerprint(statement, querylog.get_parameter_shape({'username': 'bob'}, False))
+    assert by_name != by_null
+    assert by_name == again
+
+
+def test_parameter_shape_of_executemany():
+    assert querylog.get_parameter_shape([(1, 'a'), (2, 'b')], True) == ('many', 'int', 'str')
+    assert querylog.get_parameter_shape([], True) == ('many',)
@@ -0,0 +1,49 @@
+import time
+from types import SimpleNamespace
+from app import consistency, const
+from app.sql.replicas import ReplicaRouter
+
+
+def make_replica(name: str, healthy: bool = True, applied_until: float = None) -> SimpleNamespace:
+    # Replica.load only reads these, so the router needs no engines.
+    return SimpleNamespace(
+        name=name, healthy=healthy, applied_until=applied_until, outstanding=0, sessions=0, weight=1
+    )
+
+
+def make_router(*replicas) -> ReplicaRouter:
+    return ReplicaRouter(make_replica('primary'), list(replicas))
+
+
+def test_reads_go_to_the_least_loaded_replica():
+    first, second = make_replica('r1'), make_replica('r2')
+    router = make_router(first, second)
+    first.outstanding = 3
+    assert router.acquire() is second
+    assert router.fallbacks == 0
+
+
+def test_fallback_to_primary_is_counted_with_and_without_a_token():
+    router = make_router(make_replica('r1', healthy=False))
+    assert router.acquire() is router.primary
+    assert router.acquire(not_before=time.time()) is router.primary
+    assert router.fallbacks == 2
+    assert router.consistency_fallbacks == 0
+
+
+def test_replica_behind_the_token_sends_the_read_to_primary():
+    now = time.time()
+    replica = make_replica('r1', applied_until=now - 5)
+    router = make_router(replica)
+    assert router.acquire(not_before=now) is router.primary
+    assert router.acquire(not_before=now - 10) is replica
+    assert router.consistency_fallbacks == 1
+    assert router.fallbacks == 0
+
+
+def test_decode_token_pads_for_clock_skew_and_clamps_the_future():
+    margin = const.DB_REPLICAS['clock_skew_margin']
+    assert consistency.decode_token(consistency.encode_token(1000.0)) == 1000.0 + margin
+    assert consistency.decode_token(f'{time.time() + 3600:.3f}') <= time.time() + margin
+    assert consistency.decode_token('nan') is None
+    assert consistency.decode_token('x') is None
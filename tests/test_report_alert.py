@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+import json
+from types import SimpleNamespace
+from unittest import mock
+import pytest
+from app import const, report_alert
+
+NOW = datetime(2022, 8, 1, 12, 0, 0)
+
+
+class FakeSNS:
+    def __init__(self):
+        self.messages = []
+        self.fail = False
+
+    def publish(self, TopicArn, Message, Subject):
+        if self.fail:
+            raise ConnectionError('unreachable')
+        subject, digest = Message.split('\n', 1)
+        assert subject == Subject
+        self.messages.append((Subject, json.loads(digest)))
+
+
+@pytest.fixture
+def sns():
+    sns = FakeSNS()
+    with mock.patch.object(report_alert.aws, 'client', lambda name: sns):
+        yield sns
+
+
+def make_report(report_id: int, minutes: int = 0) -> SimpleNamespace:
+    return SimpleNamespace(id=report_id, created_at=NOW + timedelta(minutes=minutes))
+
+
+def test_reports_on_one_target_are_coalesced_into_one_digest(sns):
+    aggregator = report_alert.ReportAlertAggregator('arn:test')
+    aggregator.put(const.ContentType.THESIS, 7, make_report(1))
+    aggregator.put(const.ContentType.THESIS, 7, make_report(2, minutes=5))
+    aggregator.put(const.ContentType.THESIS, 8, make_report(3))
+    aggregator.put(const.ContentType.USER, 'mallory', make_report(4))
+    aggregator.run_once()
+    assert len(sns.messages) == 3
+    subject, digest = sns.messages[0]
+    assert subject == '小論文に対する通報連絡（2件）'
+    assert digest == {
+        'thesis_id': 7,
+        'count': 2,
+        'report_ids': [1, 2],
+        'first_created_at': str(NOW),
+        'last_created_at': str(NOW + timedelta(minutes=5)),
+    }
+    assert sns.messages[2][1]['target_username'] == 'mallory'
+    assert aggregator.stats() == {'pending_groups': 0, 'received': 4, 'published': 3, 'failed': 0}
+    aggregator.run_once()
+    assert len(sns.messages) == 3
+
+
+def test_digest_caps_report_ids_but_counts_every_report(sns):
+    aggregator = report_alert.ReportAlertAggregator('arn:test', max_report_ids=3)
+    for report_id in range(10):
+        aggregator.put(const.ContentType.COMMENT, 1, make_report(report_id))
+    aggregator.run_once()
+    _, digest = sns.messages[0]
+    assert digest['count'] == 10
+    assert digest['report_ids'] == [0, 1, 2]
+
+
+def test_failed_digest_is_merged_with_later_reports(sns):
+    aggregator = report_alert.ReportAlertAggregator('arn:test')
+    aggregator.put(const.ContentType.THEME, 1, make_report(1))
+    sns.fail = True
+    aggregator.run_once()
+    assert aggregator.stats()['pending_groups'] == 1
+    aggregator.put(const.ContentType.THEME, 1, make_report(2, minutes=1))
+    sns.fail = False
+    aggregator.run_once()
+    _, digest = sns.messages[0]
+    assert digest['count'] == 2
+    assert digest['report_ids'] == [1, 2]
+    assert digest['first_created_at'] == str(NOW)
+    assert aggregator.stats()['failed'] == 1
+
+
+def test_reports_arriving_while_publishing_follow_the_failed_ones(sns):
+    aggregator = report_alert.ReportAlertAggregator('arn:test')
+    aggregator.put(const.ContentType.THEME, 1, make_report(1))
+
+    def publish(TopicArn, Message, Subject):
+        aggregator.put(const.ContentType.THEME, 1, make_report(2, minutes=1))
+        raise ConnectionError('unreachable')
+    with mock.patch.object(sns, 'publish', publish):
+        aggregator.run_once()
+    aggregator.run_once()
+    _, digest = sns.messages[0]
+    assert digest['report_ids'] == [1, 2]
+    assert digest['last_created_at'] == str(NOW + timedelta(minutes=1))
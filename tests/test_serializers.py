@@ -0,0 +1,91 @@
+from datetime import datetime
+from types import SimpleNamespace
+from fastapi.encoders import jsonable_encoder
+import orjson
+import pytest
+from app import schemas, serializers
+from app.sql import models
+
+NOW = datetime(2022, 8, 1, 12, 30, 15, 123456)
+
+
+def make_thesis(thesis_id: int, username='alice', favorites: int = 2, is_suspended: bool = False) -> models.Thesis:
+    thesis = models.Thesis(
+        id=thesis_id,
+        username=username,
+        content='本文',
+        works_cited='',
+        theme_id=1,
+        is_suspended=is_suspended,
+        created_at=NOW,
+    )
+    thesis.favorites = [
+        models.FavoriteThesis(id=thesis_id * 10 + i, thesis_id=thesis_id, username=f'user-{i}', created_at=NOW)
+        for i in range(favorites)
+    ]
+    return thesis
+
+
+def make_theme(theme_id: int, username='alice', start_datetime=None) -> models.Theme:
+    theme = models.Theme(
+        id=theme_id,
+        username=username,
+        title='題',
+        description='説明\n"引用"',
+        start_datetime=start_datetime,
+        expire_datetime=datetime(2022, 9, 1),
+        min_length=1,
+        max_length=2000,
+        is_suspended=False,
+        created_at=NOW,
+    )
+    theme.theses = [make_thesis(theme_id * 100), make_thesis(theme_id * 100 + 1, username=None, is_suspended=True)]
+    return theme
+
+
+def make_summary(theme_id: int, top_thesis_ids: list) -> SimpleNamespace:
+    # What crud.to_theme_summaries builds from the summary columns.
+    return SimpleNamespace(
+        id=theme_id,
+        username=None,
+        title='題',
+        start_datetime=NOW,
+        expire_datetime=None,
+        min_length=1,
+        max_length=2000,
+        theses_count=len(top_thesis_ids),
+        top_thesis_ids=top_thesis_ids,
+        created_at=NOW,
+    )
+
+
+CASES = [
+    (schemas.Theme, [make_theme(1), make_theme(2, username=None, start_datetime=NOW)]),
+    (schemas.ThemeSummary, [make_summary(1, [3, 2]), make_summary(2, [])]),
+    (schemas.Thesis, [make_thesis(1), make_thesis(2, username=None, favorites=0)]),
+    (schemas.Comment, [
+        models.Comment(id=1, thesis_id=1, username='alice', content='コメント', is_suspended=False, created_at=NOW),
+        models.Comment(id=2, thesis_id=1, username=None, content='', is_suspended=False, created_at=NOW),
+    ]),
+    (schemas.ReportReason, [models.ReportReason(id=1, reason='スパム')]),
+]
+
+
+@pytest.mark.parametrize('model, rows', CASES, ids=[model.__name__ for model, _ in CASES])
+def test_dumps_matches_response_model(model, rows):
+    expected = [jsonable_encoder(model.from_orm(row)) for row in rows]
+    rendered = orjson.loads(serializers.dumps(model, rows))
+    assert rendered == expected
+    # Field order is part of the bytes cached and compared by ETag.
+    assert [list(item) for item in rendered] == [list(item) for item in expected]
+
+
+@pytest.mark.parametrize('model, rows', CASES, ids=[model.__name__ for model, _ in CASES])
+def test_dumps_single_row(model, rows):
+    assert orjson.loads(serializers.dumps(model, rows[0])) == jsonable_encoder(model.from_orm(rows[0]))
+
+
+def test_render_sets_json_media_type():
+    response = serializers.render(schemas.ReportReason, [models.ReportReason(id=1, reason='スパム')])
+    assert response.media_type == 'application/json'
+    assert orjson.loads(response.body) == [{'id': 1, 'reason': 'スパム'}]